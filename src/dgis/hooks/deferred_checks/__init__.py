@@ -0,0 +1 @@
+from .entry_point import entry_point
@@ -0,0 +1,176 @@
+"""
+This is entry point for checks deferred by the pre receive hook once its time budget is spent.
+Run it after pushes (e.g. from a post-receive hook or periodically) or `dgis-deferred-checks --help` to get more info.
+"""
+
+import argparse
+import logging
+
+from pathlib import Path
+from typing import List, Optional
+
+from dgis.hooks.plugins.discover import PluginEntry, discover_plugins, load_plugins
+from dgis.hooks.plugins.executor import ExecutionPolicy, default_jobs, execute_plugins, order_plugins
+from dgis.hooks.plugins.file_tasks import FileTaskPool, default_processes
+from dgis.hooks.plugins.plugin import PluginContext, file_dispatch_index
+from dgis.hooks.utility.cache import open_result_cache, set_cache_dir
+from dgis.hooks.utility.common import ExitStatus, get_version, timed_block
+from dgis.hooks.utility.deferred import DeferredQueue, default_deferred_queue_path, group_deferred_checks
+from dgis.hooks.utility.git import ChangeSet, RenamePolicy, open_object_reader
+from dgis.hooks.utility.log import init_log, log_error, log_info, log_warning, log_level_from_string
+from dgis.hooks.utility.result_cache import ResultCache
+
+from git import BadName, GitCommandError, InvalidGitRepositoryError, NoSuchPathError, Repo
+
+
+def run_deferred_checks(
+    queue: DeferredQueue,
+    plugin_entries: List[PluginEntry],
+    log: Optional[logging.Logger] = None,
+    limit: Optional[int] = None,
+    jobs: Optional[int] = None,
+    renames: RenamePolicy = RenamePolicy(),
+    file_tasks: Optional[FileTaskPool] = None,
+    results: Optional[ResultCache] = None,
+) -> bool:
+    """
+    Claims up to `limit` deferred checks and runs them, every plugin runs to completion.
+    Checks of repositories and commits which no longer exist are dropped.
+    :return: True if any deferred check failed.
+    """
+    failed = False
+    checks = queue.claim(limit)
+    log_info(f"Claimed {len(checks)} deferred check(s)")
+    for (repo_path, _, _, _), group in group_deferred_checks(checks).items():
+        ref = group[0].ref
+        names = {check.plugin for check in group}
+        entries = [entry for entry in plugin_entries if entry.class_name in names]
+        for name in names - {entry.class_name for entry in entries}:
+            log_warning(f"Dropping deferred check of '{ref.ref}' by unknown plugin '{name}'")
+        try:
+            git_repo = Repo(repo_path)
+            git_repo.commit(ref.new_rev)
+        except (InvalidGitRepositoryError, NoSuchPathError, BadName, ValueError, GitCommandError):
+            log_warning(f"Dropping deferred checks of '{ref.ref}', '{ref.new_rev}' is not found in '{repo_path}'")
+            queue.complete(group)
+            continue
+
+        log_info(f"Deferred checks of {ref} in '{repo_path}'")
+        with open_object_reader(git_repo) as objects:
+            change_set = ChangeSet(git_repo, ref, group[0].push_commits, renames)
+            plugins = order_plugins(load_plugins(entries, change_set.files))
+            context = PluginContext(
+                ref,
+                repo_path,
+                git_repo,
+                log,
+                change_set,
+                objects,
+                file_tasks,
+                file_dispatch_index(plugins),
+                results=results,
+            )
+            for plugin, result in zip(plugins, execute_plugins(plugins, context, jobs, ExecutionPolicy.CollectAll)):
+                if result.status.failed:
+                    failed = True
+                    log_error(f"Deferred check '{plugin.__name__}' failed for '{ref.ref}' ({ref.new_rev})")
+        queue.complete(group)
+    return failed
+
+
+def _main() -> ExitStatus:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--queue",
+        type=str,
+        default=None,
+        help="Queue of checks deferred by dgis-pre-receive --time-budget, deferred.sqlite3 in the cache dir "
+        "by default.",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Max number of deferred checks processed by this run, all queued checks by default.",
+    )
+    parser.add_argument(
+        "--log-level",
+        "-l",
+        type=str,
+        default="info",
+        help="Logging level. One of: debug, info, warning, error (case-insensitive)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=default_jobs(),
+        help="Number of plugins executed concurrently, number of CPUs by default.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=default_processes(),
+        help="Number of processes checking files of file-level plugins, number of CPUs by default.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for data shared between runs, overrides DGIS_HOOKS_CACHE_DIR.",
+    )
+    parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        default=False,
+        help="Check every file again instead of reusing results of identical checks from the cache dir.",
+    )
+    parser.add_argument(
+        "--renames",
+        type=str,
+        default="exact",
+        help="Rename detection of checked diffs: off, exact (default) or similarity threshold like 50%%.",
+    )
+    parser.add_argument(
+        "--rename-limit",
+        type=int,
+        default=1000,
+        help="Max number of files considered by similarity rename detection (git renameLimit).",
+    )
+    args = parser.parse_args()
+    if args.cache_dir:
+        set_cache_dir(args.cache_dir)
+
+    if args.log_level:
+        log = init_log(__package__, log_level_from_string(args.log_level))
+    else:
+        log = init_log(__package__)
+
+    log_info(f"Running deferred checks version: {get_version()}")
+
+    try:
+        renames = RenamePolicy.parse(args.renames, args.rename_limit)
+    except ValueError:
+        log_error(f"Invalid rename detection policy: '{args.renames}'")
+        return ExitStatus.Error
+
+    with timed_block("Discovering plugins"):
+        plugin_entries = discover_plugins([])
+
+    with (
+        timed_block("Processing deferred checks"),
+        DeferredQueue(Path(args.queue or default_deferred_queue_path())) as queue,
+        FileTaskPool(args.processes) as file_tasks,
+        open_result_cache(not args.no_result_cache) as results,
+    ):
+        failed = run_deferred_checks(queue, plugin_entries, log, args.limit, args.jobs, renames, file_tasks, results)
+
+    return ExitStatus.Error if failed else ExitStatus.Success
+
+
+def entry_point():
+    exit(int(_main()))
+
+
+if __name__ == "__main__":
+    entry_point()
@@ -1,15 +1,208 @@
+import hashlib
+import importlib
+import json
+import os
 import sys
 
-from typing import List, Any
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from dgis.hooks.utility.cache import cache_dir, write_atomically
+from dgis.hooks.utility.dispatch import DispatchIndex, FileSubscription
+from dgis.hooks.utility.git import FileChange
+from dgis.hooks.utility.log import log_debug, log_warning
+
+if sys.version_info < (3, 10):
+    from importlib_metadata import entry_points
+else:
+    from importlib.metadata import entry_points
+
+# Bumped when the layout of the plugin index changes.
+_g_plugin_index_version = 2
+_g_plugin_index_name = "plugins.json"
+
+
+@dataclass(frozen=True)
+class PluginEntry:
+    """
+    Discovered plugin, its module is imported by `load` only.
+    """
+
+    # Entry point name, used to enable plugins.
+    name: str
+    # Entry point value like `package.module:ClassName`.
+    value: str
+    # Files of a `FileCheckPlugin`, None for plugins checking the whole change.
+    subscription: Optional[FileSubscription]
+    # Source file of the plugin module and its modification time, the index is rebuilt when it changes.
+    origin: Optional[str]
+    origin_mtime_ns: int
+    # The plugin may be deferred once the time budget of the run is spent, see `Plugin.deferrable`.
+    deferrable: bool = False
+
+    @property
+    def class_name(self) -> str:
+        return self.value.rpartition(":")[2]
+
+    def load(self) -> Type[Any]:
+        module, _, attr = self.value.partition(":")
+        return getattr(importlib.import_module(module), attr)
+
+    def is_current(self) -> bool:
+        """
+        :return: True if the plugin module is unchanged since the entry was indexed.
+        """
+        if self.origin is None:
+            return True
+        try:
+            return os.stat(self.origin).st_mtime_ns == self.origin_mtime_ns
+        except OSError:
+            return False
+
+
+def discover_plugins(enabled_plugins: List[str]) -> List[PluginEntry]:
+    """
+    Lists plugins of the `dgis.hooks.plugins` entry point group without importing them. Entry points and plugin
+    declarations are kept in an index in the cache dir, it is rebuilt (importing every plugin once) when installed
+    distributions or plugin modules change.
+    :return: enabled plugins, all of them if `enabled_plugins` is empty.
+    """
+    fingerprint = _site_fingerprint()
+    entries = _read_index(fingerprint)
+    if entries is None:
+        entries = _build_index(fingerprint)
+    return [entry for entry in entries if not enabled_plugins or entry.name in enabled_plugins]
+
+
+def select_plugins(entries: List[PluginEntry], changes: Iterable[FileChange]) -> List[PluginEntry]:
+    """
+    Selects plugins having work in the changes without importing them: file plugins with declared files among
+    changed regular files, and every plugin checking the whole change.
+    :return: entries in their order.
+    """
+    index = DispatchIndex([(entry, entry.subscription) for entry in entries if entry.subscription is not None])
+    dispatched = index.dispatch(changes)
+    selected = []
+    for entry in entries:
+        if entry.subscription is not None and entry not in dispatched:
+            log_debug(f"Skipping plugin without matching changed files: '{entry.class_name}'")
+            continue
+        selected.append(entry)
+    return selected
+
+
+def load_plugins(entries: List[PluginEntry], changes: Iterable[FileChange]) -> List[Type[Any]]:
+    """
+    Imports plugins having work in the changes, see `select_plugins`.
+    :return: plugin classes in order of entries.
+    """
+    return [entry.load() for entry in select_plugins(entries, changes)]
 
 
 def discover_and_load_plugins(enabled_plugins: List[str]) -> List[Any]:
-    if sys.version_info < (3, 10):
-        from importlib_metadata import entry_points
-    else:
-        from importlib.metadata import entry_points
-    discovered_plugins = entry_points(group=__package__)
-    filtered_plugins = (
-        filter(lambda pl: pl.name in enabled_plugins, discovered_plugins) if enabled_plugins else discovered_plugins
+    return [entry.load() for entry in discover_plugins(enabled_plugins)]
+
+
+def _site_fingerprint() -> str:
+    """
+    :return: hash of import paths and entry point metadata of distributions found there, it changes when
+    distributions are installed, removed or upgraded.
+    """
+    digest = hashlib.sha256(f"{_g_plugin_index_version}\0{sys.version}".encode())
+    for path in sys.path:
+        try:
+            entries = sorted(os.scandir(path or "."), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        digest.update(f"\0{path}".encode())
+        for entry in entries:
+            if not entry.name.endswith((".dist-info", ".egg-info")):
+                continue
+            try:
+                mtime_ns = os.stat(os.path.join(entry.path, "entry_points.txt")).st_mtime_ns
+            except OSError:
+                mtime_ns = 0
+            digest.update(f"\0{entry.name}\0{mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def _read_index(fingerprint: str) -> Optional[List[PluginEntry]]:
+    """
+    :return: indexed plugins, None if the index is missing, corrupt or outdated.
+    """
+    try:
+        index = json.loads((cache_dir() / _g_plugin_index_name).read_bytes())
+        if index["version"] != _g_plugin_index_version or index["fingerprint"] != fingerprint:
+            return None
+        entries = [_entry_from_json(plugin) for plugin in index["plugins"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not all(entry.is_current() for entry in entries):
+        return None
+    return entries
+
+
+def _build_index(fingerprint: str) -> List[PluginEntry]:
+    from dgis.hooks.plugins.plugin import FileCheckPlugin
+
+    entries = []
+    for entry_point in entry_points(group=__package__):
+        plugin = entry_point.load()
+        module = sys.modules.get(plugin.__module__)
+        origin = getattr(module, "__file__", None)
+        entries.append(
+            PluginEntry(
+                name=entry_point.name,
+                value=entry_point.value,
+                subscription=plugin.file_subscription() if issubclass(plugin, FileCheckPlugin) else None,
+                origin=origin,
+                origin_mtime_ns=os.stat(origin).st_mtime_ns if origin else 0,
+                deferrable=plugin.deferrable(),
+            )
+        )
+    index = {
+        "version": _g_plugin_index_version,
+        "fingerprint": fingerprint,
+        "plugins": [_entry_to_json(entry) for entry in entries],
+    }
+    try:
+        write_atomically(cache_dir() / _g_plugin_index_name, json.dumps(index, indent=1).encode())
+    except OSError as error:
+        log_warning(f"Failed to write plugin index: {error}")
+    return entries
+
+
+def _entry_to_json(entry: PluginEntry) -> Dict[str, Any]:
+    subscription = None
+    if entry.subscription is not None:
+        subscription = {
+            "extensions": sorted(entry.subscription.extensions),
+            "globs": list(entry.subscription.globs),
+            "ignore_case": entry.subscription.ignore_case,
+        }
+    return {
+        "name": entry.name,
+        "value": entry.value,
+        "subscription": subscription,
+        "origin": entry.origin,
+        "origin_mtime_ns": entry.origin_mtime_ns,
+        "deferrable": entry.deferrable,
+    }
+
+
+def _entry_from_json(plugin: Dict[str, Any]) -> PluginEntry:
+    subscription = plugin["subscription"]
+    return PluginEntry(
+        name=plugin["name"],
+        value=plugin["value"],
+        subscription=(
+            FileSubscription(
+                frozenset(subscription["extensions"]), tuple(subscription["globs"]), subscription["ignore_case"]
+            )
+            if subscription is not None
+            else None
+        ),
+        origin=plugin["origin"],
+        origin_mtime_ns=plugin["origin_mtime_ns"],
+        deferrable=plugin["deferrable"],
     )
-    return list(map(lambda pl: pl.load(), filtered_plugins))
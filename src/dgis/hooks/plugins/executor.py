@@ -0,0 +1,178 @@
+import logging
+import os
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Generator, List, Optional, Tuple, Type
+
+from dgis.hooks.plugins.plugin import (
+    Plugin,
+    PluginContext,
+    PluginResult,
+    execute_plugin,
+    run_plugin,
+)
+from dgis.hooks.utility.log import ThreadLogBuffer, get_logger
+from dgis.hooks.utility.plugin_stats import PluginCost
+
+
+def default_jobs() -> int:
+    """
+    :return: default number of concurrently executed plugins, most plugins wait for subprocesses and git.
+    """
+    return os.cpu_count() or 1
+
+
+class ExecutionPolicy(Enum):
+    # The first failed plugin cancels the rest of the run: running subprocesses are killed, pending plugins skipped.
+    FailFast = "fail-fast"
+    # Every plugin runs to completion, so all failures are reported at once.
+    CollectAll = "collect-all"
+
+    def __str__(self):
+        return self.value
+
+
+@dataclass(frozen=True)
+class PluginEstimate:
+    # Work of the plugin in the change, see `Plugin.workload`.
+    files: int
+    size: int
+    # Cost model fitted to recent runs of the plugin, None if it has not run yet.
+    cost: Optional[PluginCost]
+
+
+def estimate_plugins(
+    plugins: List[Type[Plugin]], context: PluginContext, costs: Dict[str, PluginCost], workloads: bool = False
+) -> Dict[Type[Plugin], PluginEstimate]:
+    """
+    Workloads dispatch changed files and batch-check sizes of their blobs, so they are computed only for plugins whose
+    cost model depends on them, or for every plugin if `workloads` is set (e.g. for a plan).
+    :param costs: cost models of plugins by class name, see `PluginStats.costs`.
+    :return: estimated run of every plugin in the change of the context, without files and bytes if not computed.
+    """
+    estimates = {}
+    for plugin in plugins:
+        cost = costs.get(plugin.__name__)
+        files, size = 0, 0
+        if workloads or (cost is not None and (cost.per_file or cost.per_byte)):
+            files, size = plugin.workload(context)
+        estimates[plugin] = PluginEstimate(files, size, cost)
+    return estimates
+
+
+def order_plugins(
+    plugins: List[Type[Plugin]], estimates: Optional[Dict[Type[Plugin], PluginEstimate]] = None
+) -> List[Type[Plugin]]:
+    """
+    :return: plugins by descending priority. Within a priority, plugins with estimates run by descending failure rate
+    per estimated second, so cheap and frequently failing checks reject a change early, then plugins without
+    history. Plugins of equal rank keep their order.
+    """
+
+    def rank(plugin: Type[Plugin]) -> Tuple[int, int, float]:
+        estimate = estimates.get(plugin) if estimates else None
+        if estimate is None or estimate.cost is None:
+            return -plugin.priority(), 1, 0.0
+        seconds = max(estimate.cost.estimate(estimate.files, estimate.size), 1e-3)
+        return -plugin.priority(), 0, -estimate.cost.failure_rate / seconds
+
+    return sorted(plugins, key=rank)
+
+
+def format_plan(plugins: List[Type[Plugin]], estimates: Dict[Type[Plugin], PluginEstimate]) -> str:
+    """
+    :return: estimated cost breakdown of plugins in execution order, a line per plugin and the total.
+    """
+    lines = []
+    total = 0.0
+    for index, plugin in enumerate(plugins, 1):
+        estimate = estimates[plugin]
+        line = (
+            f"{index}. {plugin.__name__}: priority {plugin.priority()}, {estimate.files} file(s), {estimate.size} bytes"
+        )
+        if estimate.cost is None:
+            lines.append(f"{line}, no recorded runs")
+            continue
+        cost = estimate.cost
+        seconds = cost.estimate(estimate.files, estimate.size)
+        total += seconds
+        if cost.per_file or cost.per_byte:
+            line += f" ({cost.per_file * 1000:.1f} ms per file + {cost.per_byte * 1024 * 1024:.2f} s per MiB)"
+        lines.append(f"{line}, estimated {seconds:.2f} s, fails {cost.failure_rate:.0%} of {cost.runs} run(s)")
+    lines.append(f"Estimated total: {total:.2f} s of plugin time")
+    return "\n".join(lines)
+
+
+def execute_plugins(
+    plugins: List[Type[Plugin]],
+    context: PluginContext,
+    jobs: Optional[int] = None,
+    policy: ExecutionPolicy = ExecutionPolicy.CollectAll,
+) -> Generator[PluginResult, None, None]:
+    """
+    Executes plugins on a pool of `jobs` threads sharing the context and yields results in plugin order.
+    Log records of every plugin are held back and emitted together right before its result, and `post_execute`
+    callbacks run in plugin order once the consumer is done with the result, so output does not depend on timing.
+    With `ExecutionPolicy.FailFast` a failure of any plugin cancels `context.processes` as soon as it is known,
+    plugins stopped by it yield `PluginResultStatus.Cancelled`, and results end with the first failed one.
+    Closing the generator early waits for running plugins and skips pending ones.
+    """
+    fail_fast = policy == ExecutionPolicy.FailFast
+    jobs = min(jobs or default_jobs(), len(plugins))
+    if jobs <= 1:
+        for plugin in plugins:
+            with execute_plugin(plugin, context) as result:
+                yield result
+            if fail_fast and result.status.failed:
+                return
+        return
+
+    loggers = {logger.name: logger for logger in _plugin_loggers(context)}
+    buffer = ThreadLogBuffer()
+    for logger in loggers.values():
+        logger.addFilter(buffer)
+    executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="plugin")
+    try:
+        futures = [executor.submit(_run_captured, plugin, context, buffer) for plugin in plugins]
+        if fail_fast:
+            for future in futures:
+                future.add_done_callback(lambda done: _cancel_on_failure(context, done))
+        for plugin, future in zip(plugins, futures):
+            result, records = future.result()
+            for record in records:
+                (loggers.get(record.name) or logging.getLogger(record.name)).handle(record)
+            try:
+                yield result
+            finally:
+                plugin.post_execute(context, result)
+            if fail_fast and result.status.failed:
+                return
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for logger in loggers.values():
+            logger.removeFilter(buffer)
+
+
+def _plugin_loggers(context: PluginContext) -> List[logging.Logger]:
+    """
+    :return: loggers plugins write to, the context log and the hooks log used by utilities.
+    """
+    loggers = [get_logger()]
+    if context.log and context.log is not loggers[0]:
+        loggers.append(context.log)
+    return loggers
+
+
+def _cancel_on_failure(context: PluginContext, future: Future) -> None:
+    if not future.cancelled() and future.exception() is None and future.result()[0].status.failed:
+        context.processes.cancel()
+
+
+def _run_captured(
+    plugin: Type[Plugin], context: PluginContext, buffer: ThreadLogBuffer
+) -> Tuple[PluginResult, List[logging.LogRecord]]:
+    with buffer.capture() as records:
+        result = run_plugin(plugin, context)
+    return result, records
@@ -0,0 +1,158 @@
+import logging
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from dgis.hooks.plugins.plugin import FileCheckPlugin, PluginContext, PluginResultPayload
+from dgis.hooks.utility.git import FileChange, GitObjectReader, open_object_reader
+from dgis.hooks.utility.log import ThreadLogBuffer, get_logger
+
+# Readers of worker processes by repository path, tasks of the same repository share git processes.
+_g_worker_readers: Dict[str, GitObjectReader] = {}
+_g_worker_log_buffer = ThreadLogBuffer()
+
+
+def default_processes() -> int:
+    return os.cpu_count() or 1
+
+
+class FileTaskPool:
+    """
+    Process pool checking files of `FileCheckPlugin`s in small tasks. Tasks of all plugins go to a single queue,
+    and idle workers take the next task from it, so a plugin with many files is spread over every process.
+    The processes are started on first use with enough files, fewer files are checked in the calling thread.
+    """
+
+    # A task holds a few files only, so workers finishing early take over the rest instead of waiting for a straggler.
+    _task_files = 8
+    _task_bytes = 1024 * 1024
+
+    # Starting processes costs more than checking a few files in-process.
+    _min_files = 32
+
+    # Interval of cancellation checks while waiting for tasks.
+    _poll_interval = 0.1
+
+    def __init__(self, processes: Optional[int] = None):
+        self._processes = processes or default_processes()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Plugins are executed by threads, forking the hook process with running threads is not safe.
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(self._processes, mp_context=multiprocessing.get_context(method))
+            return self._executor
+
+    def _tasks(self, context: PluginContext, changes: List[FileChange]) -> List[List[FileChange]]:
+        sizes = context.blob_sizes
+        tasks: List[List[FileChange]] = []
+        task: List[FileChange] = []
+        task_bytes = 0
+        for change in changes:
+            task.append(change)
+            task_bytes += sizes.get(change.new_hexsha, 0)
+            if len(task) == self._task_files or task_bytes >= self._task_bytes:
+                tasks.append(task)
+                task, task_bytes = [], 0
+        if task:
+            tasks.append(task)
+        return tasks
+
+    def check_files(
+        self, plugin: Type[FileCheckPlugin], context: PluginContext, changes: List[FileChange]
+    ) -> List[PluginResultPayload]:
+        """
+        Checks files with the plugin, log records of tasks are emitted by the calling thread.
+        :return: payloads of failed files in order of changes.
+        """
+        if self._processes <= 1 or len(changes) < self._min_files:
+            return plugin.check_files(context, changes)
+
+        executor = self._ensure_executor()
+        log = context.log or get_logger()
+        futures: List[Future] = [
+            executor.submit(_check_task, plugin, context.for_files(task), task, log.getEffectiveLevel())
+            for task in self._tasks(context, changes)
+        ]
+        payloads: List[PluginResultPayload] = []
+        try:
+            for future in futures:
+                task_payloads, records = self._wait(context, future)
+                for record in records:
+                    log.handle(record)
+                payloads.extend(PluginResultPayload.from_json(payload) for payload in task_payloads)
+        finally:
+            for future in futures:
+                future.cancel()
+        return payloads
+
+    def _wait(self, context: PluginContext, future: Future) -> Tuple[List[Dict[str, Any]], List[logging.LogRecord]]:
+        """
+        :return: result of the task, raises `Cancelled` if the context processes are cancelled meanwhile.
+        """
+        while True:
+            context.processes.check()
+            try:
+                return future.result(timeout=self._poll_interval)
+            except TimeoutError:
+                continue
+
+    def close(self) -> None:
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _worker_reader(context: PluginContext) -> GitObjectReader:
+    key = str(context.repo_path)
+    reader = _g_worker_readers.get(key)
+    if reader is None:
+        reader = open_object_reader(context.repo)
+        _g_worker_readers[key] = reader
+    return reader
+
+
+def _check_task(
+    plugin: Type[FileCheckPlugin], context: PluginContext, changes: List[FileChange], log_level: int
+) -> Tuple[List[Dict[str, Any]], List[logging.LogRecord]]:
+    """
+    Runs in a worker process.
+    :return: payloads of the task as plain data (see `PluginResultPayload.to_json`) and its log records, prepared to be
+    sent to the hook process.
+    """
+    context.object_reader = _worker_reader(context)
+    loggers = {get_logger()}
+    if context.log:
+        loggers.add(context.log)
+    for logger in loggers:
+        logger.setLevel(log_level)
+        if _g_worker_log_buffer not in logger.filters:
+            logger.addFilter(_g_worker_log_buffer)
+    # Subprocesses of the task are limited as in the hook process, the plugin time limit is watched by the hook process.
+    with (
+        _g_worker_log_buffer.capture() as records,
+        context.processes.limited(plugin.__name__, None, plugin.process_limits()),
+    ):
+        payloads = plugin.check_files(context, changes)
+    for record in records:
+        # Arguments and tracebacks may not be picklable, only the rendered text is sent.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+    return [payload.to_json() for payload in payloads], records
@@ -2,43 +2,93 @@ import tempfile
 import sys
 
 from pathlib import Path
-from subprocess import PIPE, Popen
-from typing import Optional
-from subprocess import CalledProcessError, run
+from typing import Any, Dict, List, Optional
 from colorama import Fore, Style
 
-from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultPayload, PluginResultStatus
+from dgis.hooks.plugins.plugin import (
+    FileCheckPlugin,
+    FileNeeds,
+    PluginContext,
+    PluginResult,
+    PluginResultPayload,
+    PluginResultStatus,
+)
+from dgis.hooks.utility.blob import ScreenedBlob
+from dgis.hooks.utility.config import ConfigFile, ConfigResolver, write_config
 from dgis.hooks.utility.env import setup_env
-from dgis.hooks.utility.git import parse_diff_ranges, blob_from_hexsha
+from dgis.hooks.utility.format import tool_version
+from dgis.hooks.utility.git import FileChange, blob_from_hexsha
 
 
-class BlackFormatCheckPlugin(Plugin):
-    _python_extension = ".py"
+class BlackFormatCheckPlugin(FileCheckPlugin):
+    _file_extensions = frozenset({".py"})
+    # Content is written for black by the check itself, only changed lines are needed.
+    _file_needs = FileNeeds.Hunks
+    # Formatting does not block the push within the time budget, it may be checked after the push.
+    _deferrable = True
+    # A pathological file must not hold the push open or pin a core.
+    _subprocess_timeout = 120.0
+    _subprocess_cpu_time = 120
+    _subprocess_memory = 4 * 1024 * 1024 * 1024
+
+    _config_file_name = "pyproject.toml"
+    # Formatting generated sources of this size is pointless, larger files are skipped.
+    _max_blob_size = 4 * 1024 * 1024
+
+    # Always invoke black via the current Python interpreter to avoid PATH issues
+    _black_command = (sys.executable, "-m", "black")
+
+    @classmethod
+    def _find_black_configs(cls, context: PluginContext, paths: List[str]) -> Dict[str, Optional[ConfigFile]]:
+        if not paths:
+            return {}
+        return ConfigResolver(context.objects, context.ref.new_rev, cls._config_file_name).resolve(paths)
 
     @classmethod
-    def _find_black_confing(cls, context: PluginContext) -> Optional[str]:
-        black_config = None
-        for obj in context.repo.tree("HEAD").traverse():
-            if obj.type == "blob" and obj.name == "pyproject.toml":
-                black_config = obj.hexsha
-                break
-        return black_config
+    def result_key(cls, context: PluginContext, change: FileChange, *parts: Any) -> Optional[str]:
+        if context.results is None:
+            return None
+        black_config = cls._find_black_configs(context, [change.path])[change.path]
+        version = tool_version(context.processes, cls._black_command)
+        config_parts = (black_config.path, black_config.hexsha) if black_config else (None, None)
+        return super().result_key(context, change, version, *config_parts, *parts)
 
     @classmethod
     def execute(cls, context: PluginContext) -> PluginResult:
-        payloads = None
+        version = tool_version(context.processes, cls._black_command)
+        if version is None:
+            if context.log:
+                context.log.warning(f"black is not installed, skipping checks")
+            return PluginResult(PluginResultStatus.Ok, None)
+        if context.log:
+            context.log.info(f"{Fore.CYAN}{version}{Style.RESET_ALL}")
 
-        # Always invoke black via the current Python interpreter to avoid PATH issues
-        script_cmd = [sys.executable, "-m", "black"]
+        # Configs of all files are resolved at once, file checks find them in the cache of the resolver.
+        black_configs = cls._find_black_configs(context, [change.path for change in context.subscribed_files(cls)])
+        if not any(black_configs.values()):
+            if context.log:
+                context.log.warning(f"No black config (pyproject.toml) file found while executing '{cls.__name__}'")
+            return PluginResult(PluginResultStatus.Ok, None)
 
-        if context.log:
-            try:
-                black_version = run(script_cmd + ["--version"], capture_output=True, text=True, check=True)
-                version = black_version.stdout.strip()
-                context.log.info(f"{Fore.CYAN}{version}{Style.RESET_ALL}")
-            except (CalledProcessError, FileNotFoundError):
-                context.log.warning(f"black is not installed, skipping checks")
-                return PluginResult(PluginResultStatus.Ok, None)
+        return super().execute(context)
+
+    @classmethod
+    def check_file(
+        cls, context: PluginContext, change: FileChange, blob: Optional[ScreenedBlob]
+    ) -> Optional[PluginResultPayload]:
+        if cls.exceeds_blob_size(context, change):
+            return None
+
+        black_config = cls._find_black_configs(context, [change.path])[change.path]
+        if not black_config:
+            if context.log:
+                context.log.debug(f"Skipping file without black config (pyproject.toml): '{change.path}'")
+            return None
+
+        if not change.changed_lines:
+            if context.log:
+                context.log.debug(f"Skipping file without added lines: '{change.path}'")
+            return None
 
         # Prepare environment for subprocess so the child process can import local packages if needed
         env = setup_env()
@@ -47,92 +97,41 @@ class BlackFormatCheckPlugin(Plugin):
             if context.log:
                 context.log.debug(f"Running in temp dir: '{tmp_dir}'")
 
-            black_config = cls._find_black_confing(context)
-            black_config_tmp_path = Path(tmp_dir) / "pyproject.toml"
-            if black_config:
-                if context.log:
-                    context.log.debug(f"Found black config (pyproject.toml) HEXSHA: '{black_config}'")
-                with open(black_config_tmp_path, "wb") as file:
-                    file.write(context.repo.git.cat_file("blob", black_config).encode())
-            else:
-                if context.log:
-                    context.log.warning(f"No black config (pyproject.toml) file found while executing '{cls.__name__}'")
-                return PluginResult(PluginResultStatus.Ok, None)
-
-            diff = context.ref.diff(context.repo)
-            for diff_content in diff:
-                if diff_content.deleted_file:
-                    continue
-
-                if diff_content.renamed_file and not diff_content.b_blob:
-                    continue
-
-                if not diff_content.b_path.endswith(cls._python_extension):
-                    if context.log:
-                        context.log.debug(f"Skipping non-py file: '{diff_content.b_path}'")
-                    continue
-
-                if not diff_content.diff:
-                    if context.log:
-                        context.log.debug(f"Skipping no-diff file: '{diff_content.b_path}'")
-                    continue
-
-                diff_str = diff_content.diff
-                if isinstance(diff_str, (bytearray, bytes)):
-                    try:
-                        diff_str = diff_content.diff.decode()
-                    except Exception:  # pylint: disable=broad-except
-                        if context.log:
-                            context.log.debug(f"Failed to decode diff: '{diff_content.diff}'")
-                        continue
-
-                diff_ranges = [f"--line-ranges={start}-{end}" for start, end in parse_diff_ranges(diff_str)]
-
-                file_path = Path(tmp_dir) / diff_content.b_path
-                if len(file_path.parents) > 0 and not file_path.parent.exists():
-                    file_path.parent.mkdir(parents=True)
-
-                with open(file_path, "wb") as file:
-                    file.write(blob_from_hexsha(context.repo, diff_content.b_blob.hexsha))
-
-                if context.log:
-                    context.log.debug(f"Executing '{cls.__name__}' for file: '{file_path}'")
-
-                # Call black in --diff mode to detect formatting changes
-                black_call = script_cmd + [
-                    "--config",
-                    str(black_config_tmp_path),
-                    "--color",
-                    "--diff",
-                    "--check",
-                    "--quiet",
-                    *diff_ranges,
-                    str(file_path),
-                ]
-                if context.log:
-                    context.log.debug(f"Calling black tool: {' '.join(map(str, black_call))}")
-
-                p = Popen(black_call, stdin=PIPE, stdout=PIPE, stderr=PIPE, cwd=str(Path(tmp_dir)), env=env)
-                out, err = p.communicate()
-                if p.returncode != 0:
-                    file_path = file_path.relative_to(Path(tmp_dir))
-                    if not payloads:
-                        payloads = [
-                            PluginResultPayload(
-                                stdout=out.decode(), stderr=err.decode(), diff=out.decode(), file=file_path
-                            )
-                        ]
-                    else:
-                        payloads.append(
-                            PluginResultPayload(
-                                stdout=out.decode(), stderr=err.decode(), diff=out.decode(), file=file_path
-                            )
-                        )
-
-        if not payloads:
-            return PluginResult(PluginResultStatus.Ok, None)
+            diff_ranges = [f"--line-ranges={start}-{end}" for start, end in change.changed_lines]
+
+            file_path = Path(tmp_dir) / change.path
+            if len(file_path.parents) > 0 and not file_path.parent.exists():
+                file_path.parent.mkdir(parents=True)
+
+            with open(file_path, "wb") as file:
+                file.write(blob_from_hexsha(context.objects, change.new_hexsha))
 
-        return PluginResult(PluginResultStatus.Failed, payloads)
+            if context.log:
+                context.log.debug(f"Using black config (pyproject.toml) '{black_config.path}' for file: '{file_path}'")
+            # The config is placed as in the repository, so black finds the same project root.
+            black_config_tmp_path = write_config(context.objects, black_config, Path(tmp_dir))
+
+            # Call black in --diff mode to detect formatting changes
+            black_call = [
+                *cls._black_command,
+                "--config",
+                str(black_config_tmp_path),
+                "--color",
+                "--diff",
+                "--check",
+                "--quiet",
+                *diff_ranges,
+                str(file_path),
+            ]
+            if context.log:
+                context.log.debug(f"Calling black tool: {' '.join(map(str, black_call))}")
+
+            p = context.processes.run(black_call, input=b"", capture_output=True, cwd=str(Path(tmp_dir)), env=env)
+            if p.returncode == 0:
+                return None
+            # The diff is the output, the payload stores it once.
+            out = p.stdout
+            return PluginResultPayload(stdout=out, stderr=p.stderr, diff=out, file=file_path.relative_to(Path(tmp_dir)))
 
     @classmethod
     def post_execute(cls, context: PluginContext, result: PluginResult):
@@ -5,6 +5,7 @@ from dgis.hooks.utility.git import RefStatus
 
 
 class BranchCheckPlugin(Plugin):
+    _priority = 100
     _allowed_symbols_regex = re.compile(r"^[-a-zA-Z\d_./#]+$")
 
     @classmethod
@@ -12,7 +13,7 @@ class BranchCheckPlugin(Plugin):
         if context.log:
             context.log.debug(f"Executing '{cls.__name__}' for ref: '{context.ref.ref}'")
 
-        if context.ref.status(context.repo) == RefStatus.Deleted:
+        if context.changes.status == RefStatus.Deleted:
             return PluginResult(PluginResultStatus.Ok, None)
 
         status = (
@@ -3,38 +3,99 @@ import sys
 
 from colorama import Fore, Style
 from pathlib import Path
-from subprocess import PIPE, Popen, run, CalledProcessError
-from typing import Optional
-
-from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultPayload, PluginResultStatus
-from dgis.hooks.utility.format import is_supported_cpp_file_extension
+from typing import Any, Dict, List, Optional
+
+from dgis.hooks.plugins.plugin import (
+    FileCheckPlugin,
+    FileNeeds,
+    PluginContext,
+    PluginResult,
+    PluginResultPayload,
+    PluginResultStatus,
+)
+from dgis.hooks.utility.blob import ScreenedBlob, is_binary
+from dgis.hooks.utility.config import ConfigFile, ConfigResolver, write_config
+from dgis.hooks.utility.format import g_supported_cpp_file_extensions, tool_version
 from dgis.hooks.utility.env import setup_env
-from dgis.hooks.utility.git import blob_from_hexsha
+from dgis.hooks.utility.git import FileChange, blob_from_hexsha
+
+
+class ClangFormatCheckPlugin(FileCheckPlugin):
+    _file_extensions = frozenset(g_supported_cpp_file_extensions)
+    # Content is written for clang-format by the check itself, only changed lines are needed.
+    _file_needs = FileNeeds.Hunks
+    # Formatting does not block the push within the time budget, it may be checked after the push.
+    _deferrable = True
+    # Limits of the wrapper script and clang-format started by it.
+    _subprocess_timeout = 120.0
+    _subprocess_cpu_time = 120
+    _subprocess_memory = 4 * 1024 * 1024 * 1024
+
+    _config_file_name = ".clang-format"
+    # Formatting generated sources of this size is pointless, larger files are skipped.
+    _max_blob_size = 4 * 1024 * 1024
 
+    _binary_path = "clang-format"
 
-class ClangFormatCheckPlugin(Plugin):
     @classmethod
-    def _find_clang_format_style_sha(cls, context: PluginContext) -> Optional[str]:
-        clang_format_style = None
-        for obj in context.repo.tree("HEAD").traverse():
-            if obj.type == "blob" and obj.name == ".clang-format":
-                clang_format_style = obj.hexsha
-                break
-        return clang_format_style
+    def _find_clang_format_styles(cls, context: PluginContext, paths: List[str]) -> Dict[str, Optional[ConfigFile]]:
+        if not paths:
+            return {}
+        return ConfigResolver(context.objects, context.ref.new_rev, cls._config_file_name).resolve(paths)
 
     @classmethod
-    def execute(cls, context: PluginContext) -> PluginResult:
-        payloads = None
+    def result_key(cls, context: PluginContext, change: FileChange, *parts: Any) -> Optional[str]:
+        if context.results is None:
+            return None
+        clang_format_style = cls._find_clang_format_styles(context, [change.path])[change.path]
+        version = tool_version(context.processes, [cls._binary_path])
+        style_parts = (clang_format_style.path, clang_format_style.hexsha) if clang_format_style else (None, None)
+        return super().result_key(context, change, version, *style_parts, *parts)
 
-        binary_path = "clang-format"
-        if context.log:
-            try:
-                clang_format_version = run([binary_path, "--version"], capture_output=True, text=True, check=True)
-                version = clang_format_version.stdout.strip()
-                context.log.info(f"{Fore.CYAN}{version}{Style.RESET_ALL}")
-            except (CalledProcessError, FileNotFoundError):
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        version = tool_version(context.processes, [cls._binary_path])
+        if version is None:
+            if context.log:
                 context.log.warning(f"clang-format tool is not installed, skipping checks")
-                return PluginResult(PluginResultStatus.Ok, None)
+            return PluginResult(PluginResultStatus.Ok, None)
+        if context.log:
+            context.log.info(f"{Fore.CYAN}{version}{Style.RESET_ALL}")
+
+        # Styles of all files are resolved at once, file checks find them in the cache of the resolver.
+        clang_format_styles = cls._find_clang_format_styles(
+            context, [change.path for change in context.subscribed_files(cls)]
+        )
+        if not any(clang_format_styles.values()):
+            if context.log:
+                context.log.warning(f"No clang-format style file found while executing '{cls.__name__}'")
+            return PluginResult(PluginResultStatus.Ok, None)
+
+        return super().execute(context)
+
+    @classmethod
+    def check_file(
+        cls, context: PluginContext, change: FileChange, blob: Optional[ScreenedBlob]
+    ) -> Optional[PluginResultPayload]:
+        if cls.exceeds_blob_size(context, change):
+            return None
+
+        if not change.changed_lines:
+            if context.log:
+                context.log.debug(f"Skipping file without added lines: '{change.path}'")
+            return None
+
+        clang_format_style = cls._find_clang_format_styles(context, [change.path])[change.path]
+        if not clang_format_style:
+            if context.log:
+                context.log.debug(f"Skipping file without .clang-format style: '{change.path}'")
+            return None
+
+        content = blob_from_hexsha(context.objects, change.new_hexsha)
+        if is_binary(content):
+            if context.log:
+                context.log.debug(f"Skipping binary file: '{change.path}'")
+            return None
 
         script_cmd = [sys.executable, "-m", "dgis.hooks.scripts.clang_format_diff"]
 
@@ -46,77 +107,34 @@ class ClangFormatCheckPlugin(Plugin):
             if context.log:
                 context.log.debug(f"Running in temp dir: '{tmp_dir}'")
 
-            clang_format_style_sha = cls._find_clang_format_style_sha(context)
-            if clang_format_style_sha:
-                if context.log:
-                    context.log.debug(f"Found .clang-format HEXSHA: '{clang_format_style_sha}'")
-                with open(Path(tmp_dir) / ".clang-format", "wb") as file:
-                    file.write(blob_from_hexsha(context.repo, clang_format_style_sha))
-            else:
-                if context.log:
-                    context.log.warning(f"No clang-format style file found while executing '{cls.__name__}'")
-                return PluginResult(PluginResultStatus.Ok, None)
-
-            diff = context.ref.diff(context.repo)
-            for diff_content in diff:
-                if diff_content.deleted_file:
-                    continue
-
-                if diff_content.renamed_file and not diff_content.b_blob:
-                    continue
-
-                file_path = Path(tmp_dir) / diff_content.b_path
-                if is_supported_cpp_file_extension(file_path.suffix):
-                    if len(file_path.parents) > 0 and not file_path.parent.exists():
-                        file_path.parent.mkdir(parents=True)
-                    with open(file_path, "wb") as file:
-                        file.write(blob_from_hexsha(context.repo, diff_content.b_blob.hexsha))
-                else:
-                    continue
-
-                if context.log:
-                    context.log.debug(f"Executing '{cls.__name__}' for file: '{file_path}'")
-
-                diff_file_path = file_path.with_suffix(".diff")
-                with open(diff_file_path, "bw") as file:
-                    if not isinstance(diff_content.diff, (bytearray, bytes)):
-                        binary_diff = diff_content.diff.encode()
-                    else:
-                        binary_diff = diff_content.diff
-                    file.write(binary_diff)
-
-                clang_format_call = script_cmd + [
-                    "-style=file",
-                    f"-filesrc={file_path.absolute()}",
-                    f"-filediff={diff_file_path.absolute()}",
-                    f"-binary={binary_path}",
-                    f"-workdir={Path(tmp_dir).absolute()}",
-                ]
-
-                if context.log:
-                    context.log.debug(f"Calling clang-format tool: {' '.join(map(str, clang_format_call))}")
-
-                p = Popen(clang_format_call, stdin=PIPE, stdout=PIPE, stderr=PIPE, env=env)
-                out, err = p.communicate()
-                if p.returncode != 0:
-                    file_path = file_path.relative_to(Path(tmp_dir))
-                    if not payloads:
-                        payloads = [
-                            PluginResultPayload(
-                                stdout=out.decode(), stderr=err.decode(), diff=out.decode(), file=file_path
-                            )
-                        ]
-                    else:
-                        payloads.append(
-                            PluginResultPayload(
-                                stdout=out.decode(), stderr=err.decode(), diff=out.decode(), file=file_path
-                            )
-                        )
-
-        if not payloads:
-            return PluginResult(PluginResultStatus.Ok, None)
+            # `-style=file` picks the nearest .clang-format, so styles are placed as in the repository.
+            write_config(context.objects, clang_format_style, Path(tmp_dir))
+            if context.log:
+                context.log.debug(f"Using .clang-format '{clang_format_style.path}' for file: '{change.path}'")
+
+            file_path = Path(tmp_dir) / change.path
+            if len(file_path.parents) > 0 and not file_path.parent.exists():
+                file_path.parent.mkdir(parents=True)
+            with open(file_path, "wb") as file:
+                file.write(content)
+
+            clang_format_call = script_cmd + [
+                "-style=file",
+                f"-filesrc={file_path.absolute()}",
+                *[f"-lines={start}:{end}" for start, end in change.changed_lines],
+                f"-binary={cls._binary_path}",
+                f"-workdir={Path(tmp_dir).absolute()}",
+            ]
 
-        return PluginResult(PluginResultStatus.Failed, payloads)
+            if context.log:
+                context.log.debug(f"Calling clang-format tool: {' '.join(map(str, clang_format_call))}")
+
+            p = context.processes.run(clang_format_call, input=b"", capture_output=True, env=env)
+            if p.returncode == 0:
+                return None
+            # The diff is the output, the payload stores it once.
+            out = p.stdout
+            return PluginResultPayload(stdout=out, stderr=p.stderr, diff=out, file=file_path.relative_to(Path(tmp_dir)))
 
     @classmethod
     def post_execute(cls, context: PluginContext, result: PluginResult):
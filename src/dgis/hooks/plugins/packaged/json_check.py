@@ -1,46 +1,42 @@
-import io
-
 import simplejson
 
 from pathlib import Path
+from typing import Optional
 
-from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultPayload, PluginResultStatus
-
-
-class JsonCheckPlugin(Plugin):
-    @classmethod
-    def execute(cls, context: PluginContext) -> PluginResult:
-        payloads = None
-
-        diff = context.ref.diff(context.repo)
-        for diff_content in diff:
-            if diff_content.deleted_file:
-                continue
+from dgis.hooks.plugins.plugin import (
+    FileCheckPlugin,
+    PluginContext,
+    PluginResult,
+    PluginResultPayload,
+    PluginResultStatus,
+)
+from dgis.hooks.utility.blob import ScreenedBlob
+from dgis.hooks.utility.git import FileChange
 
-            if diff_content.renamed_file and not diff_content.b_blob:
-                continue
 
-            file_path = Path(context.repo.working_dir) / diff_content.b_path
-            if file_path.suffix != ".json":
-                continue
+class JsonCheckPlugin(FileCheckPlugin):
+    _priority = 50
+    _file_extensions = frozenset({".json"})
+    # simplejson parses whole documents only, so larger files are skipped.
+    _max_blob_size = 32 * 1024 * 1024
 
+    @classmethod
+    def check_file(
+        cls, context: PluginContext, change: FileChange, blob: Optional[ScreenedBlob]
+    ) -> Optional[PluginResultPayload]:
+        assert blob is not None
+        file_path = Path(context.repo.working_dir) / change.path
+        if blob.content is None:
             if context.log:
-                context.log.debug(f"Executing '{cls.__name__}' for file: '{file_path}'")
-            json_content = context.repo.git.cat_file("blob", diff_content.b_blob.hexsha)
-            file = io.StringIO(json_content)
-            try:
-                simplejson.load(file)
-            except ValueError as error:
-                file_path = file_path.relative_to(context.repo_path)
-                if not payloads:
-                    payloads = [PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path)]
-                else:
-                    payloads.append(PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path))
-
-        if not payloads:
-            return PluginResult(PluginResultStatus.Ok, None)
-
-        return PluginResult(PluginResultStatus.Failed, payloads)
+                context.log.warning(f"Skipping file '{file_path}' of {blob.size} bytes, it is too large to parse")
+            return None
+
+        try:
+            simplejson.loads(blob.content)
+        except ValueError as error:
+            file_path = file_path.relative_to(context.repo_path)
+            return PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path)
+        return None
 
     @classmethod
     def post_execute(cls, context: PluginContext, result: PluginResult):
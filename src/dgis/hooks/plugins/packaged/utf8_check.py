@@ -1,46 +1,71 @@
-from pathlib import Path
-
-from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultPayload, PluginResultStatus
-
-
-class UTF8CheckPlugin(Plugin):
-    _file_extensions_to_check = [".cpp", ".h", ".c", ".hpp", ".hqt", ".json", ".xml", ".txt", ".md"]
+import codecs
 
-    @classmethod
-    def execute(cls, context: PluginContext) -> PluginResult:
-        payloads = None
-        diff = context.ref.diff(context.repo)
-        for diff_content in diff:
-            if diff_content.deleted_file:
-                continue
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Optional
 
-            if diff_content.renamed_file and not diff_content.b_blob:
-                continue
+from dgis.hooks.plugins.plugin import (
+    FileCheckPlugin,
+    PluginContext,
+    PluginResult,
+    PluginResultPayload,
+    PluginResultStatus,
+)
+from dgis.hooks.utility.blob import ScreenedBlob
+from dgis.hooks.utility.git import FileChange
 
-            file_path = Path(context.repo.working_dir) / diff_content.b_path
-            if not file_path.exists():
-                continue
 
-            if file_path.suffix.lower() not in cls._file_extensions_to_check:
-                continue
+class UTF8CheckPlugin(FileCheckPlugin):
+    _priority = 50
+    _file_extensions = frozenset({".cpp", ".h", ".c", ".hpp", ".hqt", ".json", ".xml", ".txt", ".md"})
+    _file_extensions_ignore_case = True
 
-            if context.log:
-                context.log.debug(f"Executing '{cls.__name__}' for file: '{file_path}'")
+    # Larger files are decoded incrementally while streaming.
+    _max_blob_size = 4 * 1024 * 1024
 
+    @staticmethod
+    def _decode_stream(chunks: Iterable[bytes]) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        offset = 0
+        for chunk in chunks:
+            # Offset of the first byte kept by the decoder, so errors point to the position in the whole file.
+            pending = len(decoder.getstate()[0])
             try:
-                context.repo.git.cat_file("blob", diff_content.b_blob.hexsha).encode()
+                decoder.decode(chunk)
             except UnicodeDecodeError as error:
-                file_path = file_path.relative_to(context.repo_path)
-                payload = PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path)
-                if not payloads:
-                    payloads = [payload]
-                else:
-                    payloads.append(payload)
+                position = offset - pending
+                raise UnicodeDecodeError(
+                    error.encoding,
+                    error.object,
+                    error.start,
+                    error.end,
+                    f"{error.reason} at byte {position + error.start}",
+                )
+            offset += len(chunk)
+        decoder.decode(b"", final=True)
 
-        if not payloads:
-            return PluginResult(PluginResultStatus.Ok, None)
+    @classmethod
+    def wants_file(cls, context: PluginContext, change: FileChange) -> bool:
+        return (Path(context.repo.working_dir) / change.path).exists()
 
-        return PluginResult(PluginResultStatus.Failed, payloads)
+    @classmethod
+    def check_file(
+        cls, context: PluginContext, change: FileChange, blob: Optional[ScreenedBlob]
+    ) -> Optional[PluginResultPayload]:
+        assert blob is not None
+        file_path = Path(context.repo.working_dir) / change.path
+        try:
+            if blob.content is not None:
+                blob.content.decode("utf-8")
+            else:
+                if context.log:
+                    context.log.debug(f"Decoding file of {blob.size} bytes while streaming: '{file_path}'")
+                with closing(context.objects.stream_blob(change.new_hexsha)) as chunks:
+                    cls._decode_stream(chunks)
+        except UnicodeDecodeError as error:
+            file_path = file_path.relative_to(context.repo_path)
+            return PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path)
+        return None
 
     @classmethod
     def post_execute(cls, context: PluginContext, result: PluginResult):
@@ -1,46 +1,56 @@
 import io
 
+from contextlib import closing
 from pathlib import Path
+from typing import Iterable, Optional
 from xml.etree import ElementTree
 
-from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultPayload, PluginResultStatus
+from dgis.hooks.plugins.plugin import (
+    FileCheckPlugin,
+    PluginContext,
+    PluginResult,
+    PluginResultPayload,
+    PluginResultStatus,
+)
+from dgis.hooks.utility.blob import ScreenedBlob
+from dgis.hooks.utility.git import FileChange
 
 
-class XmlCheckPlugin(Plugin):
+class XmlCheckPlugin(FileCheckPlugin):
+    _priority = 50
+    _file_extensions = frozenset({".xml"})
+    # Larger files are checked with a pull parser while streaming.
+    _max_blob_size = 16 * 1024 * 1024
+
+    @staticmethod
+    def _parse_stream(chunks: Iterable[bytes]) -> None:
+        parser: ElementTree.XMLPullParser = ElementTree.XMLPullParser(events=("end",))
+        for chunk in chunks:
+            parser.feed(chunk)
+            # Only well-formedness is checked, parsed elements are dropped to keep memory flat.
+            for event in parser.read_events():
+                if isinstance(event[-1], ElementTree.Element):
+                    event[-1].clear()
+        parser.close()
+
     @classmethod
-    def execute(cls, context: PluginContext) -> PluginResult:
-        payloads = None
-
-        diff = context.ref.diff(context.repo)
-        for diff_content in diff:
-            if diff_content.deleted_file:
-                continue
-
-            if diff_content.renamed_file and not diff_content.b_blob:
-                continue
-
-            file_path = Path(context.repo.working_dir) / diff_content.b_path
-            if file_path.suffix != ".xml":
-                continue
-
-            if context.log:
-                context.log.debug(f"Executing '{cls.__name__}' for file: '{file_path}'")
-
-            xml_content = context.repo.git.cat_file("blob", diff_content.b_blob.hexsha).encode()
-            file = io.BytesIO(xml_content)
-            try:
-                ElementTree.parse(file).getroot()
-            except ElementTree.ParseError as error:
-                file_path = file_path.relative_to(context.repo_path)
-                if not payloads:
-                    payloads = [PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path)]
-                else:
-                    payloads.append(PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path))
-
-        if not payloads:
-            return PluginResult(PluginResultStatus.Ok, None)
-
-        return PluginResult(PluginResultStatus.Failed, payloads)
+    def check_file(
+        cls, context: PluginContext, change: FileChange, blob: Optional[ScreenedBlob]
+    ) -> Optional[PluginResultPayload]:
+        assert blob is not None
+        file_path = Path(context.repo.working_dir) / change.path
+        try:
+            if blob.content is not None:
+                ElementTree.parse(io.BytesIO(blob.content)).getroot()
+            else:
+                if context.log:
+                    context.log.debug(f"Parsing file of {blob.size} bytes while streaming: '{file_path}'")
+                with closing(context.objects.stream_blob(change.new_hexsha)) as chunks:
+                    cls._parse_stream(chunks)
+        except ElementTree.ParseError as error:
+            file_path = file_path.relative_to(context.repo_path)
+            return PluginResultPayload(stdout=error, stderr=None, diff=None, file=file_path)
+        return None
 
     @classmethod
     def post_execute(cls, context: PluginContext, result: PluginResult):
@@ -1,31 +1,172 @@
+import os
+import threading
+import time
+
 from contextlib import contextmanager
-from dataclasses import dataclass
-from enum import Enum
+from dataclasses import dataclass, field, replace
+from enum import Enum, Flag, auto
+from itertools import islice, repeat
 from logging import Logger
 from pathlib import Path
-from typing import Optional, Any, Type, List
+from typing import TYPE_CHECKING, Optional, Any, Type, List, Dict, FrozenSet, Iterable, Iterator, Tuple
 
-from colorama import Fore, Style
 from git import Repo
 
-from dgis.hooks.utility.git import GitRef
+from dgis.hooks.utility.blob import ScreenedBlob, max_blob_size, screen_blobs
+from dgis.hooks.utility.dispatch import DispatchIndex, FileSubscription
+from dgis.hooks.utility.git import ChangeSet, FileChange, GitObjectReader, GitRef, open_object_reader
+from dgis.hooks.utility.process import (
+    Cancelled,
+    DeadlineReached,
+    ProcessGroup,
+    ProcessLimits,
+    TimedOut,
+    g_plugin_timeout_env,
+    g_subprocess_cpu_time_env,
+    g_subprocess_memory_env,
+    g_subprocess_timeout_env,
+    plugin_limit,
+)
+from dgis.hooks.utility.log import log_debug, log_warning
+from dgis.hooks.utility.plugin_stats import PluginStats
+from dgis.hooks.utility.result_cache import ResultCache
+
+if TYPE_CHECKING:
+    from dgis.hooks.plugins.file_tasks import FileTaskPool
+
+# Size cap in bytes of every output of a result payload, longer outputs are truncated with a marker.
+g_max_output_size_env = "DGIS_HOOKS_MAX_OUTPUT_SIZE"
+
+_g_default_max_output_size = 64 * 1024
 
 
 class PluginResultStatus(Enum):
     Ok = 0
     Failed = 1
+    # Stopped before finishing because the run was cancelled, e.g. by another failed plugin in fail-fast mode.
+    Cancelled = 2
+    # Exceeded its time limit, or a subprocess exceeded its time limits and was killed.
+    TimedOut = 3
+    # Not finished within the time budget of the run, queued to be checked later.
+    Deferred = 4
+
+    @property
+    def failed(self) -> bool:
+        """
+        :return: True if the status blocks the change, a check which did not finish in time does not pass it.
+        """
+        return self in (PluginResultStatus.Failed, PluginResultStatus.TimedOut)
 
     def colored(self):
-        color = Fore.GREEN if self is PluginResultStatus.Ok else Fore.RED
+        # Imported on use, so loading plugins does not pull in terminal handling.
+        from colorama import Fore, Style
+
+        color = {
+            PluginResultStatus.Ok: Fore.GREEN,
+            PluginResultStatus.Cancelled: Fore.YELLOW,
+            PluginResultStatus.Deferred: Fore.YELLOW,
+        }.get(self, Fore.RED)
         return f"{color}{self.name}{Style.RESET_ALL}"
 
 
-@dataclass
+def max_output_size() -> Optional[int]:
+    """
+    :return: size cap in bytes of every output of a result payload, None if outputs are not limited.
+    """
+    value = os.getenv(g_max_output_size_env)
+    if value:
+        try:
+            size = int(value)
+            return size if size > 0 else None
+        except ValueError:
+            log_warning(f"Ignoring invalid output size cap {g_max_output_size_env}='{value}'")
+    return _g_default_max_output_size
+
+
+def _capped_output(output: Any, max_size: Optional[int]) -> Any:
+    """
+    :return: text output as capped UTF-8 bytes, other values (e.g. exceptions of checks) as is.
+    """
+    if not isinstance(output, (str, bytes)):
+        return output
+    data = output.encode() if isinstance(output, str) else output
+    if max_size is not None and len(data) > max_size:
+        data = data[:max_size] + f"\n[... {len(data) - max_size} more bytes truncated]".encode()
+    return data
+
+
+def _decoded_output(data: Any) -> Any:
+    return data.decode(errors="replace") if isinstance(data, bytes) else data
+
+
+def _text_output(data: Any) -> Optional[str]:
+    return str(_decoded_output(data)) if data is not None else None
+
+
+@dataclass(slots=True, init=False)
 class PluginResultPayload:
-    stdout: Any
-    stderr: Any
-    diff: Any
-    file: Any
+    """
+    Failure of a check, of a single file if `file` is set. Text outputs are kept as UTF-8 bytes capped at
+    `max_output_size` and decoded on access, so pushes with many failed files hold raw tool output only, and an output
+    passed as several fields (e.g. formatter stdout used as diff) is stored once, in memory and in `to_json` data.
+    """
+
+    _stdout: Any
+    _stderr: Any
+    _diff: Any
+    file: Optional[Path]
+
+    def __init__(self, stdout: Any = None, stderr: Any = None, diff: Any = None, file: Optional[Path] = None):
+        max_size = max_output_size()
+        self._stdout = _capped_output(stdout, max_size)
+        self._stderr = _capped_output(stderr, max_size)
+        self._diff = self._stdout if diff is stdout else _capped_output(diff, max_size)
+        self.file = file
+
+    @property
+    def stdout(self) -> Any:
+        return _decoded_output(self._stdout)
+
+    @property
+    def stderr(self) -> Any:
+        return _decoded_output(self._stderr)
+
+    @property
+    def diff(self) -> Any:
+        return _decoded_output(self._diff)
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        :return: outputs as text and file, e.g. for caches and worker processes. A diff shared with stdout is not
+        repeated.
+        """
+        shared = self._diff is self._stdout and self._diff is not None
+        return {
+            "stdout": _text_output(self._stdout),
+            "stderr": _text_output(self._stderr),
+            "diff": None if shared else _text_output(self._diff),
+            "diff_is_stdout": shared,
+            "file": str(self.file) if self.file is not None else None,
+        }
+
+    @classmethod
+    def from_json(cls, data: Any) -> "PluginResultPayload":
+        """
+        Outputs are taken as already capped, so a truncated payload is not truncated again.
+        :return: payload of `to_json` data, raises ValueError if the data is not a payload.
+        """
+        if (
+            not isinstance(data, dict)
+            or not all(isinstance(data.get(key), (str, type(None))) for key in ("stdout", "stderr", "diff", "file"))
+            or not isinstance(data.get("diff_is_stdout", False), bool)
+        ):
+            raise ValueError("Invalid result payload")
+        payload = cls.__new__(cls)
+        payload._stdout = _capped_output(data.get("stdout"), None)
+        payload._stderr = _capped_output(data.get("stderr"), None)
+        payload._diff = payload._stdout if data.get("diff_is_stdout") else _capped_output(data.get("diff"), None)
+        payload.file = Path(data["file"]) if data.get("file") is not None else None
+        return payload
 
 
 @dataclass
@@ -40,17 +181,205 @@ class PluginContext:
     repo_path: Path
     repo: Repo
     log: Optional[Logger] = None
+    change_set: Optional[ChangeSet] = None
+    object_reader: Optional[GitObjectReader] = None
+    # Process pool for file checks (see `FileCheckPlugin`), files are checked in the calling thread if None.
+    file_tasks: Optional["FileTaskPool"] = None
+    # Index of file plugins executed with the context, changed files are dispatched to all of them at once.
+    file_index: Optional[DispatchIndex[Type["FileCheckPlugin"]]] = None
+    # Subprocesses of plugins, cancelling the group stops plugins still running.
+    processes: ProcessGroup = field(default_factory=ProcessGroup, repr=False, compare=False)
+    # Results of file checks kept between runs, see `FileCheckPlugin.result_key`. Nothing is cached if None.
+    results: Optional[ResultCache] = None
+    # Recent runs of plugins, finished runs are recorded if set. See `Plugin.workload`.
+    stats: Optional[PluginStats] = None
+    _dispatched: Optional[Dict[Type["Plugin"], List[FileChange]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _blob_sizes: Optional[Dict[str, int]] = field(default=None, init=False, repr=False, compare=False)
+    # Plugins may be executed concurrently with a shared context, lazy parts are created under the lock.
+    _lock: threading.RLock = field(default_factory=threading.RLock, init=False, repr=False, compare=False)
+
+    @property
+    def changes(self) -> ChangeSet:
+        """
+        Change set of the ref shared by all plugins executed with this context.
+        """
+        with self._lock:
+            if self.change_set is None:
+                self.change_set = ChangeSet(self.repo, self.ref)
+            return self.change_set
+
+    @property
+    def objects(self) -> GitObjectReader:
+        """
+        Object reader of the repository. Entry points share one reader between contexts of the same repository.
+        """
+        with self._lock:
+            if self.object_reader is None:
+                self.object_reader = open_object_reader(self.repo)
+            return self.object_reader
+
+    @property
+    def blob_sizes(self) -> Dict[str, int]:
+        """
+        Sizes of all changed blobs, requested with a single batch-check shared by all plugins.
+        """
+        with self._lock:
+            if self._blob_sizes is None:
+                hexshas = {change.new_hexsha for change in self.changes.files if not change.deleted and change.is_file}
+                self._blob_sizes = {
+                    hexsha: info.size for hexsha, info in self.objects.info_many(sorted(hexshas)) if info is not None
+                }
+            return self._blob_sizes
+
+    def subscribed_files(self, plugin: Type["FileCheckPlugin"]) -> List[FileChange]:
+        """
+        :return: changed regular files matching declarations of the plugin. Files of all plugins in the index are
+        dispatched together on first request, a plugin missing from the index gets its own pass over changes.
+        """
+        if self.file_index is None or plugin not in self.file_index:
+            index = DispatchIndex([(plugin, plugin.file_subscription())])
+            return index.dispatch(self.changes.files).get(plugin, [])
+        with self._lock:
+            if self._dispatched is None:
+                self._dispatched = self.file_index.dispatch(self.changes.files)
+            return self._dispatched.get(plugin, [])
+
+    def for_files(self, changes: Iterable[FileChange]) -> "PluginContext":
+        """
+        :return: copy of the context for a file task of the changes, with sizes of their blobs only.
+        """
+        sizes = self.blob_sizes
+        task_context = replace(self)
+        task_context._blob_sizes = {
+            change.new_hexsha: sizes[change.new_hexsha] for change in changes if change.new_hexsha in sizes
+        }
+        return task_context
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        Contexts are sent to file task processes without the repository, change set and reader handles,
+        the repository is reopened by path and the rest is created there on first use.
+        """
+        state = self.__dict__.copy()
+        for name in (
+            "repo",
+            "change_set",
+            "object_reader",
+            "file_tasks",
+            "file_index",
+            "processes",
+            "stats",
+            "_dispatched",
+            "_lock",
+        ):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.repo = Repo(self.repo_path)
+        self.change_set = None
+        self.object_reader = None
+        self.file_tasks = None
+        self.file_index = None
+        self.processes = ProcessGroup()
+        self.stats = None
+        self._dispatched = None
+        self._lock = threading.RLock()
 
 
 class Plugin:
+    # Plugins with higher priority run first, so cheap and important checks finish within a time budget.
+    _priority = 0
+    # Expensive plugins may be deferred once the time budget of the run is spent (see `DeadlineReached`),
+    # others always run to completion, so a push is never accepted without them.
+    _deferrable = False
+    # Changed files larger than the cap are never read whole, see `screen_blobs`.
+    _max_blob_size: Optional[int] = 32 * 1024 * 1024
+    # Wall-clock seconds of `execute`, and limits of every subprocess started with `context.processes`.
+    # Both can be overridden with environment variables, see `timeout` and `process_limits`.
+    _timeout: Optional[float] = None
+    _subprocess_timeout: Optional[float] = None
+    _subprocess_cpu_time: Optional[int] = None
+    _subprocess_memory: Optional[int] = None
+
     @classmethod
     def execute(cls, context: PluginContext) -> PluginResult:
         """
-        Executes plugin checks.
+        Executes plugin checks. Subprocesses are started with `context.processes`, so a cancelled run stops them.
         :return: PluginResultStatus.Ok if check passed, PluginResultStatus.Failed otherwise.
         """
         return PluginResult(PluginResultStatus.Ok, None)
 
+    @classmethod
+    def workload(cls, context: PluginContext) -> Tuple[int, int]:
+        """
+        Size of the work of the plugin in the change, run times are estimated from it (see `PluginStats`).
+        :return: number of checked files and their total size in bytes, zeros for plugins checking the whole change.
+        """
+        return 0, 0
+
+    @classmethod
+    def max_blob_size(cls) -> Optional[int]:
+        """
+        Size cap of blobs read by the plugin, can be overridden with `DGIS_HOOKS_MAX_BLOB_SIZE[_<CLASS NAME>]`.
+        :return: cap in bytes, None if blobs are not limited.
+        """
+        return max_blob_size(cls.__name__, cls._max_blob_size)
+
+    @classmethod
+    def priority(cls) -> int:
+        return cls._priority
+
+    @classmethod
+    def deferrable(cls) -> bool:
+        return cls._deferrable
+
+    @classmethod
+    def timeout(cls) -> Optional[float]:
+        """
+        Time limit of the plugin, can be overridden with `DGIS_HOOKS_TIMEOUT[_<CLASS NAME>]`.
+        :return: limit in seconds, None if the plugin may run as long as it needs.
+        """
+        return plugin_limit(g_plugin_timeout_env, cls.__name__, cls._timeout)
+
+    @classmethod
+    def process_limits(cls) -> ProcessLimits:
+        """
+        Limits of subprocesses of the plugin, can be overridden with `DGIS_HOOKS_SUBPROCESS_TIMEOUT[_<CLASS NAME>]`
+        (seconds), `DGIS_HOOKS_SUBPROCESS_CPU_TIME[_<CLASS NAME>]` (CPU seconds) and
+        `DGIS_HOOKS_SUBPROCESS_MEMORY[_<CLASS NAME>]` (address space bytes).
+        """
+        cpu_time = plugin_limit(g_subprocess_cpu_time_env, cls.__name__, cls._subprocess_cpu_time)
+        memory = plugin_limit(g_subprocess_memory_env, cls.__name__, cls._subprocess_memory)
+        return ProcessLimits(
+            timeout=plugin_limit(g_subprocess_timeout_env, cls.__name__, cls._subprocess_timeout),
+            cpu_time=int(cpu_time) if cpu_time is not None else None,
+            address_space=int(memory) if memory is not None else None,
+        )
+
+    @classmethod
+    def screen_blobs(cls, context: PluginContext, changes: Iterable[FileChange]) -> Iterator[ScreenedBlob]:
+        """
+        Reads new content of changes within the size cap of the plugin, larger blobs are yielded without content.
+        """
+        return screen_blobs(context.objects, context.blob_sizes, changes, cls.max_blob_size())
+
+    @classmethod
+    def exceeds_blob_size(cls, context: PluginContext, change: FileChange) -> bool:
+        """
+        :return: True (with a warning) if new content of the change exceeds the size cap of the plugin.
+        """
+        max_size = cls.max_blob_size()
+        size = context.blob_sizes.get(change.new_hexsha, 0)
+        if max_size is None or size <= max_size:
+            return False
+        if context.log:
+            context.log.warning(f"Skipping file '{change.path}' of {size} bytes, '{cls.__name__}' limit is {max_size}")
+        return True
+
     @classmethod
     def post_execute(cls, context: PluginContext, result: PluginResult) -> None:
         """
@@ -59,15 +388,242 @@ class Plugin:
         pass
 
 
+def run_plugin(plugin_type: Type[Plugin], plugin_context: PluginContext) -> PluginResult:
+    """
+    Executes plugin checks without the `post_execute` callback within time limits of the plugin,
+    an exception fails the check.
+    """
+    start = time.monotonic()
+    processes = plugin_context.processes
+    try:
+        with processes.limited(
+            plugin_type.__name__, plugin_type.timeout(), plugin_type.process_limits(), plugin_type.deferrable()
+        ):
+            processes.check()
+            result = plugin_type.execute(plugin_context)
+    except Exception as error:
+        result = _error_result(plugin_type, plugin_context, error)
+    _record_run(plugin_type, plugin_context, result, time.monotonic() - start)
+    return result
+
+
+def _record_run(plugin_type: Type[Plugin], plugin_context: PluginContext, result: PluginResult, seconds: float) -> None:
+    """
+    Records the run in plugin stats, runs stopped before finishing tell nothing about the cost of the plugin.
+    """
+    if plugin_context.stats is None or result.status in (PluginResultStatus.Cancelled, PluginResultStatus.Deferred):
+        return
+    try:
+        files, size = plugin_type.workload(plugin_context)
+    except Exception as error:
+        log_debug(f"Not recording run of '{plugin_type.__name__}' without workload ({error})")
+        return
+    plugin_context.stats.record(plugin_type.__name__, seconds, files, size, result.status.failed)
+
+
+def _error_result(plugin_type: Type[Plugin], plugin_context: PluginContext, error: Exception) -> PluginResult:
+    """
+    :return: result of a plugin stopped by the error.
+    """
+    log = plugin_context.log
+    if isinstance(error, DeadlineReached):
+        if log:
+            log.warning(f"Deferred '{plugin_type.__name__}', the time budget is spent")
+        return PluginResult(PluginResultStatus.Deferred, None)
+    if isinstance(error, Cancelled):
+        if log:
+            log.debug(f"Cancelled '{plugin_type.__name__}'")
+        return PluginResult(PluginResultStatus.Cancelled, None)
+    if isinstance(error, TimedOut):
+        if log:
+            log.error(f"Check '{plugin_type.__name__}' timed out: {error}")
+        return PluginResult(PluginResultStatus.TimedOut, None)
+    if log:
+        log.error(f"Exception while running '{plugin_type}: {error}'")
+    return PluginResult(PluginResultStatus.Failed, None)
+
+
+class FileNeeds(Flag):
+    """
+    Data of a changed file passed to `FileCheckPlugin.check_file`.
+    """
+
+    Nothing = 0
+    # New content of the file, read within the size cap of the plugin.
+    Content = auto()
+    # Patch hunks of the change, so changed lines are known.
+    Hunks = auto()
+
+
+class FileCheckPlugin(Plugin):
+    """
+    Plugin checking changed files independently of each other with `check_file`. Files are declared with extensions
+    and globs, entry points dispatch changed files to subscribed plugins with a single pass over the change set.
+    If the context has a file task pool, files are checked by its processes, so CPU-bound checks of many files are not
+    limited to a single core. `check_file` may be called in another process: it gets a copy of the context and must not
+    change plugin state.
+    """
+
+    # Extensions of checked files like `.json`, compared with the last suffix of the path.
+    _file_extensions: FrozenSet[str] = frozenset()
+    _file_extensions_ignore_case = False
+    # `fnmatch` patterns of checked paths, matched file by file, so extensions are preferred.
+    _file_globs: Tuple[str, ...] = ()
+    _file_needs = FileNeeds.Content
+    # Results of files are kept in the result cache of the context. Bump the version when results change for the same
+    # input, e.g. a check gets stricter, so results of the old check are not reused.
+    _cache_results = True
+    _result_version = 1
+    # Files are checked in batches of this many, results of a batch are looked up and stored at once.
+    _batch_files = 512
+
+    @classmethod
+    def workload(cls, context: PluginContext) -> Tuple[int, int]:
+        changes = context.subscribed_files(cls)
+        sizes = context.blob_sizes
+        return len(changes), sum(sizes.get(change.new_hexsha, 0) for change in changes)
+
+    @classmethod
+    def file_subscription(cls) -> FileSubscription:
+        return FileSubscription(cls._file_extensions, cls._file_globs, cls._file_extensions_ignore_case)
+
+    @classmethod
+    def wants_file(cls, context: PluginContext, change: FileChange) -> bool:
+        """
+        Additional filter of files matching declared extensions and globs.
+        :return: True if the changed regular file has to be checked.
+        """
+        return True
+
+    @classmethod
+    def files(cls, context: PluginContext) -> Iterator[FileChange]:
+        """
+        :return: changed regular files the plugin checks, with hunks attached if the plugin needs them. Hunks are
+        streamed from the diff, so they are held only by the batch being checked.
+        """
+        changes = [change for change in context.subscribed_files(cls) if cls.wants_file(context, change)]
+        if FileNeeds.Hunks not in cls._file_needs or not changes:
+            return iter(changes)
+        paths = {change.path for change in changes}
+        return context.changes.iter_hunks(paths.__contains__)
+
+    @classmethod
+    def result_key(cls, context: PluginContext, change: FileChange, *parts: Any) -> Optional[str]:
+        """
+        Key of the result of a file depends on the plugin, its size cap, the path and new content, changed lines if
+        the plugin needs them, and on `parts` (e.g. versions of tools and configs used by the check).
+        :return: key in the result cache of the context, None if results are not cached.
+        """
+        if context.results is None or not cls._cache_results:
+            return None
+        changed_lines = list(change.changed_lines) if FileNeeds.Hunks in cls._file_needs else None
+        return context.results.key(
+            f"{cls.__module__}.{cls.__qualname__}",
+            cls._result_version,
+            cls.max_blob_size(),
+            change.path,
+            change.new_hexsha,
+            changed_lines,
+            *parts,
+        )
+
+    @classmethod
+    def cached_results(
+        cls, context: PluginContext, keys: Iterable[Optional[str]]
+    ) -> Dict[str, Optional[PluginResultPayload]]:
+        """
+        :return: cached results by key, None for passed files. Invalid cached data is a miss.
+        """
+        if context.results is None:
+            return {}
+        cached: Dict[str, Optional[PluginResultPayload]] = {}
+        for key, value in context.results.get_many(key for key in keys if key is not None).items():
+            try:
+                cached[key] = PluginResultPayload.from_json(value) if value is not None else None
+            except ValueError:
+                if context.log:
+                    context.log.debug(f"Skipping invalid cached result of '{cls.__name__}'")
+        return cached
+
+    @classmethod
+    def store_results(cls, context: PluginContext, results: Dict[Optional[str], Optional[PluginResultPayload]]) -> None:
+        """
+        Stores results of files by key, None for passed files. Results without a key are not cached.
+        """
+        if context.results is not None:
+            context.results.put_many(
+                {key: payload.to_json() if payload is not None else None for key, payload in results.items() if key}
+            )
+
+    @classmethod
+    def check_file(
+        cls, context: PluginContext, change: FileChange, blob: Optional[ScreenedBlob]
+    ) -> Optional[PluginResultPayload]:
+        """
+        Checks a single file. `blob` is given if the plugin needs content, its `content` is None if the file exceeds
+        the size cap of the plugin.
+        :return: payload describing the failure, None if the file passed the check.
+        """
+        return None
+
+    @classmethod
+    def check_files(cls, context: PluginContext, changes: List[FileChange]) -> List[PluginResultPayload]:
+        """
+        Checks files in the calling thread, files with cached results are not read.
+        :return: payloads of failed files in order of changes.
+        """
+        keys = [cls.result_key(context, change) for change in changes]
+        cached = cls.cached_results(context, keys)
+        outcomes: List[Optional[PluginResultPayload]] = [None] * len(changes)
+        pending = []
+        for index, (change, key) in enumerate(zip(changes, keys)):
+            if key is not None and key in cached:
+                if context.log:
+                    context.log.debug(f"Using cached result of '{cls.__name__}' for file: '{change.path}'")
+                outcomes[index] = cached[key]
+            else:
+                pending.append(index)
+
+        blobs: Iterable[Optional[ScreenedBlob]] = repeat(None)
+        if FileNeeds.Content in cls._file_needs:
+            blobs = cls.screen_blobs(context, [changes[index] for index in pending])
+        for index, blob in zip(pending, blobs):
+            context.processes.check()
+            if context.log:
+                context.log.debug(f"Executing '{cls.__name__}' for file: '{changes[index].path}'")
+            outcomes[index] = cls.check_file(context, changes[index], blob)
+        cls.store_results(context, {keys[index]: outcomes[index] for index in pending})
+        return [payload for payload in outcomes if payload is not None]
+
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        payloads: List[PluginResultPayload] = []
+        files = cls.files(context)
+        while changes := list(islice(files, cls._batch_files)):
+            if context.file_tasks is not None:
+                payloads += context.file_tasks.check_files(cls, context, changes)
+            else:
+                payloads += cls.check_files(context, changes)
+
+        if not payloads:
+            return PluginResult(PluginResultStatus.Ok, None)
+
+        return PluginResult(PluginResultStatus.Failed, payloads)
+
+
+def file_dispatch_index(plugins: Iterable[Type[Plugin]]) -> DispatchIndex[Type["FileCheckPlugin"]]:
+    """
+    :return: index of file declarations of the `FileCheckPlugin`s among plugins, built once per hook run.
+    """
+    return DispatchIndex(
+        (plugin, plugin.file_subscription()) for plugin in plugins if issubclass(plugin, FileCheckPlugin)
+    )
+
+
 @contextmanager
 def execute_plugin(plugin_type: Type[Plugin], plugin_context: PluginContext):
-    result = PluginResult(PluginResultStatus.Failed, None)
+    result = run_plugin(plugin_type, plugin_context)
     try:
-        result = plugin_type.execute(plugin_context)
-        yield result
-    except Exception as error:
-        if plugin_context.log:
-            plugin_context.log.error(f"Exception while running '{plugin_type}: {error}'")
         yield result
     finally:
         plugin_type.post_execute(plugin_context, result)
@@ -5,19 +5,47 @@ Run this script or `dgis-pre-receive --help` to get more info.
 
 import argparse
 import fileinput
+import logging
 import os
+import time
 
-from dgis.hooks.plugins.plugin import PluginContext, PluginResultStatus, execute_plugin
-from dgis.hooks.plugins.discover import discover_and_load_plugins
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Type
+
+from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResultStatus, file_dispatch_index
+from dgis.hooks.plugins.discover import PluginEntry, discover_plugins, select_plugins
+from dgis.hooks.plugins.executor import (
+    ExecutionPolicy,
+    default_jobs,
+    estimate_plugins,
+    execute_plugins,
+    format_plan,
+    order_plugins,
+)
+from dgis.hooks.plugins.file_tasks import FileTaskPool, default_processes
+from dgis.hooks.utility.cache import open_plugin_stats, open_result_cache, set_cache_dir
 from dgis.hooks.utility.common import ExitStatus, get_version
-from dgis.hooks.utility.git import parse_ref
+from dgis.hooks.utility.deferred import DeferredQueue, default_deferred_queue_path
+from dgis.hooks.utility.git import (
+    ChangeSet,
+    GitRef,
+    PushCommits,
+    RenamePolicy,
+    open_object_reader,
+    parse_ref,
+    quarantine_blobs,
+)
 from dgis.hooks.utility.log import init_log, log_error, log_info, log_warning, log_level_from_string
+from dgis.hooks.utility.plugin_stats import PluginCost, PluginStats
+from dgis.hooks.utility.result_cache import ResultCache
 from dgis.hooks.utility.common import timed_block
 
 from git import Repo, InvalidGitRepositoryError, NoSuchPathError
 
 
 def _main() -> ExitStatus:
+    start = time.monotonic()
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument(
         "plugins",
@@ -41,7 +69,87 @@ def _main() -> ExitStatus:
         default="info",
         help="Logging level. One of: debug, info, warning, error (case-insensitive)",
     )
+    parser.add_argument(
+        "--new-blobs-only",
+        action="store_true",
+        default=False,
+        help="Check only content added by the push, listed from the pre-receive quarantine. "
+        "Content which already exists in the repository (e.g. under another ref) is skipped.",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=default_jobs(),
+        help="Number of plugins executed concurrently, number of CPUs by default. "
+        "Logs and results are still reported in plugin order, 1 executes plugins one after another.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=default_processes(),
+        help="Number of processes checking files of file-level plugins (e.g. JSON, XML, UTF-8), "
+        "number of CPUs by default. Processes are started only for enough changed files, 1 disables them.",
+    )
+    parser.add_argument(
+        "--policy",
+        type=ExecutionPolicy,
+        choices=list(ExecutionPolicy),
+        default=ExecutionPolicy.FailFast,
+        help="Execution policy: fail-fast (default) rejects the push on the first failed plugin and "
+        "stops plugins still running, collect-all runs every plugin and reports all failures.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for data shared between runs (formatter configs, plugin index, check results), "
+        "overrides DGIS_HOOKS_CACHE_DIR.",
+    )
+    parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        default=False,
+        help="Check every file again instead of reusing results of identical checks from the cache dir.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        default=False,
+        help="Log estimated cost of every plugin for each ref and exit without running checks, the push is "
+        "rejected as unchecked. Estimates and plugin order come from recent runs kept in the cache dir.",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=None,
+        help="Seconds the hook may spend on the push, keep it below the hook timeout of the git server. "
+        "Plugins run by priority, deferrable ones (formatters) not finished in time are queued "
+        "(see --deferred-queue) and checked later by dgis-deferred-checks, other checks always run. "
+        "Not limited by default.",
+    )
+    parser.add_argument(
+        "--deferred-queue",
+        type=str,
+        default=None,
+        help="Queue of checks deferred by --time-budget, deferred.sqlite3 in the cache dir by default.",
+    )
+    parser.add_argument(
+        "--renames",
+        type=str,
+        default="exact",
+        help="Rename detection of checked diffs: off, exact (default, identical content only) "
+        "or similarity threshold like 50%%.",
+    )
+    parser.add_argument(
+        "--rename-limit",
+        type=int,
+        default=1000,
+        help="Max number of files considered by similarity rename detection (git renameLimit).",
+    )
     args = parser.parse_args()
+    if args.cache_dir:
+        set_cache_dir(args.cache_dir)
 
     if args.log_level:
         log = init_log(__package__, log_level_from_string(args.log_level))
@@ -52,21 +160,27 @@ def _main() -> ExitStatus:
 
     with timed_block("Discovering plugins"):
         enabled_plugins = args.plugins if args.plugins else []
-        plugins = discover_and_load_plugins(enabled_plugins)
-        for plugin in plugins:
-            log_info(f"Found plugin: '{plugin.__name__}'")
+        plugin_entries = discover_plugins(enabled_plugins)
+        for entry in plugin_entries:
+            log_info(f"Found plugin: '{entry.class_name}'")
 
         ignore_plugins = args.ignore_plugins if args.ignore_plugins else []
         if ignore_plugins:
             filtered = []
-            for plugin in plugins:
-                if plugin.__name__ in ignore_plugins:
-                    log_info(f"Ignoring plugin: '{plugin.__name__}'")
+            for entry in plugin_entries:
+                if entry.class_name in ignore_plugins:
+                    log_info(f"Ignoring plugin: '{entry.class_name}'")
                 else:
-                    filtered.append(plugin)
-            plugins = filtered
+                    filtered.append(entry)
+            plugin_entries = filtered
 
-    if not plugins:
+    try:
+        renames = RenamePolicy.parse(args.renames, args.rename_limit)
+    except ValueError:
+        log_error(f"Invalid rename detection policy: '{args.renames}'")
+        return ExitStatus.Error
+
+    if not plugin_entries:
         log_warning("No plugins found, nothing to check")
         return ExitStatus.Success
 
@@ -79,22 +193,176 @@ def _main() -> ExitStatus:
             log_error(f"Invalid repository in f{repo_path}")
             return ExitStatus.Error
 
-    with timed_block("Processing checks"):
-        # Using "-" as a filename ignores argv[1:] and reads only from stdin.
-        # Doc: https://docs.python.org/3/library/fileinput.html
-        with fileinput.input("-") as file:
-            for line in file:
-                ref = parse_ref(line)
-                log_info(str(ref))
-                context = PluginContext(ref, repo_path, git_repo, log)
-                for plugin in plugins:
-                    with execute_plugin(plugin, context) as result:
-                        if result.status == PluginResultStatus.Failed:
-                            return ExitStatus.Error
+    # Using "-" as a filename ignores argv[1:] and reads only from stdin.
+    # Doc: https://docs.python.org/3/library/fileinput.html
+    with fileinput.input("-") as file:
+        refs = [parse_ref(line) for line in file]
 
+    with timed_block("Computing new commits"):
+        push_commits = PushCommits.compute(git_repo, refs)
+        log_info(f"Found {len(push_commits)} new commit(s) in {len(refs)} ref(s)")
+
+    # A plan covers every ref, it is not limited by the time budget.
+    deadline = start + args.time_budget if args.time_budget is not None and not args.plan else None
+    new_blobs = None
+    if args.new_blobs_only and not _expired(deadline):
+        with timed_block("Listing quarantined blobs"):
+            new_blobs = quarantine_blobs(git_repo)
+        if new_blobs is None:
+            log_warning("No object quarantine found (GIT_QUARANTINE_PATH is not set), checking all changed content")
+        else:
+            log_info(f"Found {len(new_blobs)} new blob(s) in quarantine")
+
+    with (
+        timed_block(f"Processing checks (renames: {renames}, policy: {args.policy})"),
+        FileTaskPool(args.processes) as file_tasks,
+        open_result_cache(not args.no_result_cache) as results,
+        open_plugin_stats() as stats,
+    ):
+        failed, deferred = run_checks(
+            repo_path,
+            git_repo,
+            refs,
+            push_commits,
+            plugin_entries,
+            log,
+            jobs=args.jobs,
+            policy=args.policy,
+            renames=renames,
+            new_blobs=new_blobs,
+            file_tasks=file_tasks,
+            results=results,
+            stats=stats,
+            deadline=deadline,
+            plan=args.plan,
+        )
+
+    if args.plan:
+        log_error("Rejecting the push, checks are not run with --plan")
+        return ExitStatus.Error
+    if failed:
+        return ExitStatus.Error
+    if deferred:
+        _defer_checks(Path(args.deferred_queue or default_deferred_queue_path()), repo_path, push_commits, deferred)
     return ExitStatus.Success
 
 
+def run_checks(
+    repo_path: str,
+    git_repo: Repo,
+    refs: List[GitRef],
+    push_commits: PushCommits,
+    plugin_entries: List[PluginEntry],
+    log: Optional[logging.Logger] = None,
+    jobs: Optional[int] = None,
+    policy: ExecutionPolicy = ExecutionPolicy.FailFast,
+    renames: RenamePolicy = RenamePolicy(),
+    new_blobs: Optional[Set[str]] = None,
+    file_tasks: Optional[FileTaskPool] = None,
+    results: Optional[ResultCache] = None,
+    stats: Optional[PluginStats] = None,
+    deadline: Optional[float] = None,
+    plan: bool = False,
+) -> Tuple[bool, List[Tuple[GitRef, List[str]]]]:
+    """
+    Runs plugins for every ref update of the push, or only logs their plan if `plan` is set. Plugins checking the whole
+    change (e.g. the branch name check) run before the diff. Once the deadline passes, deferrable plugins which did
+    not finish (or did not start) are deferred, the diff is skipped if only they need it. Other plugins always run.
+    :return: True if any check failed (with the fail-fast policy refs after the failed one are not checked),
+    and ref updates with plugins to check later, to be queued only if the push is accepted.
+    """
+    deferred: List[Tuple[GitRef, List[str]]] = []
+    failed = False
+    costs = stats.costs() if stats is not None else {}
+    change_entries = [entry for entry in plugin_entries if entry.subscription is None]
+    file_entries = [entry for entry in plugin_entries if entry.subscription is not None]
+    with open_object_reader(git_repo) as objects:
+        for ref in refs:
+            log_info(str(ref))
+            change_set = ChangeSet(git_repo, ref, push_commits, renames, new_blobs=new_blobs)
+            context = PluginContext(
+                ref, repo_path, git_repo, log, change_set, objects, file_tasks, results=results, stats=stats
+            )
+            context.processes.set_deadline(deadline)
+            change_plugins = [entry.load() for entry in change_entries]
+            if plan:
+                # The plan covers every plugin, nothing runs.
+                plugins = change_plugins + _load_file_plugins(context, select_plugins(file_entries, change_set.files))
+                estimates = estimate_plugins(plugins, context, costs, workloads=True)
+                log_info(f"Plan of '{ref.ref}':\n{format_plan(order_plugins(plugins, estimates), estimates)}")
+                continue
+
+            ref_failed, deferred_plugins = _run_plugins(change_plugins, context, costs, jobs, policy)
+            if not (ref_failed and policy == ExecutionPolicy.FailFast):
+                if _expired(deadline) and all(entry.deferrable for entry in file_entries):
+                    # Not even diffed, the worker imports plugins having files to check.
+                    deferred_plugins += [entry.class_name for entry in file_entries]
+                else:
+                    # Plugin modules are imported only for changes they have files to check in.
+                    entries = select_plugins(file_entries, change_set.files)
+                    if _expired(deadline):
+                        deferred_plugins += [entry.class_name for entry in entries if entry.deferrable]
+                        entries = [entry for entry in entries if not entry.deferrable]
+                    file_failed, file_deferred = _run_plugins(
+                        _load_file_plugins(context, entries), context, costs, jobs, policy
+                    )
+                    ref_failed = ref_failed or file_failed
+                    deferred_plugins += file_deferred
+            failed = failed or ref_failed
+            if failed and policy == ExecutionPolicy.FailFast:
+                break
+            if deferred_plugins:
+                deferred.append((ref, deferred_plugins))
+    return failed, deferred
+
+
+def _load_file_plugins(context: PluginContext, entries: List[PluginEntry]) -> List[Type[Plugin]]:
+    plugins = [entry.load() for entry in entries]
+    context.file_index = file_dispatch_index(plugins)
+    return plugins
+
+
+def _run_plugins(
+    plugins: List[Type[Plugin]],
+    context: PluginContext,
+    costs: Dict[str, PluginCost],
+    jobs: Optional[int],
+    policy: ExecutionPolicy,
+) -> Tuple[bool, List[str]]:
+    """
+    :return: True if any plugin failed, and names of deferred plugins.
+    """
+    if not plugins:
+        return False, []
+    # Cheap and frequently failing plugins run first, so a failing push is rejected early.
+    plugins = order_plugins(plugins, estimate_plugins(plugins, context, costs))
+    failed = False
+    deferred_plugins = []
+    with closing(execute_plugins(plugins, context, jobs, policy)) as plugin_results:
+        for plugin, result in zip(plugins, plugin_results):
+            if result.status.failed:
+                failed = True
+            elif result.status == PluginResultStatus.Deferred:
+                deferred_plugins.append(plugin.__name__)
+    return failed, deferred_plugins
+
+
+def _expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def _defer_checks(
+    queue_path: Path, repo_path: str, push_commits: PushCommits, deferred: List[Tuple[GitRef, List[str]]]
+) -> None:
+    """
+    Queues checks not finished within the time budget, the push is accepted without them.
+    """
+    with timed_block("Queueing deferred checks"), DeferredQueue(queue_path) as queue:
+        for ref, plugins in deferred:
+            queue.push(os.path.abspath(repo_path), ref, push_commits.subset(ref.new_rev), plugins)
+            log_warning(f"Time budget is spent, deferred checks of '{ref.ref}': {', '.join(plugins)}")
+
+
 def entry_point():
     exit(int(_main()))
 
@@ -28,13 +28,14 @@ from __future__ import print_function
 import argparse
 import difflib
 import os
-import re
 import subprocess
 import sys
 from io import StringIO
 
 import colorama
 
+from dgis.hooks.utility.diff import LineIntervals
+
 
 def color_diff(diff):
     for line in diff:
@@ -65,6 +66,9 @@ def entry_point():
     parser.add_argument("-style", help="formatting style to apply (LLVM, Google, Chromium, " "Mozilla, WebKit)")
     parser.add_argument("-binary", default="clang-format", help="location of binary to use for clang-format")
     parser.add_argument("-filediff", help="path to file with diff")
+    parser.add_argument(
+        "-lines", action="append", help="<start line>:<end line> range to format, can be used multiple times"
+    )
     parser.add_argument("-filesrc", help="path to source file")
     parser.add_argument("-workdir", default=".", help="path to work-dir")
     args = parser.parse_args()
@@ -77,19 +81,13 @@ def clang_format(args):
     stdout = None
     with open(os.path.join(args.filesrc), "r") as filesrc:
         code = filesrc.readlines()
-    if args.filediff:
-        with open(os.path.join(args.filediff), "r") as filediff:
-            for line in filediff.readlines():
-                match = re.search("^@@.*\+(\d+)(,(\d+))?", line)
-                if match:
-                    start_line = int(match.group(1))
-                    line_count = 1
-                    if match.group(3):
-                        line_count = int(match.group(3))
-                    if line_count == 0:
-                        continue
-                    end_line = start_line + line_count - 1
-                    lines_by_file.setdefault(args.filesrc, []).extend(["-lines", str(start_line) + ":" + str(end_line)])
+    if args.lines:
+        for lines in args.lines:
+            lines_by_file.setdefault(args.filesrc, []).extend(["-lines", lines])
+    elif args.filediff:
+        with open(os.path.join(args.filediff), "rb") as filediff:
+            for start_line, end_line in LineIntervals.from_hunks(filediff.read()):
+                lines_by_file.setdefault(args.filesrc, []).extend(["-lines", str(start_line) + ":" + str(end_line)])
     elif args.filesrc:
         lines_by_file.setdefault(args.filesrc, []).extend(["-lines", "1:" + str(len(code))])
     if not lines_by_file:
@@ -9,11 +9,21 @@ import argparse
 import os
 import sys
 
-from dgis.hooks.plugins.discover import discover_and_load_plugins
-from dgis.hooks.plugins.plugin import PluginContext, PluginResultStatus, execute_plugin, PluginResult
+from dgis.hooks.plugins.discover import discover_plugins, load_plugins
+from dgis.hooks.plugins.executor import (
+    ExecutionPolicy,
+    default_jobs,
+    estimate_plugins,
+    execute_plugins,
+    format_plan,
+    order_plugins,
+)
+from dgis.hooks.plugins.file_tasks import FileTaskPool, default_processes
+from dgis.hooks.plugins.plugin import PluginContext, PluginResult, file_dispatch_index
 from dgis.hooks.scripts_gitlab_ci.gitlab_reporter import GitLabReporter
+from dgis.hooks.utility.cache import open_plugin_stats, open_result_cache, set_cache_dir
 from dgis.hooks.utility.common import ExitStatus, get_version, timed_block
-from dgis.hooks.utility.git import GitRef
+from dgis.hooks.utility.git import ChangeSet, GitRef, RenamePolicy, open_object_reader
 from dgis.hooks.utility.log import init_log, log_info, log_warning, log_error, log_level_from_string
 
 from git import Repo, InvalidGitRepositoryError, NoSuchPathError
@@ -43,6 +53,62 @@ def _main() -> ExitStatus:
         default="info",
         help="Logging level. One of: debug, info, warning, error (case-insensitive)",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=default_jobs(),
+        help="Number of plugins executed concurrently, number of CPUs by default. "
+        "Logs and results are still reported in plugin order, 1 executes plugins one after another.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=default_processes(),
+        help="Number of processes checking files of file-level plugins (e.g. JSON, XML, UTF-8), "
+        "number of CPUs by default. Processes are started only for enough changed files, 1 disables them.",
+    )
+    parser.add_argument(
+        "--policy",
+        type=ExecutionPolicy,
+        choices=list(ExecutionPolicy),
+        default=ExecutionPolicy.CollectAll,
+        help="Execution policy: collect-all (default) runs every plugin and reports all failures, "
+        "fail-fast stops on the first failed plugin and stops plugins still running.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for data shared between runs (formatter configs, plugin index, check results), "
+        "overrides DGIS_HOOKS_CACHE_DIR. Point it into the CI cache to reuse results between pipelines.",
+    )
+    parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        default=False,
+        help="Check every file again instead of reusing results of identical checks from the cache dir.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        default=False,
+        help="Log estimated cost of every plugin and exit without running checks. "
+        "Estimates and plugin order come from recent runs kept in the cache dir.",
+    )
+    parser.add_argument(
+        "--renames",
+        type=str,
+        default="exact",
+        help="Rename detection of checked diffs: off, exact (default, identical content only) "
+        "or similarity threshold like 50%%.",
+    )
+    parser.add_argument(
+        "--rename-limit",
+        type=int,
+        default=1000,
+        help="Max number of files considered by similarity rename detection (git renameLimit).",
+    )
     parser.add_argument(
         "--post-comments",
         "-p",
@@ -52,6 +118,8 @@ def _main() -> ExitStatus:
     )
 
     args = parser.parse_args()
+    if args.cache_dir:
+        set_cache_dir(args.cache_dir)
 
     if args.log_level:
         log = init_log(__package__, log_level_from_string(args.log_level))
@@ -62,12 +130,18 @@ def _main() -> ExitStatus:
 
     enabled_plugins = args.plugins if args.plugins else []
     with timed_block("Discovering plugins"):
-        plugins = discover_and_load_plugins(enabled_plugins)
+        plugin_entries = discover_plugins(enabled_plugins)
         ignore_plugins = args.ignore_plugins if args.ignore_plugins else []
         if ignore_plugins:
-            plugins = [p for p in plugins if p.__name__ not in ignore_plugins]
+            plugin_entries = [entry for entry in plugin_entries if entry.class_name not in ignore_plugins]
 
-    if not plugins:
+    try:
+        renames = RenamePolicy.parse(args.renames, args.rename_limit)
+    except ValueError:
+        log_error(f"Invalid rename detection policy: '{args.renames}'")
+        return ExitStatus.Error
+
+    if not plugin_entries:
         log_warning("No plugins found, nothing to check")
         return ExitStatus.Success
 
@@ -80,21 +154,36 @@ def _main() -> ExitStatus:
             log_error(f"Invalid repository in {repo_path}")
             return ExitStatus.Error
 
-    with timed_block("Processing checks"):
+    with (
+        timed_block(f"Processing checks (renames: {renames}, policy: {args.policy})"),
+        open_object_reader(git_repo) as objects,
+        FileTaskPool(args.processes) as file_tasks,
+        open_result_cache(not args.no_result_cache) as results,
+        open_plugin_stats() as stats,
+    ):
         ref = GitRef(
             old_rev=os.getenv("CI_COMMIT_BEFORE_SHA"),
             new_rev=os.getenv("CI_COMMIT_SHA"),
             ref=os.getenv("CI_COMMIT_REF_NAME"),
         )
         log_info(f"Using refs from CI env: {str(ref)}")
-        context = PluginContext(ref, repo_path, git_repo, log)
-
+        change_set = ChangeSet(git_repo, ref, renames=renames)
+        # Plugin modules are imported only for changes they have files to check in.
+        plugins = load_plugins(plugin_entries, change_set.files)
+        file_index = file_dispatch_index(plugins)
+        context = PluginContext(
+            ref, repo_path, git_repo, log, change_set, objects, file_tasks, file_index, results=results, stats=stats
+        )
+        estimates = estimate_plugins(plugins, context, stats.costs(), workloads=args.plan)
+        plugins = order_plugins(plugins, estimates)
+        if args.plan:
+            log_info(f"Plan of '{ref.ref}':\n{format_plan(plugins, estimates)}")
+            return ExitStatus.Success
         plugin_failed_results: List[PluginResult] = []
 
-        for plugin in plugins:
-            with execute_plugin(plugin, context) as result:
-                if result.status == PluginResultStatus.Failed:
-                    plugin_failed_results.append(result)
+        for result in execute_plugins(plugins, context, args.jobs, args.policy):
+            if result.status.failed:
+                plugin_failed_results.append(result)
 
         if args.post_comments and plugin_failed_results:
             log_info("Posting plugin failed results to GitLab")
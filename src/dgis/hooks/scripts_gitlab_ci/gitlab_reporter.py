@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import os
-import re
 import requests
 
 from collections import defaultdict
@@ -11,6 +10,7 @@ from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Set, Any
 
 from dgis.hooks.plugins.plugin import PluginResult, PluginResultPayload
+from dgis.hooks.utility.diff import iter_hunk_headers
 from dgis.hooks.utility.git import GitRef
 
 
@@ -30,20 +30,11 @@ _g_comment_marker = "<!-- lint-review -->"
 
 
 def pick_anchor_line(unified_diff: str) -> Tuple[Optional[int], Optional[int]]:
-    hunk_re = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
-    for line in unified_diff.splitlines():
-        m = hunk_re.match(line)
-        if not m:
-            continue
-        old_start = int(m.group(1))
-        old_count = int(m.group(2) or "1")
-        new_start = int(m.group(3))
-        new_count = int(m.group(4) or "1")
-
-        if new_count > 0:
-            return new_start, None
-        if old_count > 0:
-            return None, old_start
+    for header in iter_hunk_headers(unified_diff):
+        if header.new_count > 0:
+            return header.new_start, None
+        if header.old_count > 0:
+            return None, header.old_start
     return None, None
 
 
@@ -0,0 +1,84 @@
+import os
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from dgis.hooks.utility.git import FileChange, GitObjectReader
+from dgis.hooks.utility.log import log_warning
+
+# Git considers content binary if a NUL byte is found in the first 8000 bytes, do the same.
+g_binary_sniff_size = 8000
+
+# Size cap for all plugins, `<env>_<PLUGIN CLASS NAME>` sets the cap of a single plugin. Non-positive disables it.
+g_max_blob_size_env = "DGIS_HOOKS_MAX_BLOB_SIZE"
+
+# Blobs within caps are read in batches of about this total size, so a batch of big blobs is not kept in memory.
+_g_read_batch_size = 32 * 1024 * 1024
+
+
+def is_binary(content: bytes) -> bool:
+    return b"\0" in content[:g_binary_sniff_size]
+
+
+def max_blob_size(plugin_name: str, default: Optional[int]) -> Optional[int]:
+    """
+    :return: size cap of the plugin configured with environment variables, None if content size is not limited.
+    """
+    for env_name in (f"{g_max_blob_size_env}_{plugin_name.upper()}", g_max_blob_size_env):
+        value = os.getenv(env_name)
+        if not value:
+            continue
+        try:
+            size = int(value)
+        except ValueError:
+            log_warning(f"Ignoring invalid blob size cap {env_name}='{value}'")
+            continue
+        return size if size > 0 else None
+    return default
+
+
+@dataclass(slots=True)
+class ScreenedBlob:
+    change: FileChange
+    size: int
+    # Whole content of the blob, None if it exceeds the size cap and has to be streamed or skipped.
+    content: Optional[bytes] = None
+
+
+def screen_blobs(
+    objects: GitObjectReader, sizes: Dict[str, int], changes: Iterable[FileChange], max_size: Optional[int]
+) -> Iterator[ScreenedBlob]:
+    """
+    Reads blobs within the size cap, larger ones are not read at all. Sizes come from a batch-check.
+    :return: screened blobs in order of changes.
+    """
+    batch: List[FileChange] = []
+    batch_size = 0
+    for change in changes:
+        size = sizes.get(change.new_hexsha)
+        if size is None:
+            size = _object_size(objects, change.new_hexsha)
+        if max_size is not None and size > max_size:
+            yield from _read_batch(objects, batch)
+            batch, batch_size = [], 0
+            yield ScreenedBlob(change, size)
+            continue
+        batch.append(change)
+        batch_size += size
+        if batch_size >= _g_read_batch_size:
+            yield from _read_batch(objects, batch)
+            batch, batch_size = [], 0
+    yield from _read_batch(objects, batch)
+
+
+def _object_size(objects: GitObjectReader, hexsha: str) -> int:
+    info = objects.info(hexsha)
+    if info is None:
+        raise ValueError(f"Object '{hexsha}' is missing")
+    return info.size
+
+
+def _read_batch(objects: GitObjectReader, changes: List[FileChange]) -> Iterator[ScreenedBlob]:
+    contents = objects.read_many(change.new_hexsha for change in changes)
+    for change, (_, content) in zip(changes, contents):
+        yield ScreenedBlob(change, len(content), content)
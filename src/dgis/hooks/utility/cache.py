@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from dgis.hooks.utility.common import get_version
+from dgis.hooks.utility.log import log_warning
+from dgis.hooks.utility.plugin_stats import PluginStats
+from dgis.hooks.utility.result_cache import ResultCache
+
+# Environment variable to relocate the cache, e.g. into a CI cache directory kept between pipelines.
+g_cache_dir_env = "DGIS_HOOKS_CACHE_DIR"
+
+_cache_dir: Optional[Path] = None
+
+
+def cache_dir() -> Path:
+    """
+    Directory shared by hook runs for data addressed by content.
+    Uses `DGIS_HOOKS_CACHE_DIR`, then `XDG_CACHE_HOME` or `~/.cache`, and a temp dir if those are not writable.
+    """
+    global _cache_dir
+    if _cache_dir:
+        return _cache_dir
+    path = os.getenv(g_cache_dir_env)
+    if not path:
+        path = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache"), "dgis_hooks")
+    try:
+        Path(path).mkdir(parents=True, exist_ok=True)
+    except OSError as error:
+        log_warning(f"Cache dir '{path}' is not available ({error}), using temp dir instead")
+        path = os.path.join(tempfile.gettempdir(), f"dgis_hooks-{os.getuid()}")
+        Path(path).mkdir(parents=True, exist_ok=True)
+    _cache_dir = Path(path)
+    return _cache_dir
+
+
+def set_cache_dir(path: str) -> None:
+    """
+    Relocates the cache, e.g. into a CI cache directory. Subprocesses of the hook use it as well.
+    """
+    os.environ[g_cache_dir_env] = path
+    reset_cache_dir()
+
+
+@contextmanager
+def open_result_cache(enabled: bool = True) -> Iterator[Optional[ResultCache]]:
+    """
+    Opens the result cache of file checks in the cache dir, valid for the installed hooks version. Results above
+    the size cap are evicted on exit.
+    :return: the cache, None if disabled.
+    """
+    if not enabled:
+        yield None
+        return
+    with ResultCache(cache_dir() / "results.sqlite3", get_version()) as results:
+        yield results
+
+
+@contextmanager
+def open_plugin_stats() -> Iterator[PluginStats]:
+    """
+    Opens recent runs of plugins in the cache dir, used to estimate and order plugins.
+    """
+    with PluginStats(cache_dir() / "plugin_stats.sqlite3") as stats:
+        yield stats
+
+
+def reset_cache_dir() -> None:
+    """
+    Forgets the resolved cache dir, so the environment is read again on next use.
+    """
+    global _cache_dir
+    _cache_dir = None
+
+
+def write_atomically(path: Path, data: bytes) -> None:
+    """
+    Writes the file through a temp file and a rename, so concurrent hook processes never see partial content.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
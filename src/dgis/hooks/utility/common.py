@@ -3,6 +3,7 @@ import time
 
 from contextlib import contextmanager
 from enum import IntEnum
+from typing import Callable
 
 from dgis.hooks.utility.log import log_info
 
@@ -24,12 +25,12 @@ def get_version() -> str:
 
 
 @contextmanager
-def timed_block(block_name: str):
+def timed_block(block_name: str, log_func: Callable[[str], None] = log_info):
     start = time.time()
-    log_info(f"Started timed block '{block_name}'")
+    log_func(f"Started timed block '{block_name}'")
     try:
         yield
     finally:
         end = time.time()
         elapsed_secs = "{:.2f}".format(end - start)
-        log_info(f"{block_name} elapsed in {elapsed_secs} secs")
+        log_func(f"{block_name} elapsed in {elapsed_secs} secs")
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dgis.hooks.utility.cache import cache_dir, write_atomically
+from dgis.hooks.utility.git import GitObjectReader
+from dgis.hooks.utility.log import log_warning
+
+
+@dataclass(frozen=True)
+class ConfigFile:
+    path: str
+    hexsha: str
+
+
+# Maps (tree hexsha, directory, config file name) to the config file placed right in the directory.
+# A tree hexsha identifies its content, so results are valid for every ref and repository.
+_g_lookup_cache: Dict[Tuple[str, str, str], Optional[ConfigFile]] = {}
+
+# Config contents by blob hexsha, backed by the on-disk cache shared between hook runs.
+_g_content_cache: Dict[str, bytes] = {}
+
+
+def _parent_dirs(path: str) -> List[str]:
+    """
+    :return: directories containing the path, nearest first, the root directory is "".
+    """
+    parents = [str(parent) for parent in PurePosixPath(path).parents]
+    return [parent if parent != "." else "" for parent in parents]
+
+
+class ConfigResolver:
+    """
+    Finds the nearest config file with a given name (e.g. `pyproject.toml`) for changed paths of a revision.
+    Candidates are looked up by path in the revision tree with a single batch request instead of traversing the tree.
+    """
+
+    def __init__(self, objects: GitObjectReader, rev: str, file_name: str):
+        self._objects = objects
+        self._file_name = file_name
+        info = objects.info(f"{rev}^{{tree}}")
+        if info is None:
+            raise ValueError(f"Revision '{rev}' has no tree")
+        self._tree = info.hexsha
+
+    def _key(self, directory: str) -> Tuple[str, str, str]:
+        return self._tree, directory, self._file_name
+
+    def _lookup(self, directories: Iterable[str]) -> None:
+        missing = sorted({directory for directory in directories if self._key(directory) not in _g_lookup_cache})
+        paths = [f"{directory}/{self._file_name}" if directory else self._file_name for directory in missing]
+        infos = self._objects.info_many(f"{self._tree}:{path}" for path in paths)
+        for directory, path, (_, info) in zip(missing, paths, infos):
+            config = ConfigFile(path, info.hexsha) if info and info.type == "blob" else None
+            _g_lookup_cache[self._key(directory)] = config
+
+    def resolve(self, paths: Iterable[str]) -> Dict[str, Optional[ConfigFile]]:
+        """
+        :return: nearest config file for every path, None if neither its directory nor any parent has one.
+        """
+        parents = {path: _parent_dirs(path) for path in paths}
+        self._lookup(directory for directories in parents.values() for directory in directories)
+        nearest = {}
+        for path, directories in parents.items():
+            configs = (_g_lookup_cache[self._key(directory)] for directory in directories)
+            nearest[path] = next((config for config in configs if config), None)
+        return nearest
+
+
+def read_config(objects: GitObjectReader, config: ConfigFile) -> bytes:
+    """
+    :return: content of the config file, read from git only if it is not cached in memory or on disk yet.
+    """
+    data = _g_content_cache.get(config.hexsha)
+    if data is not None:
+        return data
+    cached_path = cache_dir() / "configs" / config.hexsha
+    try:
+        data = cached_path.read_bytes()
+    except FileNotFoundError:
+        data = objects.read(config.hexsha)
+        try:
+            write_atomically(cached_path, data)
+        except OSError as error:
+            log_warning(f"Failed to cache config '{config.path}' ({error})")
+    _g_content_cache[config.hexsha] = data
+    return data
+
+
+def write_config(objects: GitObjectReader, config: ConfigFile, root_dir: Path) -> Path:
+    """
+    Places the config file into a directory mirroring the repository layout, once per directory.
+    :return: path of the written config file.
+    """
+    config_path = root_dir / config.path
+    if not config_path.exists():
+        config_path.parent.mkdir(parents=True, exist_ok=True)
+        config_path.write_bytes(read_config(objects, config))
+    return config_path
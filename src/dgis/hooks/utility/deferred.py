@@ -0,0 +1,143 @@
+import json
+import sqlite3
+import threading
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dgis.hooks.utility.cache import cache_dir
+from dgis.hooks.utility.git import GitRef, PushCommits
+
+
+def default_deferred_queue_path() -> Path:
+    return cache_dir() / "deferred.sqlite3"
+
+
+@dataclass(frozen=True)
+class DeferredCheck:
+    """
+    Plugin which did not finish within the time budget of a push, queued to check the ref update later.
+    """
+
+    id: int
+    repo_path: str
+    ref: GitRef
+    # New commits of created and force-updated refs, once the push is accepted they can not be computed again.
+    push_commits: PushCommits
+    plugin: str
+
+
+class DeferredQueue:
+    """
+    Persistent queue of deferred checks in SQLite, filled by pre-receive hooks and drained by `dgis-deferred-checks`.
+    Workers lease checks with `claim` and drop them with `complete`, checks of a worker which died are claimed again
+    once the lease expires. The database is in WAL mode, so concurrent hooks and workers wait for each other.
+    """
+
+    # Writers of other processes are waited for up to this long.
+    _busy_timeout = 30.0
+    # Seconds a claimed check is reserved for its worker.
+    _lease = 3600.0
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _ensure_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS deferred (id INTEGER PRIMARY KEY AUTOINCREMENT, repo TEXT NOT NULL, "
+                "old_rev TEXT NOT NULL, new_rev TEXT NOT NULL, ref TEXT NOT NULL, push_commits TEXT NOT NULL, "
+                "plugin TEXT NOT NULL, queued REAL NOT NULL, claimed REAL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def push(self, repo_path: str, ref: GitRef, push_commits: PushCommits, plugins: Iterable[str]) -> None:
+        """
+        Queues checks of the ref update by plugins (class names).
+        """
+        now = time.time()
+        commits = json.dumps(push_commits.parents)
+        rows = [(repo_path, ref.old_rev, ref.new_rev, ref.ref, commits, plugin, now) for plugin in plugins]
+        with self._lock:
+            connection = self._ensure_connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany(
+                    "INSERT INTO deferred (repo, old_rev, new_rev, ref, push_commits, plugin, queued) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def claim(self, limit: Optional[int] = None) -> List[DeferredCheck]:
+        """
+        Leases checks not claimed by other workers, oldest first.
+        :return: claimed checks, up to `limit` of them.
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._ensure_connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                rows = connection.execute(
+                    "SELECT id, repo, old_rev, new_rev, ref, push_commits, plugin FROM deferred "
+                    "WHERE claimed IS NULL OR claimed < ? ORDER BY id LIMIT ?",
+                    (now - self._lease, limit if limit is not None else -1),
+                ).fetchall()
+                connection.executemany("UPDATE deferred SET claimed = ? WHERE id = ?", [(now, row[0]) for row in rows])
+        return [
+            DeferredCheck(
+                id=check_id,
+                repo_path=repo,
+                ref=GitRef(old_rev, new_rev, ref),
+                push_commits=PushCommits(json.loads(commits)),
+                plugin=plugin,
+            )
+            for check_id, repo, old_rev, new_rev, ref, commits, plugin in rows
+        ]
+
+    def complete(self, checks: Iterable[DeferredCheck]) -> None:
+        """
+        Drops finished checks from the queue.
+        """
+        with self._lock:
+            connection = self._ensure_connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany("DELETE FROM deferred WHERE id = ?", [(check.id,) for check in checks])
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._ensure_connection().execute("SELECT COUNT(*) FROM deferred").fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
+
+
+def group_deferred_checks(checks: Iterable[DeferredCheck]) -> Dict[Tuple[str, str, str, str], List[DeferredCheck]]:
+    """
+    :return: checks by repository and ref update, so every update is diffed once for all of its plugins.
+    """
+    groups: Dict[Tuple[str, str, str, str], List[DeferredCheck]] = {}
+    for check in checks:
+        groups.setdefault((check.repo_path, check.ref.old_rev, check.ref.new_rev, check.ref.ref), []).append(check)
+    return groups
@@ -0,0 +1,75 @@
+import re
+
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, NamedTuple, Tuple, Union
+
+# Unified diff hunk header, counts are omitted when they are equal to 1.
+_g_hunk_header_pattern = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+_g_hunk_header_bytes_pattern = re.compile(_g_hunk_header_pattern.pattern.encode(), re.MULTILINE)
+
+
+class HunkHeader(NamedTuple):
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+
+
+def iter_hunk_headers(diff: Union[str, bytes]) -> Iterator[HunkHeader]:
+    """
+    Finds hunk headers with a single scan of the diff text, hunk bodies are not split into lines.
+    """
+    pattern = _g_hunk_header_bytes_pattern if isinstance(diff, bytes) else _g_hunk_header_pattern
+    for match in pattern.finditer(diff):  # type: ignore[arg-type]
+        old_start, old_count, new_start, new_count = match.groups()
+        yield HunkHeader(
+            int(old_start),
+            int(old_count) if old_count is not None else 1,
+            int(new_start),
+            int(new_count) if new_count is not None else 1,
+        )
+
+
+class LineIntervals:
+    """
+    Sorted closed intervals of line numbers, overlapping and adjacent intervals are coalesced.
+    """
+
+    __slots__ = ("_starts", "_ends")
+
+    def __init__(self, ranges: Iterable[Tuple[int, int]] = ()):
+        self._starts = array("q")
+        self._ends = array("q")
+        for start, end in sorted(ranges):
+            if self._ends and start <= self._ends[-1] + 1:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    @classmethod
+    def from_hunks(cls, diff: Union[str, bytes]) -> "LineIntervals":
+        """
+        :return: new side lines changed by the hunks, hunks which only remove lines are skipped.
+        """
+        return cls(
+            (header.new_start, header.new_start + header.new_count - 1)
+            for header in iter_hunk_headers(diff)
+            if header.new_count > 0
+        )
+
+    def __contains__(self, line: object) -> bool:
+        if not isinstance(line, int):
+            return False
+        index = bisect_right(self._starts, line) - 1
+        return index >= 0 and line <= self._ends[index]
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self._starts, self._ends)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __repr__(self) -> str:
+        return f"LineIntervals({list(self)})"
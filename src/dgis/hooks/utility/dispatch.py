@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Dict, FrozenSet, Generic, Hashable, Iterable, List, Tuple, TypeVar
+
+from dgis.hooks.utility.git import FileChange
+
+_K = TypeVar("_K", bound=Hashable)
+
+
+def path_suffix(path: str) -> str:
+    """
+    :return: extension of the last path component like `PurePosixPath.suffix`, without constructing a path object.
+    """
+    name = path.rpartition("/")[2]
+    dot = name.rfind(".")
+    if dot <= 0 or dot == len(name) - 1:
+        return ""
+    return name[dot:]
+
+
+@dataclass(frozen=True)
+class FileSubscription:
+    """
+    Files a subscriber is interested in: paths with one of the extensions (like `.json`) or matching one of
+    the globs. Globs are `fnmatch` patterns matched against the whole path, so `*` also matches `/`.
+    """
+
+    extensions: FrozenSet[str] = frozenset()
+    globs: Tuple[str, ...] = ()
+    ignore_case: bool = False
+
+    def matches(self, path: str) -> bool:
+        suffix = path_suffix(path)
+        if self.ignore_case:
+            matched = suffix.lower() in {extension.lower() for extension in self.extensions}
+        else:
+            matched = suffix in self.extensions
+        return matched or any(fnmatchcase(path, glob) for glob in self.globs)
+
+
+class DispatchIndex(Generic[_K]):
+    """
+    Finds subscribers of changed files with a lookup by extension. Only subscribers with globs are matched
+    path by path, so the cost per file does not grow with the number of extension subscribers.
+    """
+
+    def __init__(self, subscriptions: Iterable[Tuple[_K, FileSubscription]]):
+        self._by_extension: Dict[str, List[_K]] = {}
+        self._by_lower_extension: Dict[str, List[_K]] = {}
+        self._globbed: List[Tuple[_K, Tuple[str, ...]]] = []
+        self._keys: List[_K] = []
+        for key, subscription in subscriptions:
+            self._keys.append(key)
+            for extension in subscription.extensions:
+                if subscription.ignore_case:
+                    self._by_lower_extension.setdefault(extension.lower(), []).append(key)
+                else:
+                    self._by_extension.setdefault(extension, []).append(key)
+            if subscription.globs:
+                self._globbed.append((key, subscription.globs))
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    def subscribers(self, path: str) -> List[_K]:
+        """
+        :return: subscribers of the path without duplicates, in order of subscription.
+        """
+        suffix = path_suffix(path)
+        found = self._by_extension.get(suffix, []) + self._by_lower_extension.get(suffix.lower(), [])
+        found += [key for key, globs in self._globbed if any(fnmatchcase(path, glob) for glob in globs)]
+        if len(found) <= 1:
+            return found
+        unique = set(found)
+        return [key for key in self._keys if key in unique]
+
+    def dispatch(self, changes: Iterable[FileChange]) -> Dict[_K, List[FileChange]]:
+        """
+        Groups changed regular files by subscribers in a single pass, deleted paths and non-files are skipped.
+        :return: changes of every subscriber in order of changes.
+        """
+        files: Dict[_K, List[FileChange]] = {}
+        for change in changes:
+            if change.deleted or not change.is_file:
+                continue
+            for key in self.subscribers(change.path):
+                files.setdefault(key, []).append(change)
+        return files
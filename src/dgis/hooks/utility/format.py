@@ -1,5 +1,27 @@
+from subprocess import CalledProcessError
+from typing import Dict, Optional, Sequence, Tuple
+
+from dgis.hooks.utility.process import ProcessGroup
+
 g_supported_cpp_file_extensions = {".cpp", ".c", ".inl", ".h", ".hpp", ".hqt"}
 
+# Versions of formatting tools by command, asked once per process (e.g. a file task process), None if not installed.
+_g_tool_versions: Dict[Tuple[str, ...], Optional[str]] = {}
+
 
 def is_supported_cpp_file_extension(ext: str) -> bool:
     return ext in g_supported_cpp_file_extensions
+
+
+def tool_version(processes: ProcessGroup, command: Sequence[str]) -> Optional[str]:
+    """
+    :return: version printed by `<command> --version`, None if the tool is not installed.
+    """
+    key = tuple(command)
+    if key not in _g_tool_versions:
+        try:
+            result = processes.run([*command, "--version"], capture_output=True, text=True, check=True)
+            _g_tool_versions[key] = result.stdout.strip()
+        except (CalledProcessError, FileNotFoundError):
+            _g_tool_versions[key] = None
+    return _g_tool_versions[key]
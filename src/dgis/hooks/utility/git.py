@@ -1,9 +1,40 @@
+import os
 import re
+import threading
 
-from dataclasses import dataclass
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import cached_property, partial, wraps
+from pathlib import Path
+from subprocess import DEVNULL, PIPE, Popen, run
+from typing import (
+    IO,
+    AbstractSet,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from weakref import WeakKeyDictionary
 
-from git import Repo, NULL_TREE
+from git import NULL_TREE, GitCommandError, Repo
+
+from dgis.hooks.utility.common import timed_block
+from dgis.hooks.utility.diff import LineIntervals
+from dgis.hooks.utility.log import log_debug, log_warning
+from dgis.hooks.utility.packfile import ObjectStore
 
 
 class RefStatus(Enum):
@@ -19,34 +50,62 @@ class RefStatus(Enum):
 # otherwise sha1-old and sha1-new should be valid objects in the repository.
 g_zero_rev = "0" * 40
 
+# Well-known id of the empty tree, used as diff base when a ref has no parent commits to compare with.
+g_empty_tree_rev = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+# Regular (non-executable and executable) file modes. Symlinks and submodules have other modes.
+g_regular_file_modes = {"100644", "100755"}
+
+# Object reader backend: `git` (subprocesses) or `mmap` (in-process pack reader), see `open_object_reader`.
+g_object_backend_env = "DGIS_HOOKS_OBJECT_BACKEND"
+
+# Git backend: `cli` (git processes) or `pygit2` (in-process libgit2), see `get_backend`.
+g_git_backend_env = "DGIS_HOOKS_GIT_BACKEND"
+
+_g_hexsha_pattern = re.compile(r"[0-9a-f]{40}")
+
 
 @dataclass
 class GitRef:
     old_rev: str
     new_rev: str
     ref: str
+    _status: Optional[RefStatus] = field(default=None, init=False, repr=False, compare=False)
 
     def __str__(self):
         return f"old_rev: {self.old_rev} new_rev: {self.new_rev} ref: {self.ref}"
 
     def status(self, git_repo: Repo) -> RefStatus:
+        """
+        Classifies the ref update. The result is cached on the instance.
+        """
+        if self._status is None:
+            with timed_block(f"Classifying ref '{self.ref}'", log_debug):
+                self._status = self._classify(git_repo)
+            log_debug(f"Ref '{self.ref}' classified as {self._status.name}")
+        return self._status
+
+    def _classify(self, git_repo: Repo) -> RefStatus:
         zero_rev = g_zero_rev
 
         if self.new_rev == zero_rev:
             return RefStatus.Deleted
-        elif self.old_rev != zero_rev and git_repo.git.rev_list(self.old_rev, f"^{self.new_rev}"):
-            # https://git-scm.com/docs/git-rev-list
-            # git rev-list oldrev ^newrev
-            # Shows the commits reachable from oldrev but not reachable from newrev.
-            # This shows the commits existed only old tree.
-            # If this command show any commits, old tree was replaced with new tree, so forced update was occured.
-            return RefStatus.ForceUpdated
         elif self.old_rev == zero_rev:
             return RefStatus.Created
+        elif not _is_ancestor(git_repo, self.old_rev, self.new_rev):
+            # https://git-scm.com/docs/git-merge-base#Documentation/git-merge-base.txt---is-ancestor
+            # If old tree is not an ancestor of new tree, some commits existed only in old tree,
+            # so old tree was replaced with new tree and forced update was occured.
+            # Unlike listing these commits, the check stops as soon as the answer is known and uses commit-graph.
+            return RefStatus.ForceUpdated
         else:
             return RefStatus.Updated
 
     def diff(self, git_repo: Repo):
+        """
+        GitPython diff of the ref with zero context patches, kept for existing users.
+        Prefer `changed_files`, which is what plugins get through `ChangeSet`.
+        """
         status = self.status(git_repo)
         if status == RefStatus.Deleted:
             return []
@@ -64,34 +123,963 @@ class GitRef:
             commit = git_repo.commit(self.old_rev)
             return commit.diff(self.new_rev, create_patch=True, unified=0)
 
+    def changed_files(self, git_repo: Repo) -> List["FileChange"]:
+        return ChangeSet(git_repo, self).files
+
+
+class RenameDetection(Enum):
+    Off = "off"
+    Exact = "exact"
+    Similarity = "similarity"
+
+
+@dataclass(frozen=True)
+class RenamePolicy:
+    """
+    Rename detection of check diffs. Exact detection matches identical blobs by id and costs linear time,
+    similarity detection scores every added/deleted pair and is limited to `limit` files (`-l`, renameLimit).
+    """
+
+    detection: RenameDetection = RenameDetection.Similarity
+    threshold: int = 50
+    limit: Optional[int] = None
+
+    @classmethod
+    def parse(cls, value: str, limit: Optional[int] = None) -> "RenamePolicy":
+        """
+        :param value: `off`, `exact` or a similarity threshold like `50%`.
+        """
+        value = value.strip().lower()
+        if value in (RenameDetection.Off.value, RenameDetection.Exact.value):
+            return cls(RenameDetection(value), limit=limit)
+        threshold = int(value.removesuffix("%"))
+        if not 0 < threshold <= 100:
+            raise ValueError(f"Invalid rename similarity threshold: '{value}'")
+        return cls(RenameDetection.Similarity, threshold, limit)
+
+    def args(self) -> List[str]:
+        if self.detection == RenameDetection.Off:
+            return ["--no-renames"]
+        if self.detection == RenameDetection.Exact:
+            # git skips similarity scoring entirely when only identical content counts as a rename.
+            return ["-M100%"]
+        return [f"-M{self.threshold}%"] + ([f"-l{self.limit}"] if self.limit is not None else [])
+
+    def __str__(self) -> str:
+        if self.detection != RenameDetection.Similarity:
+            return self.detection.value
+        limit = f", limit {self.limit}" if self.limit is not None else ""
+        return f"similarity {self.threshold}%{limit}"
+
+
+@dataclass(slots=True)
+class FileChange:
+    """
+    Single changed path as reported by `git diff-tree --raw`, with hunks if the patch was requested.
+    """
+
+    status: str
+    path: str
+    old_path: Optional[str]
+    old_mode: str
+    new_mode: str
+    old_hexsha: str
+    new_hexsha: str
+    hunks: Optional[bytes] = None
+    _changed_lines: Optional[LineIntervals] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def changed_lines(self) -> LineIntervals:
+        """
+        New side lines changed by hunks, parsed once per change. Empty if hunks were not requested.
+        """
+        if self._changed_lines is None:
+            self._changed_lines = LineIntervals.from_hunks(self.hunks) if self.hunks else LineIntervals()
+        return self._changed_lines
+
+    def is_changed(self, line: int) -> bool:
+        return line in self.changed_lines
+
+    @property
+    def deleted(self) -> bool:
+        return self.status == "D"
+
+    @property
+    def renamed(self) -> bool:
+        return self.status == "R"
+
+    @property
+    def is_file(self) -> bool:
+        """
+        :return: True if the path is a regular file after the change, so its new blob holds file content.
+        """
+        return self.new_mode in g_regular_file_modes
+
+
+class _DiffTreeReader:
+    """
+    Incremental reader of `git diff-tree -z` output with NUL-terminated raw fields and line-based patches.
+    """
+
+    _chunk_size = 64 * 1024
+
+    def __init__(self, stream: IO[bytes]):
+        self._stream = stream
+        self._buffer = b""
+        self._pos = 0
+
+    def _read_until(self, separator: bytes) -> Optional[bytes]:
+        # Parts of a long field or line are joined once, so huge lines do not cause quadratic copying.
+        parts = []
+        while True:
+            end = self._buffer.find(separator, self._pos)
+            if end >= 0:
+                parts.append(self._buffer[self._pos : end])
+                self._pos = end + 1
+                return b"".join(parts)
+            parts.append(self._buffer[self._pos :])
+            self._buffer = self._stream.read(self._chunk_size)
+            self._pos = 0
+            if not self._buffer:
+                data = b"".join(parts)
+                return data if data else None
+
+    def read_field(self) -> Optional[bytes]:
+        """
+        :return: next NUL-terminated field, None at the end of output.
+        """
+        return self._read_until(b"\0")
+
+    def read_line(self) -> Optional[bytes]:
+        """
+        :return: next line without line feed, None at the end of output.
+        """
+        return self._read_until(b"\n")
+
+    def read_raw_record(self, header: bytes) -> FileChange:
+        old_mode, new_mode, old_hexsha, new_hexsha, status = header[1:].decode().split(" ")
+        # Renames and copies are followed by source and destination paths.
+        paths = [os.fsdecode(self.read_field() or b"") for _ in range(2 if status[0] in "RC" else 1)]
+        old_path = paths[0] if len(paths) == 2 else None
+        return FileChange(status[0], paths[-1], old_path, old_mode, new_mode, old_hexsha, new_hexsha)
+
+    def iter_patch_hunks(self) -> Iterator[bytes]:
+        """
+        Reads patches block by block.
+        :return: hunks part (starting from the first `@@` line) of every `diff --git` block, empty if there are none.
+        """
+        block: Optional[List[bytes]] = None
+        in_hunks = False
+        for line in iter(self.read_line, None):
+            if line.startswith(b"diff --git "):
+                if block is not None:
+                    yield b"".join(block)
+                block = []
+                in_hunks = False
+                continue
+            if line.startswith(b"@@"):
+                in_hunks = True
+            if in_hunks and block is not None:
+                block.append(line + b"\n")
+        if block is not None:
+            yield b"".join(block)
+
+
+def iter_diff_tree(
+    git_repo: Repo,
+    base: str,
+    new_rev: str,
+    paths: Optional[List[str]] = None,
+    patch: bool = False,
+    renames: RenamePolicy = RenamePolicy(),
+) -> Iterator[FileChange]:
+    """
+    Streams `git diff-tree -r -z --raw` output, optionally with zero-context patches, as change records.
+    Only raw records and the patch of a single file are held in memory at any time.
+    :param paths: literal paths to limit the diff to, all paths if None.
+    :param patch: attach hunks to the records, each record is yielded as soon as its patch is read.
+    :param renames: rename detection policy.
+    """
+    args = ["git", "diff-tree", "-r", "-z", *renames.args(), "--raw"]
+    if patch:
+        args += ["-p", "-U0"]
+    args += [base, new_rev]
+    if paths is not None:
+        args += ["--", *[f":(literal){path}" for path in paths]]
+
+    process = Popen(args, stdout=PIPE, stderr=PIPE, cwd=git_repo.working_dir)
+    assert process.stdout and process.stderr
+    finished = False
+    try:
+        reader = _DiffTreeReader(process.stdout)
+        records = []
+        # Raw records come first, an empty field separates them from patches.
+        for field in iter(reader.read_field, None):
+            if not field:
+                break
+            records.append(reader.read_raw_record(field))
+
+        if not patch:
+            yield from records
+        else:
+            blocks = reader.iter_patch_hunks()
+            for record in records:
+                # Type changes are printed as deletion followed by creation, the latter holds new content.
+                record.hunks = next(blocks, b"")
+                if record.status == "T":
+                    record.hunks = next(blocks, b"")
+                yield record
+        finished = True
+    finally:
+        if not finished:
+            # The consumer stopped early, nothing else is needed from git.
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+    if process.returncode != 0:
+        raise GitCommandError(args, process.returncode, stderr)
+
+
+_T = TypeVar("_T")
+
+
+def iter_parallel(tasks: Iterable[Callable[[], List[_T]]], jobs: int) -> Iterator[_T]:
+    """
+    Runs tasks on a pool of `jobs` threads and yields their results in task order.
+    At most `jobs` tasks are submitted ahead of the consumer, so memory stays bounded for streamed results.
+    """
+    if jobs <= 1:
+        for task in tasks:
+            yield from task()
+        return
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    pending: Deque[Future] = deque()
+    try:
+        for task in tasks:
+            pending.append(executor.submit(task))
+            if len(pending) >= jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def top_level_entries(git_repo: Repo, revs: List[str]) -> List[str]:
+    """
+    :return: names of top-level entries of the revision trees, in git tree order.
+    """
+    entries = {}
+    for rev in revs:
+        for line in git_repo.git.ls_tree("-z", rev).split("\0"):
+            if line:
+                info, name = line.split("\t", 1)
+                # Trees are ordered as if their names had a trailing slash.
+                entries[name] = name + "/" if info.split()[1] == "tree" else name
+    return sorted(entries, key=lambda name: entries[name].encode())
+
+
+def _is_ancestor(git_repo: Repo, ancestor_rev: str, rev: str) -> bool:
+    return get_backend(git_repo).is_ancestor(ancestor_rev, rev)
+
+
+class PushCommits:
+    """
+    Commits introduced by a whole push, i.e. reachable from pushed tips but not from any existing ref.
+    They are found with a single walk for all refs instead of one walk over `--all` per ref.
+    """
+
+    def __init__(self, parents: Dict[str, List[str]]):
+        # Commit hexsha to its parents, in reverse chronological order of `git rev-list`.
+        self._parents = parents
+
+    @classmethod
+    def compute(cls, git_repo: Repo, refs: List[GitRef]) -> "PushCommits":
+        """
+        Walks new commits of created and force-updated refs. Other refs do not need them to find their diff base.
+        """
+        tips = {
+            ref.new_rev: None for ref in refs if ref.status(git_repo) in (RefStatus.ForceUpdated, RefStatus.Created)
+        }
+        if not tips:
+            return cls({})
+        return cls(get_backend(git_repo).rev_walk(list(tips)))
+
+    def __len__(self):
+        return len(self._parents)
+
+    @property
+    def parents(self) -> Dict[str, List[str]]:
+        return self._parents
+
+    def subset(self, tip: str) -> "PushCommits":
+        """
+        :return: new commits reachable from the tip. Unlike `compute`, it still describes the ref update once the
+        push is accepted and its commits are reachable from existing refs (e.g. for deferred checks).
+        """
+        reachable = set(self.reachable_from(tip))
+        return PushCommits({commit: parents for commit, parents in self._parents.items() if commit in reachable})
+
+    def reachable_from(self, tip: str) -> List[str]:
+        """
+        :return: new commits reachable from the tip, in reverse chronological order.
+        """
+        reachable = set()
+        pending = [tip]
+        while pending:
+            commit = pending.pop()
+            if commit in reachable or commit not in self._parents:
+                continue
+            reachable.add(commit)
+            pending.extend(self._parents[commit])
+        return [commit for commit in self._parents if commit in reachable]
+
+    def diff_base(self, tip: str) -> str:
+        """
+        Finds the commit the tip has been built on by following first parents through new commits.
+        Unlike the parent of the oldest new commit, it is not confused by merged side branches.
+        :return: the first existing commit on the first-parent chain, or the empty tree if there is none.
+        """
+        commit = tip
+        while commit in self._parents:
+            commit_parents = self._parents[commit]
+            if not commit_parents:
+                # New root commit, everything it has is new.
+                return g_empty_tree_rev
+            commit = commit_parents[0]
+        if commit == tip:
+            # No new commits, so the whole tree is checked.
+            return g_empty_tree_rev
+        return commit
+
+
+def quarantine_blobs(git_repo: Repo) -> Optional[Set[str]]:
+    """
+    Lists blobs received by the push being checked. Since git 2.11 objects of a push are written to a quarantine
+    directory (`GIT_QUARANTINE_PATH`) until pre-receive hooks accept it, so only new content is there.
+    :return: hexshas of quarantined blobs, None if there is no quarantine (e.g. outside of pre-receive hook).
+    """
+    quarantine_path = os.getenv("GIT_QUARANTINE_PATH")
+    if not quarantine_path:
+        return None
+    # Alternates point to the repository objects, they are dropped to enumerate the quarantine alone.
+    env = {key: value for key, value in os.environ.items() if key != "GIT_ALTERNATE_OBJECT_DIRECTORIES"}
+    env["GIT_OBJECT_DIRECTORY"] = quarantine_path
+    process = run(
+        ["git", "cat-file", "--batch-all-objects", "--unordered", "--batch-check=%(objecttype) %(objectname)"],
+        capture_output=True,
+        check=True,
+        cwd=git_repo.working_dir,
+        env=env,
+    )
+    blobs = set()
+    for line in process.stdout.decode().splitlines():
+        object_type, hexsha = line.split()
+        if object_type == "blob":
+            blobs.add(hexsha)
+    return blobs
+
+
+def _synchronized_cached_property(func: Callable[[Any], _T]) -> "cached_property[_T]":
+    """
+    Memoized property computed once even if several threads access it first at the same time, guarded by `self._lock`.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def compute(self: Any) -> _T:
+        with self._lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = func(self)
+            return self.__dict__[name]
+
+    return cached_property(compute)
+
+
+class ChangeSet:
+    """
+    Changes introduced by a single ref update.
+    Every part is computed on first access and memoized, so plugins sharing a change set ask git only once.
+    A change set is shared by concurrently executed plugins, memoized parts are computed under a lock.
+    """
+
+    # Number of changes per patch generation call, keeps pathspec arguments within command line limits.
+    _patch_chunk_size = 512
+
+    # Number of tree diff shards per job, more shards than jobs balance uneven top-level directories.
+    _shards_per_job = 4
+
+    def __init__(
+        self,
+        git_repo: Repo,
+        ref: GitRef,
+        push_commits: Optional[PushCommits] = None,
+        renames: RenamePolicy = RenamePolicy(),
+        jobs: Optional[int] = None,
+        new_blobs: Optional[AbstractSet[str]] = None,
+    ):
+        """
+        :param jobs: max number of concurrent git processes generating diffs, number of CPUs by default.
+        :param new_blobs: blobs added by the push (see `quarantine_blobs`), changes to other content are dropped.
+        """
+        self._repo = git_repo
+        self._ref = ref
+        self._push_commits = push_commits
+        self._renames = renames
+        self._jobs = jobs or os.cpu_count() or 1
+        self._new_blobs = new_blobs
+        self._lock = threading.RLock()
+
+    @_synchronized_cached_property
+    def status(self) -> RefStatus:
+        return self._ref.status(self._repo)
+
+    @_synchronized_cached_property
+    def new_commits(self) -> List[str]:
+        """
+        Commits introduced by the ref update, in reverse chronological order.
+        """
+        status = self.status
+        if status == RefStatus.Deleted:
+            return []
+        elif status in (RefStatus.ForceUpdated, RefStatus.Created):
+            return self.push_commits.reachable_from(self._ref.new_rev)
+        else:
+            return get_backend(self._repo).rev_range(self._ref.old_rev, self._ref.new_rev)
+
+    @property
+    def push_commits(self) -> PushCommits:
+        """
+        New commits of the push shared by entry points, or computed for this ref alone.
+        """
+        with self._lock:
+            if self._push_commits is None:
+                self._push_commits = PushCommits.compute(self._repo, [self._ref])
+            return self._push_commits
+
+    @_synchronized_cached_property
+    def diff_base(self) -> Optional[str]:
+        """
+        Revision or tree the new revision is compared with, None if there is nothing to compare.
+        """
+        status = self.status
+        if status == RefStatus.Deleted:
+            return None
+        elif status in (RefStatus.ForceUpdated, RefStatus.Created):
+            return self.push_commits.diff_base(self._ref.new_rev)
+        else:
+            return self._ref.old_rev
+
+    @_synchronized_cached_property
+    def files(self) -> List[FileChange]:
+        """
+        Changed paths with modes and blob hexshas. Patches are not generated at this stage.
+        If new blobs of the push are known, only deletions and changes to new content are kept.
+        """
+        if self.diff_base is None:
+            return []
+        if self._new_blobs is not None:
+            if not self._new_blobs:
+                log_debug(f"No new blobs pushed, skipping diff of ref '{self._ref.ref}'")
+                return []
+            return [change for change in self._diff_all() if change.deleted or change.new_hexsha in self._new_blobs]
+        return self._diff_all()
+
+    def _diff_all(self) -> List[FileChange]:
+        with timed_block(f"Diffing ref '{self._ref.ref}' (renames: {self._renames})", log_debug):
+            shards = self._shards()
+            if len(shards) <= 1:
+                return list(self._iter_diff())
+            log_debug(f"Diffing ref '{self._ref.ref}' in {len(shards)} shard(s) with {self._jobs} job(s)")
+            return list(iter_parallel((partial(self._list_diff_paths, shard) for shard in shards), self._jobs))
+
+    @_synchronized_cached_property
+    def changed_paths(self) -> List[str]:
+        return [change.path for change in self.files]
+
+    def iter_hunks(self, predicate: Callable[[str], bool]) -> Iterator[FileChange]:
+        """
+        Streams changes of matching paths with hunks attached. Hunks are not memoized, so memory stays bounded:
+        chunks of paths are diffed concurrently, but only `jobs` chunks are generated ahead of the consumer.
+        """
+        changes = [change for change in self.files if not change.deleted and predicate(change.path)]
+        for change in self._iter_patched(changes):
+            if not change.deleted and predicate(change.path):
+                yield change
+
+    def _iter_patched(self, changes: List[FileChange]) -> Iterator[FileChange]:
+        tasks = (partial(self._list_diff, chunk, True) for chunk in self._chunks(changes))
+        return iter_parallel(tasks, self._jobs if get_backend(self._repo).concurrent_diff else 1)
+
+    def _shards(self) -> List[List[str]]:
+        """
+        Splits the whole tree diff by top-level entries into contiguous groups, so concatenated shard results keep
+        git order. Rename detection does not work across shards, so only diffs without renames are split:
+        diffs with the empty tree (e.g. a new root branch) and diffs with rename detection turned off.
+        """
+        assert self.diff_base is not None
+        if self._jobs <= 1 or not get_backend(self._repo).concurrent_diff:
+            return []
+        if self.diff_base == g_empty_tree_rev:
+            entries = top_level_entries(self._repo, [self._ref.new_rev])
+        elif self._renames.detection == RenameDetection.Off:
+            entries = top_level_entries(self._repo, [self.diff_base, self._ref.new_rev])
+        else:
+            return []
+        shard_count = min(len(entries), self._jobs * self._shards_per_job)
+        if shard_count <= 1:
+            return []
+        size = -(-len(entries) // shard_count)
+        return [entries[i : i + size] for i in range(0, len(entries), size)]
+
+    def _chunks(self, changes: List[FileChange]) -> Iterator[List[FileChange]]:
+        for i in range(0, len(changes), self._patch_chunk_size):
+            yield changes[i : i + self._patch_chunk_size]
+
+    def _iter_diff(self, changes: Optional[List[FileChange]] = None, patch: bool = False) -> Iterator[FileChange]:
+        assert self.diff_base is not None
+        paths = None
+        if changes is not None:
+            # Rename sources have to be in the pathspec as well, otherwise renames turn into additions.
+            paths = [path for change in changes for path in (change.old_path, change.path) if path]
+        return self._iter_diff_paths(paths, patch)
+
+    def _iter_diff_paths(self, paths: Optional[List[str]], patch: bool = False) -> Iterator[FileChange]:
+        assert self.diff_base is not None
+        return get_backend(self._repo).diff_tree(self.diff_base, self._ref.new_rev, paths, patch, self._renames)
+
+    def _list_diff(self, changes: List[FileChange], patch: bool) -> List[FileChange]:
+        return list(self._iter_diff(changes, patch))
+
+    def _list_diff_paths(self, paths: List[str]) -> List[FileChange]:
+        return list(self._iter_diff_paths(paths))
+
 
 def parse_ref(line: str) -> GitRef:
     old_rev, new_rev, ref = line.split()
     return GitRef(old_rev, new_rev, ref)
 
 
-def parse_diff_ranges(diff_text: str):
-    ranges = []
-    pattern = re.compile(r"@@ -\d+,?\d* \+(\d+),?(\d*) @@")
+def parse_diff_ranges(diff_text: str) -> List[Tuple[int, int]]:
+    """
+    :return: coalesced `(start, end)` new side line ranges changed by hunks of the diff.
+    """
+    return list(LineIntervals.from_hunks(diff_text))
+
+
+@dataclass(slots=True)
+class ObjectInfo:
+    hexsha: str
+    type: str
+    size: int
+
+
+class GitObjectReader:
+    """
+    Reads objects through long-lived `git cat-file --batch` and `--batch-check` processes.
+    Requests are written in chunks ahead of reading the responses, so many objects cost one round trip.
+    A reader is shared by concurrently executed plugins, a chunk of requests and its responses are exchanged under
+    a lock, so streams of different threads never interleave.
+    """
+
+    # A hexsha request line is 41 bytes, so a chunk fits into the pipe buffer and writing it never blocks.
+    _pipeline_chunk_size = 256
+
+    def __init__(self, git_repo: Repo):
+        self._cwd = git_repo.working_dir
+        self._processes: Dict[str, Popen] = {}
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _ensure_process(self, mode: str) -> Popen:
+        process = self._processes.get(mode)
+        if process is None or process.poll() is not None:
+            process = Popen(["git", "cat-file", mode], stdin=PIPE, stdout=PIPE, cwd=self._cwd)
+            self._processes[mode] = process
+        return process
+
+    @staticmethod
+    def _read_header(process: Popen, name: str) -> Optional[ObjectInfo]:
+        assert process.stdout
+        header = process.stdout.readline()
+        if not header:
+            raise ValueError(f"git cat-file exited while reading object '{name}'")
+        # Missing objects are reported with a single `<name> missing` line without content, the name may have spaces.
+        if header.endswith((b" missing\n", b" ambiguous\n")):
+            return None
+        hexsha, object_type, size = header.decode().split()
+        return ObjectInfo(hexsha, object_type, int(size))
+
+    @classmethod
+    def _read_content(cls, process: Popen, name: str) -> bytes:
+        assert process.stdout
+        info = cls._read_header(process, name)
+        if info is None:
+            raise ValueError(f"Object '{name}' is missing")
+        data = process.stdout.read(info.size)
+        # Every object content is followed by a line feed.
+        process.stdout.read(1)
+        return data
+
+    def read(self, name: str) -> bytes:
+        """
+        :return: raw content of the object, e.g. a blob hexsha or `<rev>:<path>`.
+        """
+        for _, data in self.read_many([name]):
+            return data
+        raise ValueError(f"Object '{name}' is missing")
+
+    def read_many(self, names: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """
+        Pipelines requests for all objects and yields `(name, content)` pairs in request order.
+        """
+        return self._pipeline("--batch", names, self._read_content)
+
+    def info(self, name: str) -> Optional[ObjectInfo]:
+        """
+        :return: id, type and size of the object without reading its content, None if it is missing.
+        """
+        for _, info in self.info_many([name]):
+            return info
+        return None
+
+    def info_many(self, names: Iterable[str]) -> Iterator[Tuple[str, Optional[ObjectInfo]]]:
+        """
+        Pipelines `--batch-check` requests and yields `(name, info)` pairs in request order.
+        """
+        return self._pipeline("--batch-check", names, self._read_header)
+
+    def stream_blob(self, name: str, chunk_size: int = 1 << 16) -> Generator[bytes, None, None]:
+        """
+        Yields blob content in chunks, so large blobs are never loaded whole.
+        A dedicated `git cat-file blob` process is used, so the batch processes stay in sync and an early stop
+        only kills the dedicated process.
+        """
+        process = Popen(["git", "cat-file", "blob", name], stdout=PIPE, stderr=DEVNULL, cwd=self._cwd)
+        assert process.stdout
+        try:
+            while data := process.stdout.read(chunk_size):
+                yield data
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise ValueError(f"Blob '{name}' is missing")
+
+    def _pipeline(self, mode: str, names: Iterable[str], read_response: Callable[[Popen, str], Any]) -> Iterator:
+        chunk: List[str] = []
+        for name in names:
+            chunk.append(name)
+            if len(chunk) == self._pipeline_chunk_size:
+                yield from self._read_chunk(mode, chunk, read_response)
+                chunk = []
+        if chunk:
+            yield from self._read_chunk(mode, chunk, read_response)
+
+    def _read_chunk(self, mode: str, chunk: List[str], read_response: Callable[[Popen, str], Any]) -> List:
+        # Responses have to be consumed even if one of them is missing, otherwise the stream gets out of sync.
+        responses = []
+        error: Optional[ValueError] = None
+        with self._lock:
+            process = self._ensure_process(mode)
+            assert process.stdin
+            process.stdin.write("".join(f"{name}\n" for name in chunk).encode())
+            process.stdin.flush()
+            for name in chunk:
+                try:
+                    responses.append((name, read_response(process, name)))
+                except ValueError as e:
+                    error = error or e
+        if error:
+            raise error
+        return responses
 
-    for line in diff_text.splitlines():
-        match = pattern.match(line)
+    def close(self) -> None:
+        with self._lock:
+            processes = self._processes
+            self._processes = {}
+        for process in processes.values():
+            if process.stdin:
+                process.stdin.close()
+            if process.stdout:
+                process.stdout.close()
+            process.wait()
 
-        if not match:
+
+def object_directories(git_repo: Repo) -> List[Path]:
+    """
+    Object directories in lookup order like git uses: the pre-receive quarantine (`GIT_OBJECT_DIRECTORY`),
+    the repository objects, `GIT_ALTERNATE_OBJECT_DIRECTORIES` and `info/alternates` of each directory.
+    """
+    cwd = Path(git_repo.working_dir)
+    primary = os.getenv("GIT_OBJECT_DIRECTORY") or os.getenv("GIT_QUARANTINE_PATH")
+    candidates = [cwd / primary] if primary else []
+    candidates.append(Path(git_repo.common_dir) / "objects")
+    candidates.extend(
+        cwd / path for path in os.getenv("GIT_ALTERNATE_OBJECT_DIRECTORIES", "").split(os.pathsep) if path
+    )
+
+    directories: List[Path] = []
+    while candidates:
+        directory = candidates.pop(0).resolve()
+        if directory in directories or not directory.is_dir():
             continue
+        directories.append(directory)
+        alternates = directory / "info" / "alternates"
+        if alternates.exists():
+            for line in alternates.read_text().splitlines():
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    candidates.append(directory / line)
+    return directories
+
+
+class MappedObjectReader(GitObjectReader):
+    """
+    Reads objects in-process from memory-mapped packs and loose objects, without spawning git.
+    Requests the store cannot serve (revision expressions, objects it cannot find) go to the git processes.
+    """
+
+    def __init__(self, git_repo: Repo):
+        super().__init__(git_repo)
+        object_format = git_repo.config_reader().get_value("extensions", "objectformat", "sha1")
+        if object_format != "sha1":
+            raise ValueError(f"Object format '{object_format}' is not supported")
+        self._store = ObjectStore(object_directories(git_repo))
+
+    def read_many(self, names: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        return self._serve(names, self._read_stored, super().read_many)
+
+    def info_many(self, names: Iterable[str]) -> Iterator[Tuple[str, Optional[ObjectInfo]]]:
+        return self._serve(names, self._info_stored, super().info_many)
+
+    def stream_blob(self, name: str, chunk_size: int = 1 << 16) -> Generator[bytes, None, None]:
+        with self._lock:
+            chunks = self._store.stream(name) if _g_hexsha_pattern.fullmatch(name) else None
+        if chunks is None:
+            yield from super().stream_blob(name, chunk_size)
+            return
+        for chunk in chunks:
+            for offset in range(0, len(chunk), chunk_size):
+                yield chunk[offset : offset + chunk_size]
+
+    def _read_stored(self, name: str) -> Optional[bytes]:
+        found = self._store.read(name)
+        return found[1] if found else None
+
+    def _info_stored(self, name: str) -> Optional[ObjectInfo]:
+        found = self._store.info(name)
+        return ObjectInfo(name, *found) if found else None
 
-        start = int(match.group(1))
-        length = int(match.group(2)) if match.group(2) else 1
+    def _serve(
+        self, names: Iterable[str], lookup: Callable[[str], Any], fallback: Callable[[List[str]], Iterator]
+    ) -> Iterator:
+        chunk: List[str] = []
+        for name in names:
+            chunk.append(name)
+            if len(chunk) == self._pipeline_chunk_size:
+                yield from self._serve_chunk(chunk, lookup, fallback)
+                chunk = []
+        if chunk:
+            yield from self._serve_chunk(chunk, lookup, fallback)
 
-        if length > 0:
-            end = start + length - 1
-            ranges.append((start, end))
+    def _serve_chunk(self, chunk: List[str], lookup: Callable[[str], Any], fallback: Callable[[List[str]], Iterator]):
+        # The store keeps a cache of delta bases, lookups of different threads are serialized.
+        with self._lock:
+            found = [lookup(name) if _g_hexsha_pattern.fullmatch(name) else None for name in chunk]
+        missing = iter(fallback([name for name, result in zip(chunk, found) if result is None]))
+        for name, result in zip(chunk, found):
+            yield (name, result) if result is not None else next(missing)
 
-    return ranges
+    def close(self) -> None:
+        super().close()
+        if hasattr(self, "_store"):
+            self._store.close()
 
 
-def blob_from_hexsha(repo: Repo, hexsha: str) -> bytes:
-    data = repo.git.cat_file("blob", hexsha).encode()
+def open_object_reader(git_repo: Repo) -> GitObjectReader:
+    """
+    Opens the object reader selected with `DGIS_HOOKS_OBJECT_BACKEND`: `git` reads objects through git processes,
+    `mmap` reads them in-process and falls back to git if the repository is not supported.
+    By default the reader of the git backend (see `get_backend`) is used.
+    """
+    backend = os.getenv(g_object_backend_env, "").lower()
+    if backend == "mmap":
+        try:
+            return MappedObjectReader(git_repo)
+        except (OSError, ValueError) as error:
+            log_warning(f"Falling back to git object reader, mapped reader is not available: {error}")
+    elif not backend:
+        return get_backend(git_repo).open_object_reader()
+    elif backend != "git":
+        log_warning(f"Unknown object backend '{backend}', using git object reader")
+    return GitObjectReader(git_repo)
+
+
+def blob_from_hexsha(objects: Union[GitObjectReader, Repo], hexsha: str) -> bytes:
+    """
+    :param objects: object reader of the repository, or the repository itself to read a single blob.
+    """
+    if isinstance(objects, Repo):
+        with GitObjectReader(objects) as reader:
+            data = reader.read(hexsha)
+    else:
+        data = objects.read(hexsha)
+    # Keep the content formatters used to get through `Repo.git`, which drops one trailing line feed.
+    if data.endswith(b"\n"):
+        data = data[:-1]
     if data and not data.endswith(b"\n"):
         data += b"\n"
     return data
+
+
+class GitBackend(ABC):
+    """
+    Narrow interface of git operations on hot paths of checks. Implementations are chosen with `get_backend`.
+    """
+
+    name = ""
+
+    # Whether tree diffs may be split into shards generated concurrently, see `ChangeSet`.
+    concurrent_diff = False
+
+    def __init__(self, git_repo: Repo):
+        self._repo = git_repo
+
+    @abstractmethod
+    def rev_walk(self, tips: List[str]) -> Dict[str, List[str]]:
+        """
+        :return: commits reachable from tips but not from existing refs, mapped to their parents,
+        in reverse chronological order.
+        """
+
+    @abstractmethod
+    def rev_range(self, old_rev: str, new_rev: str) -> List[str]:
+        """
+        :return: commits reachable from `new_rev` but not from `old_rev`, in reverse chronological order.
+        """
+
+    @abstractmethod
+    def is_ancestor(self, ancestor_rev: str, rev: str) -> bool:
+        """
+        :return: True if `ancestor_rev` is `rev` or one of its ancestors.
+        """
+
+    @abstractmethod
+    def diff_tree(
+        self,
+        base: str,
+        new_rev: str,
+        paths: Optional[List[str]] = None,
+        patch: bool = False,
+        renames: RenamePolicy = RenamePolicy(),
+    ) -> Iterator[FileChange]:
+        """
+        Recursive tree diff in git order, see `iter_diff_tree` for parameters.
+        """
+
+    @abstractmethod
+    def open_object_reader(self) -> GitObjectReader:
+        """
+        :return: reader for blob contents (`read_many`) and batch metadata (`info_many`).
+        """
+
+
+class CliGitBackend(GitBackend):
+    """
+    Runs git processes, every operation works with any repository git itself supports.
+    """
+
+    name = "cli"
+    concurrent_diff = True
+
+    def rev_walk(self, tips: List[str]) -> Dict[str, List[str]]:
+        process = run(
+            ["git", "rev-list", "--parents", "--stdin", "--not", "--all"],
+            input="".join(f"{tip}\n" for tip in tips).encode(),
+            capture_output=True,
+            check=True,
+            cwd=self._repo.working_dir,
+        )
+        parents = {}
+        for line in process.stdout.decode().splitlines():
+            commit, *commit_parents = line.split()
+            parents[commit] = commit_parents
+        return parents
+
+    def rev_range(self, old_rev: str, new_rev: str) -> List[str]:
+        rev_list = self._repo.git.rev_list(new_rev, f"^{old_rev}")
+        return rev_list.split("\n") if rev_list else []
+
+    def is_ancestor(self, ancestor_rev: str, rev: str) -> bool:
+        try:
+            self._repo.git.merge_base("--is-ancestor", ancestor_rev, rev)
+        except GitCommandError as error:
+            # Exit status 1 means "not an ancestor", anything else is a real error.
+            if error.status == 1:
+                return False
+            raise
+        return True
+
+    def diff_tree(
+        self,
+        base: str,
+        new_rev: str,
+        paths: Optional[List[str]] = None,
+        patch: bool = False,
+        renames: RenamePolicy = RenamePolicy(),
+    ) -> Iterator[FileChange]:
+        return iter_diff_tree(self._repo, base, new_rev, paths, patch, renames)
+
+    def open_object_reader(self) -> GitObjectReader:
+        return GitObjectReader(self._repo)
+
+
+_g_backends: "WeakKeyDictionary[Repo, GitBackend]" = WeakKeyDictionary()
+_g_backends_lock = threading.Lock()
+
+
+def get_backend(git_repo: Repo) -> GitBackend:
+    """
+    Returns the backend of the repository selected with `DGIS_HOOKS_GIT_BACKEND`: `cli` (default) runs git
+    processes, `pygit2` runs operations in-process with libgit2 and falls back to `cli` if pygit2 is not installed.
+    """
+    with _g_backends_lock:
+        backend = _g_backends.get(git_repo)
+        if backend is None:
+            backend = _make_backend(git_repo)
+            _g_backends[git_repo] = backend
+        return backend
+
+
+def _make_backend(git_repo: Repo) -> GitBackend:
+    name = os.getenv(g_git_backend_env, CliGitBackend.name).lower()
+    if name == "pygit2":
+        try:
+            import pygit2
+
+            from dgis.hooks.utility.pygit2_backend import Pygit2GitBackend
+        except ImportError as error:
+            log_warning(f"Falling back to '{CliGitBackend.name}' git backend, pygit2 is not available: {error}")
+        else:
+            try:
+                return Pygit2GitBackend(git_repo)
+            except (pygit2.GitError, OSError) as error:
+                log_warning(
+                    f"Falling back to '{CliGitBackend.name}' git backend, libgit2 failed to open repository: {error}"
+                )
+    elif name != CliGitBackend.name:
+        log_warning(f"Unknown git backend '{name}', using '{CliGitBackend.name}'")
+    return CliGitBackend(git_repo)
@@ -1,6 +1,9 @@
 import enum
 import logging
-from typing import Optional
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
 
 _log: Optional[logging.Logger] = None
 
@@ -40,22 +43,55 @@ def init_log(name: str, level: LogLevel = LogLevel.Info) -> logging.Logger:
     return _log
 
 
-def _get_logger() -> logging.Logger:
+def get_logger() -> logging.Logger:
     # Return the configured logger if present, otherwise a default logger
     return _log if _log is not None else logging.getLogger(__name__)
 
 
 def log_debug(message: str) -> None:
-    _get_logger().debug(message)
+    get_logger().debug(message)
 
 
 def log_info(message: str) -> None:
-    _get_logger().info(message)
+    get_logger().info(message)
 
 
 def log_warning(message: str) -> None:
-    _get_logger().warning(message)
+    get_logger().warning(message)
 
 
 def log_error(message: str) -> None:
-    _get_logger().error(message)
+    get_logger().error(message)
+
+
+class ThreadLogBuffer(logging.Filter):
+    """
+    Holds back records logged by threads which capture their output, so logs of concurrent tasks
+    do not interleave. Installed as a filter of loggers, records of other threads and tasks pass through.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._records: ContextVar[Optional[List[logging.LogRecord]]] = ContextVar(
+            f"log_buffer_{id(self)}", default=None
+        )
+
+    @contextmanager
+    def capture(self) -> Iterator[List[logging.LogRecord]]:
+        """
+        Captures records logged by the current thread or task into the yielded list until the block exits.
+        Tasks started by the task and work passed to executors with its context are captured as well.
+        """
+        records: List[logging.LogRecord] = []
+        token = self._records.set(records)
+        try:
+            yield records
+        finally:
+            self._records.reset(token)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        records = self._records.get()
+        if records is None:
+            return True
+        records.append(record)
+        return False
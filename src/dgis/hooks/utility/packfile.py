@@ -0,0 +1,369 @@
+import mmap
+import struct
+import zlib
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple, Union
+
+# Types of undeltified pack entries, the same ids are used in loose object headers by name.
+_g_pack_types = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+_g_ofs_delta = 6
+_g_ref_delta = 7
+
+_g_index_header = b"\377tOc\0\0\0\2"
+_g_sha_size = 20
+
+# Compressed data is fed to zlib in slices of the mapping, so unconsumed input is never copied whole.
+_g_inflate_chunk_size = 64 * 1024
+
+# Delta bases are usually shared by many objects of a push, keep the recently resolved ones.
+_g_base_cache_size = 32 * 1024 * 1024
+
+
+def _iter_inflate(data: memoryview) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj()
+    offset = 0
+    while not decompressor.eof:
+        chunk = data[offset : offset + _g_inflate_chunk_size]
+        if not chunk:
+            raise ValueError("Truncated zlib stream")
+        offset += len(chunk)
+        inflated = decompressor.decompress(chunk)
+        if inflated:
+            yield inflated
+
+
+def _inflate(data: memoryview) -> bytes:
+    return b"".join(_iter_inflate(data))
+
+
+def _inflate_prefix(data: memoryview, size: int) -> bytes:
+    prefix = b""
+    for inflated in _iter_inflate(data):
+        prefix += inflated
+        if len(prefix) >= size:
+            break
+    return prefix
+
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def _apply_delta(base: bytes, delta: bytes) -> bytes:
+    """
+    :return: object content built from the base with copy and insert instructions of the delta.
+    """
+    source_size, offset = _read_varint(delta, 0)
+    target_size, offset = _read_varint(delta, offset)
+    if source_size != len(base):
+        raise ValueError(f"Delta base size mismatch: {source_size} != {len(base)}")
+    source = memoryview(base)
+    target = bytearray()
+    while offset < len(delta):
+        op = delta[offset]
+        offset += 1
+        if op & 0x80:
+            copy_offset = 0
+            for i in range(4):
+                if op & (1 << i):
+                    copy_offset |= delta[offset] << (8 * i)
+                    offset += 1
+            copy_size = 0
+            for i in range(3):
+                if op & (0x10 << i):
+                    copy_size |= delta[offset] << (8 * i)
+                    offset += 1
+            target += source[copy_offset : copy_offset + (copy_size or 0x10000)]
+        elif op:
+            target += delta[offset : offset + op]
+            offset += op
+        else:
+            raise ValueError("Unexpected delta instruction")
+    if len(target) != target_size:
+        raise ValueError(f"Delta target size mismatch: {target_size} != {len(target)}")
+    return bytes(target)
+
+
+class PackIndex:
+    """
+    Version 2 pack index mapped into memory, objects are looked up with a binary search in the fanout range.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(_g_index_header)] != _g_index_header:
+            self._map.close()
+            raise ValueError(f"Unsupported pack index '{path}'")
+        self._fanout = struct.unpack_from(">256I", self._map, len(_g_index_header))
+        count = self._fanout[255]
+        self._names = len(_g_index_header) + 256 * 4
+        # Names are followed by CRC32 of entries, then by 31-bit offsets and 64-bit offsets for large packs.
+        self._offsets = self._names + count * (_g_sha_size + 4)
+        self._large_offsets = self._offsets + count * 4
+
+    def find(self, binsha: bytes) -> Optional[int]:
+        """
+        :return: offset of the object in the pack, None if the pack does not contain it.
+        """
+        low = self._fanout[binsha[0] - 1] if binsha[0] else 0
+        high = self._fanout[binsha[0]]
+        while low < high:
+            middle = (low + high) // 2
+            position = self._names + middle * _g_sha_size
+            name = self._map[position : position + _g_sha_size]
+            if name < binsha:
+                low = middle + 1
+            elif name > binsha:
+                high = middle
+            else:
+                return self._offset(middle)
+        return None
+
+    def _offset(self, position: int) -> int:
+        (offset,) = struct.unpack_from(">I", self._map, self._offsets + position * 4)
+        if offset & 0x80000000:
+            (offset,) = struct.unpack_from(">Q", self._map, self._large_offsets + (offset & 0x7FFFFFFF) * 8)
+        return offset
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class PackFile:
+    def __init__(self, path: Path):
+        self.path = path
+        self.index = PackIndex(path.with_suffix(".idx"))
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != b"PACK":
+            self.close()
+            raise ValueError(f"Unsupported pack '{path}'")
+        self.view = memoryview(self._map)
+
+    def entry_header(self, offset: int) -> Tuple[int, int, int]:
+        """
+        :return: type id, size of inflated data and offset of data following the header.
+        """
+        byte = self._map[offset]
+        offset += 1
+        type_id = (byte >> 4) & 0x7
+        size = byte & 0xF
+        shift = 4
+        while byte & 0x80:
+            byte = self._map[offset]
+            offset += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+        return type_id, size, offset
+
+    def delta_base(self, type_id: int, entry_offset: int, offset: int) -> Tuple[Union[int, bytes], int]:
+        """
+        :return: offset of the base in this pack (OFS_DELTA) or its binary sha (REF_DELTA), and offset of delta data.
+        """
+        if type_id == _g_ref_delta:
+            return bytes(self._map[offset : offset + _g_sha_size]), offset + _g_sha_size
+        byte = self._map[offset]
+        offset += 1
+        distance = byte & 0x7F
+        while byte & 0x80:
+            byte = self._map[offset]
+            offset += 1
+            distance = ((distance + 1) << 7) | (byte & 0x7F)
+        return entry_offset - distance, offset
+
+    def close(self) -> None:
+        if hasattr(self, "view"):
+            self.view.release()
+        if hasattr(self, "_map"):
+            self._map.close()
+        self.index.close()
+
+
+class ObjectStore:
+    """
+    Reads objects straight from object directories: packs and their indexes are mapped into memory and inflated
+    in-process, deltas are resolved with a small cache of bases. Only SHA-1 repositories are supported.
+    Lookup methods return None for objects the store cannot find, so callers can fall back to git.
+    """
+
+    def __init__(self, object_dirs: List[Path]):
+        self._object_dirs = object_dirs
+        self._packs: List[PackFile] = []
+        self._pack_paths: Set[Path] = set()
+        self._base_cache: OrderedDict[Tuple[int, int], Tuple[str, bytes]] = OrderedDict()
+        self._base_cache_size = 0
+        self._scan_packs()
+
+    def _scan_packs(self) -> bool:
+        """
+        Maps packs that are not mapped yet, e.g. packs written by a concurrent repack.
+        :return: True if new packs were found.
+        """
+        found = False
+        for object_dir in self._object_dirs:
+            for path in sorted((object_dir / "pack").glob("*.pack")):
+                if path in self._pack_paths or not path.with_suffix(".idx").exists():
+                    continue
+                self._pack_paths.add(path)
+                try:
+                    self._packs.append(PackFile(path))
+                    found = True
+                except (OSError, ValueError):
+                    continue
+        return found
+
+    def _find_packed(self, binsha: bytes) -> Optional[Tuple[int, int]]:
+        for _ in range(2):
+            for pack_id, pack in enumerate(self._packs):
+                offset = pack.index.find(binsha)
+                if offset is not None:
+                    return pack_id, offset
+            if not self._scan_packs():
+                break
+        return None
+
+    def _loose_path(self, hexsha: str) -> Optional[Path]:
+        for object_dir in self._object_dirs:
+            path = object_dir / hexsha[:2] / hexsha[2:]
+            if path.exists():
+                return path
+        return None
+
+    def read(self, hexsha: str) -> Optional[Tuple[str, bytes]]:
+        """
+        :return: type and content of the object.
+        """
+        binsha = bytes.fromhex(hexsha)
+        packed = self._find_packed(binsha)
+        if packed is not None:
+            return self._read_packed(*packed)
+        path = self._loose_path(hexsha)
+        if path is None:
+            return None
+        header, _, data = zlib.decompress(path.read_bytes()).partition(b"\0")
+        return header.split()[0].decode(), data
+
+    def info(self, hexsha: str) -> Optional[Tuple[str, int]]:
+        """
+        :return: type and size of the object, content is inflated only for delta headers.
+        """
+        binsha = bytes.fromhex(hexsha)
+        packed = self._find_packed(binsha)
+        if packed is not None:
+            return self._info_packed(*packed)
+        path = self._loose_path(hexsha)
+        if path is None:
+            return None
+        with open(path, "rb") as file:
+            header = _inflate_prefix(memoryview(file.read(_g_inflate_chunk_size)), 64).partition(b"\0")[0]
+        type_name, size = header.split()
+        return type_name.decode(), int(size)
+
+    def stream(self, hexsha: str) -> Optional[Iterator[bytes]]:
+        """
+        :return: content chunks of an undeltified object, None for deltas and missing objects.
+        """
+        packed = self._find_packed(bytes.fromhex(hexsha))
+        if packed is not None:
+            pack = self._packs[packed[0]]
+            type_id, _, offset = pack.entry_header(packed[1])
+            if type_id in (_g_ofs_delta, _g_ref_delta):
+                return None
+            return _iter_inflate(pack.view[offset:])
+        path = self._loose_path(hexsha)
+        if path is None:
+            return None
+        return self._stream_loose(path)
+
+    @staticmethod
+    def _stream_loose(path: Path) -> Iterator[bytes]:
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                header_read = False
+                for inflated in _iter_inflate(view):
+                    if not header_read:
+                        # Loose object headers are short, so the first inflated chunk always contains the header.
+                        inflated = inflated.partition(b"\0")[2]
+                        header_read = True
+                    if inflated:
+                        yield inflated
+
+    def _read_packed(self, pack_id: int, offset: int) -> Tuple[str, bytes]:
+        deltas: List[Tuple[int, int, int]] = []
+        while True:
+            cached = self._base_cache.get((pack_id, offset))
+            if cached is not None:
+                self._base_cache.move_to_end((pack_id, offset))
+                type_name, data = cached
+                break
+            pack = self._packs[pack_id]
+            type_id, _, data_offset = pack.entry_header(offset)
+            if type_id not in (_g_ofs_delta, _g_ref_delta):
+                type_name, data = _g_pack_types[type_id], _inflate(pack.view[data_offset:])
+                if deltas:
+                    self._cache_base((pack_id, offset), type_name, data)
+                break
+            base, data_offset = pack.delta_base(type_id, offset, data_offset)
+            deltas.append((pack_id, offset, data_offset))
+            if isinstance(base, int):
+                offset = base
+                continue
+            resolved = self.read(base.hex())
+            if resolved is None:
+                raise ValueError(f"Delta base '{base.hex()}' is missing")
+            type_name, data = resolved
+            break
+        for pack_id, offset, data_offset in reversed(deltas):
+            data = _apply_delta(data, _inflate(self._packs[pack_id].view[data_offset:]))
+            # Every object of the chain but the requested one is a base of another object.
+            if (pack_id, offset) != deltas[0][:2]:
+                self._cache_base((pack_id, offset), type_name, data)
+        return type_name, data
+
+    def _info_packed(self, pack_id: int, offset: int) -> Tuple[str, int]:
+        pack = self._packs[pack_id]
+        type_id, size, data_offset = pack.entry_header(offset)
+        if type_id not in (_g_ofs_delta, _g_ref_delta):
+            return _g_pack_types[type_id], size
+        # The delta header holds sizes of the base and the target, the type is the one of the chain base.
+        base, data_offset = pack.delta_base(type_id, offset, data_offset)
+        delta_header = _inflate_prefix(pack.view[data_offset:], 20)
+        _, header_offset = _read_varint(delta_header, 0)
+        target_size, _ = _read_varint(delta_header, header_offset)
+        while isinstance(base, int):
+            type_id, _, data_offset = pack.entry_header(base)
+            if type_id not in (_g_ofs_delta, _g_ref_delta):
+                return _g_pack_types[type_id], target_size
+            base, _ = pack.delta_base(type_id, base, data_offset)
+        base_info = self.info(base.hex())
+        if base_info is None:
+            raise ValueError(f"Delta base '{base.hex()}' is missing")
+        return base_info[0], target_size
+
+    def _cache_base(self, key: Tuple[int, int], type_name: str, data: bytes) -> None:
+        if key in self._base_cache or len(data) > _g_base_cache_size // 4:
+            return
+        self._base_cache[key] = (type_name, data)
+        self._base_cache_size += len(data)
+        while self._base_cache_size > _g_base_cache_size:
+            _, (_, evicted) = self._base_cache.popitem(last=False)
+            self._base_cache_size -= len(evicted)
+
+    def close(self) -> None:
+        self._base_cache.clear()
+        self._base_cache_size = 0
+        for pack in self._packs:
+            pack.close()
+        self._packs = []
+        self._pack_paths = set()
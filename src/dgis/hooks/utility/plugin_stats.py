@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dgis.hooks.utility.log import log_warning
+
+
+@dataclass(frozen=True)
+class PluginCost:
+    """
+    Cost model of a plugin fitted to its recent runs: seconds ~ `per_file` * files + `per_byte` * bytes for plugins
+    checking files, and `per_run` for plugins checking the whole change.
+    """
+
+    runs: int
+    failures: int
+    per_run: float
+    per_file: float
+    per_byte: float
+
+    @property
+    def failure_rate(self) -> float:
+        """
+        :return: share of failed runs, smoothed so a few runs do not make a plugin never or always failing.
+        """
+        return (self.failures + 1) / (self.runs + 2)
+
+    def estimate(self, files: int, size: int) -> float:
+        """
+        :return: estimated seconds of a run checking `files` files of `size` bytes in total.
+        """
+        if self.per_file == 0 and self.per_byte == 0:
+            return self.per_run
+        return self.per_file * files + self.per_byte * size
+
+    @classmethod
+    def fit(cls, runs: List[Tuple[float, int, int, bool]]) -> "PluginCost":
+        """
+        Least squares fit of seconds to files and bytes of runs, falls back to seconds per file if the fit is
+        degenerate (e.g. a single run, or runs with proportional files and bytes).
+        :param runs: seconds, files, bytes and failure of every run.
+        """
+        failures = sum(1 for _, _, _, failed in runs if failed)
+        seconds = sum(run[0] for run in runs)
+        per_run = seconds / len(runs) if runs else 0.0
+        files = sum(run[1] for run in runs)
+        if not files:
+            return cls(len(runs), failures, per_run, 0.0, 0.0)
+
+        ff = sum(f * f for _, f, _, _ in runs)
+        bb = sum(float(b) * b for _, _, b, _ in runs)
+        fb = sum(float(f) * b for _, f, b, _ in runs)
+        tf = sum(t * f for t, f, _, _ in runs)
+        tb = sum(t * b for t, _, b, _ in runs)
+        determinant = ff * bb - fb * fb
+        if determinant > 1e-9 * ff * bb:
+            per_file = (tf * bb - tb * fb) / determinant
+            per_byte = (tb * ff - tf * fb) / determinant
+            if per_file >= 0 and per_byte >= 0:
+                return cls(len(runs), failures, per_run, per_file, per_byte)
+        return cls(len(runs), failures, per_run, seconds / files, 0.0)
+
+
+class PluginStats:
+    """
+    Recent runs of plugins in SQLite, shared by hook processes like the result cache. Runs of a plugin beyond
+    the history size are dropped, so estimates follow changes of plugins and tools.
+    Errors of the database are logged, plugins are then ordered without history.
+    """
+
+    # Writers of other processes are waited for up to this long before the run is not recorded.
+    _busy_timeout = 5.0
+    # Number of recent runs kept per plugin.
+    _history = 100
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _ensure_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, plugin TEXT NOT NULL, "
+                "finished REAL NOT NULL, seconds REAL NOT NULL, files INTEGER NOT NULL, bytes INTEGER NOT NULL, "
+                "failed INTEGER NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS runs_plugin ON runs (plugin, id)")
+            self._connection = connection
+        return self._connection
+
+    def record(self, plugin: str, seconds: float, files: int, size: int, failed: bool) -> None:
+        """
+        Records a finished run of the plugin which checked `files` files of `size` bytes in total.
+        """
+        try:
+            with self._lock:
+                connection = self._ensure_connection()
+                with connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute(
+                        "INSERT INTO runs (plugin, finished, seconds, files, bytes, failed) VALUES (?, ?, ?, ?, ?, ?)",
+                        (plugin, time.time(), seconds, files, size, int(failed)),
+                    )
+                    connection.execute(
+                        "DELETE FROM runs WHERE plugin = ? AND id NOT IN "
+                        "(SELECT id FROM runs WHERE plugin = ? ORDER BY id DESC LIMIT ?)",
+                        (plugin, plugin, self._history),
+                    )
+        except sqlite3.Error as error:
+            log_warning(f"Failed to record plugin run in '{self._path}' ({error})")
+
+    def costs(self) -> Dict[str, PluginCost]:
+        """
+        :return: cost models of plugins having recorded runs.
+        """
+        runs: Dict[str, List[Tuple[float, int, int, bool]]] = {}
+        try:
+            with self._lock:
+                rows = self._ensure_connection().execute("SELECT plugin, seconds, files, bytes, failed FROM runs")
+                for plugin, seconds, files, size, failed in rows:
+                    runs.setdefault(plugin, []).append((seconds, files, size, bool(failed)))
+        except sqlite3.Error as error:
+            log_warning(f"Failed to read plugin runs from '{self._path}' ({error})")
+            return {}
+        return {plugin: PluginCost.fit(plugin_runs) for plugin, plugin_runs in runs.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
@@ -0,0 +1,294 @@
+import errno
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from subprocess import PIPE, CompletedProcess, Popen, TimeoutExpired
+from typing import Any, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from dgis.hooks.utility.log import log_warning
+
+try:
+    import resource
+except ImportError:
+    resource = None  # type: ignore[assignment]
+
+# Wall-clock seconds a plugin may run, `<env>_<PLUGIN CLASS NAME>` sets the limit of a single plugin.
+g_plugin_timeout_env = "DGIS_HOOKS_TIMEOUT"
+# Limits of every subprocess started by plugins: wall-clock seconds, CPU seconds and address space bytes.
+g_subprocess_timeout_env = "DGIS_HOOKS_SUBPROCESS_TIMEOUT"
+g_subprocess_cpu_time_env = "DGIS_HOOKS_SUBPROCESS_CPU_TIME"
+g_subprocess_memory_env = "DGIS_HOOKS_SUBPROCESS_MEMORY"
+
+
+class Cancelled(Exception):
+    """
+    Raised by subprocess calls of a cancelled `ProcessGroup`, the work of the caller is no longer needed.
+    """
+
+
+class DeadlineReached(Cancelled):
+    """
+    Raised once the time budget of the whole run is spent, the work of the caller is deferred.
+    """
+
+
+class TimedOut(Exception):
+    """
+    Raised once a plugin exceeds its time limit, or a subprocess exceeds its wall-clock or CPU time limit.
+    """
+
+
+# Sets resource limits given as arguments (empty if not limited) and executes the rest of the arguments.
+# Hard limits are lowered to the limits, they are never raised above the limits the hook process has.
+_g_limits_wrapper = """
+import os, resource, sys
+
+def limit(kind, soft, hard):
+    current = resource.getrlimit(kind)[1]
+    if current != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current), min(hard, current)
+    resource.setrlimit(kind, (soft, hard))
+
+cpu_time, address_space, *args = sys.argv[1:]
+if cpu_time:
+    limit(resource.RLIMIT_CPU, int(cpu_time), int(cpu_time) + 1)
+if address_space:
+    limit(resource.RLIMIT_AS, int(address_space), int(address_space))
+try:
+    os.execvp(args[0], args)
+except OSError as error:
+    sys.stderr.write(f"{args[0]}: {error}\\n")
+    sys.exit(127)
+"""
+
+
+@dataclass(frozen=True)
+class ProcessLimits:
+    # Wall-clock seconds, the process tree is killed once they pass.
+    timeout: Optional[float] = None
+    # CPU seconds (RLIMIT_CPU) and address space bytes (RLIMIT_AS) of the process.
+    cpu_time: Optional[int] = None
+    address_space: Optional[int] = None
+
+    def command(self, args: Sequence[str], env: Optional[Mapping[str, str]] = None) -> List[str]:
+        """
+        Resource limits are set by a wrapper in the child before it executes the command, so they hold from its first
+        instruction and no Python code runs between fork and exec in a threaded parent. Limits are not applied where
+        the `resource` module is not available (e.g. on Windows).
+        :return: command running `args` within the limits. Raises FileNotFoundError if the program is not found in
+        PATH of `env`, as starting it directly would.
+        """
+        if (self.cpu_time is None and self.address_space is None) or resource is None:
+            return list(args)
+        program = args[0]
+        if os.sep not in program:
+            path = (env if env is not None else os.environ).get("PATH", os.defpath)
+            if shutil.which(program, path=path) is None:
+                raise FileNotFoundError(errno.ENOENT, "No such file or directory", program)
+        cpu_time = str(self.cpu_time) if self.cpu_time is not None else ""
+        address_space = str(self.address_space) if self.address_space is not None else ""
+        return [sys.executable, "-I", "-S", "-c", _g_limits_wrapper, cpu_time, address_space, *args]
+
+
+def plugin_limit(env: str, plugin_name: str, default: Optional[float]) -> Optional[float]:
+    """
+    :return: limit of the plugin configured with `<env>_<PLUGIN CLASS NAME>` or `<env>`, None if not limited.
+    Non-positive values disable the limit.
+    """
+    for env_name in (f"{env}_{plugin_name.upper()}", env):
+        value = os.getenv(env_name)
+        if not value:
+            continue
+        try:
+            limit = float(value)
+        except ValueError:
+            log_warning(f"Ignoring invalid limit {env_name}='{value}'")
+            continue
+        return limit if limit > 0 else None
+    return default
+
+
+@dataclass
+class _Scope:
+    name: str
+    deadline: Optional[float]
+    limits: ProcessLimits
+    # Work of the scope may be deferred, only such scopes are bounded by the deadline of the group.
+    deferrable: bool
+
+
+class ProcessGroup:
+    """
+    Tracks subprocesses started by checks, so a cancelled run (e.g. fail-fast after a blocking failure) kills them
+    instead of waiting for every formatter to finish. Subprocesses are not started once the group is cancelled.
+
+    Every subprocess is started in a new session, so killing it also kills its children (e.g. clang-format started
+    by a wrapper script). Plugins run in a `limited` scope of their thread, which bounds their total
+    run time and applies resource limits to the subprocesses they start. A deadline of the group bounds deferrable
+    scopes and work outside of scopes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes: Set[Popen] = set()
+        self._cancelled = threading.Event()
+        self._scope_var: ContextVar[Optional[_Scope]] = ContextVar(f"process_scope_{id(self)}", default=None)
+        self._deadline: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def set_deadline(self, deadline: Optional[float]) -> None:
+        """
+        Sets `time.monotonic()` time after which work of the group raises `DeadlineReached`, None removes it.
+        """
+        self._deadline = deadline
+
+    def _scope(self) -> Optional[_Scope]:
+        return self._scope_var.get()
+
+    def _group_deadline(self, scope: Optional[_Scope]) -> Optional[float]:
+        return self._deadline if scope is None or scope.deferrable else None
+
+    @contextmanager
+    def limited(
+        self, name: str, timeout: Optional[float], limits: ProcessLimits = ProcessLimits(), deferrable: bool = False
+    ) -> Iterator[None]:
+        """
+        Limits work of the calling thread or task (a plugin named `name`) to `timeout` seconds, and its subprocesses
+        to `limits`. Work which is not `deferrable` runs to completion after the deadline of the group.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        token = self._scope_var.set(_Scope(name, deadline, limits, deferrable))
+        try:
+            yield
+        finally:
+            self._scope_var.reset(token)
+
+    def check(self) -> None:
+        """
+        Cancellation point for work not running in subprocesses, e.g. between files.
+        """
+        if self._cancelled.is_set():
+            raise Cancelled()
+        scope = self._scope()
+        deadline = self._group_deadline(scope)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineReached()
+        if scope is not None and scope.deadline is not None and time.monotonic() >= scope.deadline:
+            raise TimedOut(f"'{scope.name}' exceeded its time limit")
+
+    def cancel(self) -> None:
+        """
+        Kills running subprocesses of the group, callers waiting for them get `Cancelled`.
+        """
+        with self._lock:
+            self._cancelled.set()
+            processes = list(self._processes)
+        for process in processes:
+            _kill_tree(process)
+
+    def popen(self, args: Sequence[str], limits: ProcessLimits = ProcessLimits(), **kwargs) -> Popen:
+        """
+        Starts a tracked subprocess in a new session with resource `limits`, it must be passed to `release` once
+        finished. Processes are started outside of the lock, so threads of the group do not wait for each other.
+        """
+        self.check()
+        process = Popen(limits.command(args, kwargs.get("env")), start_new_session=True, **kwargs)
+        if self._track(process):
+            with process:
+                _kill_tree(process)
+            self.release(process)
+            raise Cancelled()
+        return process
+
+    def _track(self, process: Popen) -> bool:
+        """
+        Adds a started process to the group.
+        :return: True if the group was cancelled meanwhile, the caller has to kill the process.
+        """
+        with self._lock:
+            self._processes.add(process)
+            return self._cancelled.is_set()
+
+    def release(self, process: Popen) -> None:
+        with self._lock:
+            self._processes.discard(process)
+
+    def _limits(self, args: Sequence[str], limits: Optional[ProcessLimits]) -> Tuple[ProcessLimits, Optional[float]]:
+        """
+        :return: limits of a subprocess and its wall-clock timeout within deadlines of the scope and the group.
+        """
+        scope = self._scope()
+        if limits is None:
+            limits = scope.limits if scope is not None else ProcessLimits()
+        timeout = limits.timeout
+        for deadline in (scope.deadline if scope is not None else None, self._group_deadline(scope)):
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                timeout = remaining if timeout is None else min(timeout, remaining)
+        if timeout is not None and timeout <= 0:
+            self.check()
+            raise TimedOut(f"No time left to run '{args[0]}'")
+        return limits, timeout
+
+    def run(
+        self,
+        args: Sequence[str],
+        input: Optional[bytes] = None,
+        capture_output: bool = False,
+        text: bool = False,
+        check: bool = False,
+        limits: Optional[ProcessLimits] = None,
+        **kwargs,
+    ) -> CompletedProcess:
+        """
+        Tracked `subprocess.run`, limited by `limits` or the limits of the scope of the calling thread.
+        :return: completed process. Raises `Cancelled` if the group was cancelled while it was running, and
+        `TimedOut` (once the process tree is killed) if a time limit of the process or its scope was exceeded.
+        """
+        limits, timeout = self._limits(args, limits)
+        if capture_output:
+            kwargs["stdout"] = kwargs["stderr"] = PIPE
+        if input is not None:
+            kwargs["stdin"] = PIPE
+        process = self.popen(args, limits, text=text, **kwargs)
+        try:
+            with process:
+                try:
+                    stdout, stderr = process.communicate(input, timeout=timeout)
+                except TimeoutExpired:
+                    _kill_tree(process)
+                    process.communicate()
+                    self.check()
+                    raise TimedOut(f"'{args[0]}' exceeded the time limit of {timeout:.1f} s")
+        finally:
+            self.release(process)
+        self.check()
+        cpu_signals = (getattr(signal, "SIGXCPU", None), getattr(signal, "SIGKILL", None))
+        if limits.cpu_time is not None and -process.returncode in cpu_signals:
+            raise TimedOut(f"'{args[0]}' exceeded the CPU time limit of {limits.cpu_time} s")
+        completed: CompletedProcess[Any] = CompletedProcess(list(args), process.returncode, stdout, stderr)
+        if check:
+            completed.check_returncode()
+        return completed
+
+
+def _kill_tree(process: Popen) -> None:
+    """
+    Kills the process and the rest of its session.
+    """
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        process.kill()
@@ -0,0 +1,238 @@
+import threading
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pygit2
+
+from git import Repo
+from pygit2.enums import DiffFind, DiffOption, SortMode
+
+from dgis.hooks.utility.git import (
+    FileChange,
+    GitBackend,
+    GitObjectReader,
+    ObjectInfo,
+    RenameDetection,
+    RenamePolicy,
+    object_directories,
+)
+
+_g_object_types = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+
+# Marker lines like `\ No newline at end of file`, their content already holds the whole line.
+_g_marker_origins = ("<", ">", "=")
+
+
+class Pygit2ObjectReader(GitObjectReader):
+    """
+    Reads objects and their metadata in-process with libgit2, only streaming of large blobs spawns git.
+    """
+
+    def __init__(self, git_repo: Repo, repository: pygit2.Repository, lock: threading.RLock):
+        super().__init__(git_repo)
+        self._repository = repository
+        # The repository handle is shared with the backend, so is its lock.
+        self._lock = lock
+
+    def _resolve(self, name: str) -> Optional[pygit2.Oid]:
+        try:
+            return self._repository.revparse_single(name).id
+        except (KeyError, ValueError, pygit2.GitError):
+            return None
+
+    def _read(self, name: str) -> bytes:
+        with self._lock:
+            oid = self._resolve(name)
+            if oid is None:
+                raise ValueError(f"Object '{name}' is missing")
+            _, data = self._repository.odb.read(oid)
+        return data
+
+    def _info(self, name: str) -> Optional[ObjectInfo]:
+        with self._lock:
+            oid = self._resolve(name)
+            if oid is None:
+                return None
+            object_type, size = self._repository.odb.read_header(oid)
+        return ObjectInfo(str(oid), _g_object_types[int(object_type)], size)
+
+    def read_many(self, names: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        for name in names:
+            yield name, self._read(name)
+
+    def info_many(self, names: Iterable[str]) -> Iterator[Tuple[str, Optional[ObjectInfo]]]:
+        for name in names:
+            yield name, self._info(name)
+
+
+@dataclass
+class _TreeDiff:
+    key: Tuple[str, str, RenamePolicy]
+    diff: pygit2.Diff
+    deltas: List[pygit2.DiffDelta]
+    # Indexes of deltas by their old and new paths.
+    by_path: Dict[str, List[int]]
+
+
+class Pygit2GitBackend(GitBackend):
+    """
+    Runs operations in-process with libgit2, so hot paths do not fork git.
+    A libgit2 repository handle is not safe for concurrent use, every operation takes the backend lock and tree diffs
+    are not split between threads. libgit2 diffs take no pathspecs through pygit2, so the last tree diff is kept and
+    changes of paths (e.g. chunks of paths of a change set needing hunks) are selected from it.
+    """
+
+    name = "pygit2"
+
+    def __init__(self, git_repo: Repo):
+        super().__init__(git_repo)
+        self._repository = pygit2.Repository(str(git_repo.git_dir))
+        self._lock = threading.RLock()
+        self._last_diff: Optional[_TreeDiff] = None
+        # libgit2 ignores the quarantine and alternates environment of pre-receive hooks, add them explicitly.
+        own_objects = Path(git_repo.common_dir, "objects").resolve()
+        for directory in object_directories(git_repo):
+            if directory != own_objects:
+                self._repository.odb.add_disk_alternate(str(directory))
+
+    def _commit_id(self, rev: str) -> pygit2.Oid:
+        return self._repository.revparse_single(rev).peel(pygit2.Commit).id
+
+    def _tree(self, rev: str) -> pygit2.Tree:
+        return self._repository.revparse_single(rev).peel(pygit2.Tree)
+
+    def _walk(self, tips: Iterable[pygit2.Oid], hidden: Iterable[pygit2.Oid]) -> Iterator[pygit2.Commit]:
+        walker = self._repository.walk(None, SortMode.TOPOLOGICAL | SortMode.TIME)
+        for tip in tips:
+            walker.push(tip)
+        for oid in hidden:
+            walker.hide(oid)
+        return iter(walker)
+
+    def _ref_commits(self) -> Iterator[pygit2.Oid]:
+        names = list(self._repository.references)
+        if not self._repository.head_is_unborn:
+            names.append("HEAD")
+        for name in names:
+            try:
+                yield self._repository.references[name].peel(pygit2.Commit).id
+            except (KeyError, ValueError, pygit2.GitError):
+                # Refs to trees or blobs do not hide any commits.
+                continue
+
+    def rev_walk(self, tips: List[str]) -> Dict[str, List[str]]:
+        with self._lock:
+            commits = self._walk([self._commit_id(tip) for tip in tips], self._ref_commits())
+            return {str(commit.id): [str(parent) for parent in commit.parent_ids] for commit in commits}
+
+    def rev_range(self, old_rev: str, new_rev: str) -> List[str]:
+        with self._lock:
+            commits = self._walk([self._commit_id(new_rev)], [self._commit_id(old_rev)])
+            return [str(commit.id) for commit in commits]
+
+    def is_ancestor(self, ancestor_rev: str, rev: str) -> bool:
+        with self._lock:
+            ancestor, descendant = self._commit_id(ancestor_rev), self._commit_id(rev)
+            return ancestor == descendant or self._repository.descendant_of(descendant, ancestor)
+
+    def diff_tree(
+        self,
+        base: str,
+        new_rev: str,
+        paths: Optional[List[str]] = None,
+        patch: bool = False,
+        renames: RenamePolicy = RenamePolicy(),
+    ) -> Iterator[FileChange]:
+        """
+        Unlike git pathspecs, `paths` filter changes after rename detection, callers pass paths only when renames
+        are off or the base is empty.
+        """
+        with self._lock:
+            tree_diff = self._tree_diff(base, new_rev, renames)
+            diff = tree_diff.diff
+            if paths is None:
+                indexes: Iterable[int] = range(len(tree_diff.deltas))
+            else:
+                indexes = sorted({index for path in paths for index in tree_diff.by_path.get(path, ())})
+            deltas = [(index, tree_diff.deltas[index]) for index in indexes]
+            if not patch:
+                changes = [self._file_change(delta) for _, delta in deltas]
+        if not patch:
+            yield from changes
+            return
+        # Patches are generated one at a time, so only the patch of a single file is held in memory.
+        for index, delta in deltas:
+            with self._lock:
+                change = self._file_change(delta)
+                change.hunks = self._patch_hunks(diff, index, change)
+            yield change
+
+    def _tree_diff(self, base: str, new_rev: str, renames: RenamePolicy) -> "_TreeDiff":
+        """
+        Called under the lock.
+        :return: diff of the trees with renames found, the last diff is reused for the same trees and policy.
+        """
+        old_tree, new_tree = self._tree(base), self._tree(new_rev)
+        key = (str(old_tree.id), str(new_tree.id), renames)
+        if self._last_diff is not None and self._last_diff.key == key:
+            return self._last_diff
+        diff = old_tree.diff_to_tree(new_tree, flags=DiffOption.INCLUDE_TYPECHANGE, context_lines=0)
+        if renames.detection == RenameDetection.Exact:
+            diff.find_similar(flags=DiffFind.FIND_RENAMES | DiffFind.FIND_EXACT_MATCH_ONLY)
+        elif renames.detection == RenameDetection.Similarity:
+            diff.find_similar(
+                flags=DiffFind.FIND_RENAMES,
+                rename_threshold=renames.threshold,
+                rename_limit=renames.limit if renames.limit is not None else 0,
+            )
+        deltas = list(diff.deltas)
+        by_path: Dict[str, List[int]] = {}
+        for index, delta in enumerate(deltas):
+            by_path.setdefault(delta.new_file.path, []).append(index)
+            if delta.old_file.path != delta.new_file.path:
+                by_path.setdefault(delta.old_file.path, []).append(index)
+        self._last_diff = _TreeDiff(key, diff, deltas, by_path)
+        return self._last_diff
+
+    def _patch_hunks(self, diff: pygit2.Diff, index: int, change: FileChange) -> bytes:
+        delta_patch = diff[index]
+        if change.status == "T":
+            # Type changes have no hunks in libgit2, git prints the new content as a creation.
+            # The patch refers to the blob data, so the blob is kept alive until hunks are copied.
+            blob = self._repository[change.new_hexsha].peel(pygit2.Blob)
+            delta_patch = pygit2.Patch.create_from(None, blob, context_lines=0)
+        return self._hunks(delta_patch) if delta_patch is not None else b""
+
+    @staticmethod
+    def _file_change(delta: pygit2.DiffDelta) -> FileChange:
+        status = delta.status_char()
+        old_path = delta.old_file.path if status in "RC" else None
+        # Added and deleted sides have zero modes and ids, matching `git diff-tree --raw`.
+        return FileChange(
+            status,
+            delta.new_file.path if status != "D" else delta.old_file.path,
+            old_path,
+            f"{delta.old_file.mode:06o}",
+            f"{delta.new_file.mode:06o}",
+            str(delta.old_file.id),
+            str(delta.new_file.id),
+        )
+
+    @staticmethod
+    def _hunks(delta_patch: pygit2.Patch) -> bytes:
+        """
+        :return: hunks in the same form as `git diff-tree -p -U0` prints them, empty for binary content.
+        """
+        parts = []
+        for hunk in delta_patch.hunks:
+            parts.append(hunk.header.encode())
+            for line in hunk.lines:
+                if line.origin not in _g_marker_origins:
+                    parts.append(line.origin.encode())
+                parts.append(line.raw_content)
+        return b"".join(parts)
+
+    def open_object_reader(self) -> GitObjectReader:
+        return Pygit2ObjectReader(self._repo, self._repository, self._lock)
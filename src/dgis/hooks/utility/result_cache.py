@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from dgis.hooks.utility.log import log_debug, log_warning
+
+# Size cap of the result cache in bytes, least recently used results are evicted above it.
+g_result_cache_size_env = "DGIS_HOOKS_RESULT_CACHE_SIZE"
+
+_g_default_max_size = 256 * 1024 * 1024
+
+
+def result_cache_size() -> int:
+    value = os.getenv(g_result_cache_size_env)
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            log_warning(f"Invalid {g_result_cache_size_env} value '{value}', using {_g_default_max_size}")
+    return _g_default_max_size
+
+
+class ResultCache:
+    """
+        Results of checks of single files in SQLite, shared by hook processes of the server (or CI pipelines, if the cache
+        dir is kept between them). Results are addressed by a hash of everything a check depends on, see `key`, so
+        re-pushed and retried content is not checked again. Results are stored as JSON and never unpickled, so a shared
+    cache cannot run code in hooks reading it. Values which fail to load are misses, callers validate loaded data too.
+
+        The database is in WAL mode, so readers do not wait for writers, and concurrent writers wait for each other.
+        Errors of the cache (e.g. a locked or corrupt database) are logged, checks run as if the result was not cached.
+        Instances are picklable: a copy opens its own connection, e.g. in file task processes.
+    """
+
+    # Writers of other processes are waited for up to this long before the cache is skipped.
+    _busy_timeout = 5.0
+
+    def __init__(self, path: Path, namespace: str = "", max_size: Optional[int] = None):
+        self._path = path
+        self._namespace = namespace
+        self._max_size = max_size if max_size is not None else result_cache_size()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"path": self._path, "namespace": self._namespace, "max_size": self._max_size}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self._path = state["path"]
+        self._namespace = state["namespace"]
+        self._max_size = state["max_size"]
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def key(self, *parts: Any) -> str:
+        """
+        :return: key of a result depending on the parts (e.g. plugin, tool version, config and file blob hexsha),
+        and on the namespace of the cache (the hooks version).
+        """
+        digest = hashlib.sha256(self._namespace.encode())
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(str(part).encode())
+        return digest.hexdigest()
+
+    def _ensure_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self._connection = connection
+        return self._connection
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        :return: cached results (JSON data) by key, missing keys are not cached.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        found: Dict[str, Any] = {}
+        try:
+            with self._lock:
+                connection = self._ensure_connection()
+                rows: List = []
+                # Chunks stay below the limit of SQLite host parameters.
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start : start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows += connection.execute(
+                        f"SELECT key, value FROM results WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                if rows:
+                    connection.executemany(
+                        "UPDATE results SET used = ? WHERE key = ?", [(time.time(), key) for key, _ in rows]
+                    )
+        except sqlite3.Error as error:
+            log_warning(f"Failed to read result cache '{self._path}' ({error})")
+            return {}
+        for key, value in rows:
+            try:
+                found[key] = json.loads(value)
+            except ValueError as error:
+                log_debug(f"Skipping cached result which failed to load ({error})")
+        return found
+
+    def put_many(self, results: Dict[str, Any]) -> None:
+        """
+        Stores results (JSON data, e.g. of `PluginResultPayload.to_json`) by key, other results are not cached.
+        """
+        rows = []
+        now = time.time()
+        for key, result in results.items():
+            try:
+                value = json.dumps(result, separators=(",", ":")).encode()
+            except (TypeError, ValueError) as error:
+                log_debug(f"Skipping result which failed to serialize ({error})")
+                continue
+            rows.append((key, value, len(value), now))
+        if not rows:
+            return
+        try:
+            with self._lock:
+                connection = self._ensure_connection()
+                with connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows)
+        except sqlite3.Error as error:
+            log_warning(f"Failed to write result cache '{self._path}' ({error})")
+
+    def evict(self) -> None:
+        """
+        Drops least recently used results above the size cap.
+        """
+        try:
+            with self._lock:
+                connection = self._ensure_connection()
+                with connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    (total,) = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+                    if total <= self._max_size:
+                        return
+                    connection.execute(
+                        "DELETE FROM results WHERE key IN (SELECT key FROM "
+                        "(SELECT key, SUM(size) OVER (ORDER BY used DESC, key) AS total FROM results) WHERE total > ?)",
+                        (self._max_size,),
+                    )
+        except sqlite3.Error as error:
+            log_warning(f"Failed to evict results from cache '{self._path}' ({error})")
+
+    def close(self) -> None:
+        """
+        Evicts results above the size cap and closes the database.
+        """
+        if self._connection is None:
+            return
+        self.evict()
+        with self._lock:
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
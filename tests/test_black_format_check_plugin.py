@@ -3,6 +3,7 @@ import pytest
 from git import Repo
 from pathlib import Path
 
+from dgis.hooks.plugins.file_tasks import FileTaskPool
 from dgis.hooks.plugins.packaged.black_format_check import BlackFormatCheckPlugin
 from dgis.hooks.plugins.plugin import PluginContext, PluginResultStatus, execute_plugin
 from dgis.hooks.utility.git import GitRef
@@ -138,3 +139,59 @@ def test_py_non_empty_files_moved(tmp_path, py_content):
 
     with execute_plugin(BlackFormatCheckPlugin, context) as result:
         assert result.status == PluginResultStatus.Ok
+
+
+def test_py_nearest_config(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    long_line_py = "def f():\n    return [1111111111, 2222222222, 3333333333]\n"
+    make_and_commit_test_file(git_repo, Path("pyproject.toml"), _g_pytoml_content)
+    make_and_commit_test_file(git_repo, Path("narrow/pyproject.toml"), "[tool.black]\nline-length = 40\n")
+    make_and_commit_test_file(git_repo, Path("test.py"), long_line_py)
+    make_and_commit_test_file(git_repo, Path("narrow/test.py"), long_line_py)
+
+    ref = GitRef(git_repo.commit("HEAD~2").hexsha, git_repo.commit("HEAD").hexsha, git_repo.head.ref.name)
+    context = PluginContext(ref, git_repo_path, git_repo, None)
+
+    with execute_plugin(BlackFormatCheckPlugin, context) as result:
+        assert result.status == PluginResultStatus.Failed
+        assert [payload.file for payload in result.payloads] == [Path("narrow/test.py")]
+
+
+def test_py_files_in_dir_with_space(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    make_and_commit_test_file(git_repo, Path("pyproject.toml"), _g_pytoml_content)
+    make_and_commit_test_file(git_repo, Path("my dir/good.py"), _g_good_py[0])
+    make_and_commit_test_file(git_repo, Path("my dir/bad.py"), _g_bad_py[0])
+
+    ref = GitRef(git_repo.commit("HEAD~2").hexsha, git_repo.commit("HEAD").hexsha, git_repo.head.ref.name)
+    context = PluginContext(ref, git_repo_path, git_repo, None)
+
+    with execute_plugin(BlackFormatCheckPlugin, context) as result:
+        assert result.status == PluginResultStatus.Failed
+        assert [payload.file for payload in result.payloads] == [Path("my dir/bad.py")]
+
+
+def test_py_files_checked_by_file_tasks(tmp_path, monkeypatch):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    make_and_commit_test_file(git_repo, Path("pyproject.toml"), _g_pytoml_content)
+    for index in range(4):
+        (git_repo_path / f"good_{index}.py").write_text(_g_good_py[0])
+    (git_repo_path / "bad.py").write_text(_g_bad_py[0])
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "py files")
+
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, git_repo.head.ref.name)
+    monkeypatch.setattr(FileTaskPool, "_min_files", 1)
+    monkeypatch.setattr(FileTaskPool, "_task_files", 2)
+    with FileTaskPool(processes=2) as file_tasks:
+        context = PluginContext(ref, git_repo_path, git_repo, None, file_tasks=file_tasks)
+        with execute_plugin(BlackFormatCheckPlugin, context) as result:
+            assert result.status == PluginResultStatus.Failed
+            assert [payload.file for payload in result.payloads] == [Path("bad.py")]
+            assert "+    return a + b" in result.payloads[0].diff
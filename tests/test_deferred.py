@@ -0,0 +1,170 @@
+import sys
+import time
+
+from pathlib import Path
+
+from dgis.hooks.deferred_checks.entry_point import run_deferred_checks
+from dgis.hooks.pre_receive.entry_point import run_checks
+from dgis.hooks.plugins.discover import PluginEntry
+from dgis.hooks.plugins.executor import ExecutionPolicy, order_plugins
+from dgis.hooks.plugins.packaged.black_format_check import BlackFormatCheckPlugin
+from dgis.hooks.plugins.packaged.branch_check import BranchCheckPlugin
+from dgis.hooks.plugins.packaged.clang_format_check import ClangFormatCheckPlugin
+from dgis.hooks.plugins.packaged.json_check import JsonCheckPlugin
+from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultStatus, run_plugin
+from dgis.hooks.utility.deferred import DeferredQueue
+from dgis.hooks.utility.git import ChangeSet, GitRef, PushCommits, g_zero_rev
+
+from tests.utility import make_test_repo, make_and_commit_test_file
+
+
+class SleepingPlugin(Plugin):
+    _deferrable = True
+
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        context.processes.run([sys.executable, "-c", "import time; time.sleep(30)"])
+        return PluginResult(PluginResultStatus.Ok, None)
+
+
+def test_deadline_defers_plugins(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    make_and_commit_test_file(git_repo, Path("test2.txt"))
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "123")
+
+    context = PluginContext(ref, git_repo_path, git_repo)
+    context.processes.set_deadline(time.monotonic() + 0.3)
+    start = time.monotonic()
+    result = run_plugin(SleepingPlugin, context)
+    assert result.status == PluginResultStatus.Deferred and not result.status.failed
+    assert time.monotonic() - start < 5
+    # Deferrable plugins starting after the deadline are deferred right away, others still run.
+    assert run_plugin(SleepingPlugin, context).status == PluginResultStatus.Deferred
+    assert run_plugin(BranchCheckPlugin, context).status == PluginResultStatus.Ok
+
+    assert order_plugins([ClangFormatCheckPlugin, JsonCheckPlugin, BranchCheckPlugin]) == [
+        BranchCheckPlugin,
+        JsonCheckPlugin,
+        ClangFormatCheckPlugin,
+    ]
+
+
+def test_deferred_queue_leases_checks(tmp_path):
+    ref = GitRef("1" * 40, "2" * 40, "refs/heads/master")
+    with DeferredQueue(tmp_path / "deferred.sqlite3") as queue:
+        queue.push("/repo", ref, PushCommits({"2" * 40: ["1" * 40]}), ["JsonCheckPlugin", "XmlCheckPlugin"])
+        claimed = queue.claim(limit=1)
+        assert [(check.plugin, check.ref.ref) for check in claimed] == [("JsonCheckPlugin", "refs/heads/master")]
+        assert claimed[0].push_commits.parents == {"2" * 40: ["1" * 40]}
+
+        # Another worker gets the rest, claimed checks stay queued until completed.
+        with DeferredQueue(tmp_path / "deferred.sqlite3") as other:
+            assert [check.plugin for check in other.claim()] == ["XmlCheckPlugin"]
+            assert other.claim() == []
+        queue.complete(claimed)
+        assert len(queue) == 1
+
+
+def test_run_deferred_checks(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    base = git_repo.commit("HEAD").hexsha
+    (git_repo_path / "invalid.json").write_text('{"key": "value"')
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "json file")
+    tip = git_repo.commit("HEAD").hexsha
+
+    entries = [
+        PluginEntry(
+            "JsonCheckPlugin",
+            "dgis.hooks.plugins.packaged.json_check:JsonCheckPlugin",
+            JsonCheckPlugin.file_subscription(),
+            None,
+            0,
+        )
+    ]
+    with DeferredQueue(tmp_path / "deferred.sqlite3") as queue:
+        # The push is accepted, so its commits are reachable from existing refs when the checks run.
+        created = GitRef(g_zero_rev, tip, "refs/heads/feature")
+        queue.push(str(git_repo_path), created, PushCommits({tip: [base]}), ["JsonCheckPlugin", "RemovedPlugin"])
+        missing = GitRef(base, "3" * 40, "refs/heads/gone")
+        queue.push(str(git_repo_path), missing, PushCommits({}), ["JsonCheckPlugin"])
+
+        assert run_deferred_checks(queue, entries, jobs=1)
+        assert len(queue) == 0
+
+        queue.push(
+            str(git_repo_path), GitRef(g_zero_rev, base, "refs/heads/valid"), PushCommits({}), ["JsonCheckPlugin"]
+        )
+        assert not run_deferred_checks(queue, entries, jobs=1)
+
+
+def test_deadline_reached_while_diffing(tmp_path, monkeypatch):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    (git_repo_path / "invalid.json").write_text('{"key": "value"')
+    (git_repo_path / "bad.py").write_text("x=1\n")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "json and python files")
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "refs/heads/master")
+    bad_ref = GitRef(ref.old_rev, ref.new_rev, "refs/heads/bad$name!")
+
+    diffed = []
+
+    class SlowChangeSet(ChangeSet):
+        @property
+        def files(self):
+            diffed.append(self)
+            time.sleep(0.3)
+            return super().files
+
+    estimated = []
+    pre_receive = sys.modules[run_checks.__module__]
+    monkeypatch.setattr(pre_receive, "ChangeSet", SlowChangeSet)
+    monkeypatch.setattr(pre_receive, "estimate_plugins", lambda plugins, *args: estimated.extend(plugins))
+    branch, json, black = [
+        PluginEntry(
+            plugin.__name__,
+            f"dgis.hooks.plugins.packaged.{module}:{plugin.__name__}",
+            plugin.file_subscription() if module != "branch_check" else None,
+            None,
+            0,
+            plugin.deferrable(),
+        )
+        for module, plugin in (
+            ("branch_check", BranchCheckPlugin),
+            ("json_check", JsonCheckPlugin),
+            ("black_format_check", BlackFormatCheckPlugin),
+        )
+    ]
+
+    # The budget is spent while diffing: the invalid file is still checked, the formatter is deferred unstarted.
+    failed, deferred = run_checks(
+        str(git_repo_path),
+        git_repo,
+        [ref],
+        PushCommits({}),
+        [branch, json, black],
+        jobs=1,
+        policy=ExecutionPolicy.CollectAll,
+        deadline=time.monotonic() + 0.1,
+    )
+    assert failed and deferred == [(ref, ["BlackFormatCheckPlugin"])]
+    assert BlackFormatCheckPlugin not in estimated
+
+    # The budget is spent before the ref: the branch name is checked, only deferrable plugins need no diff.
+    diffed.clear()
+    failed, deferred = run_checks(
+        str(git_repo_path),
+        git_repo,
+        [bad_ref],
+        PushCommits({}),
+        [branch, black],
+        policy=ExecutionPolicy.CollectAll,
+        deadline=time.monotonic() - 1,
+    )
+    assert failed and deferred == [(bad_ref, ["BlackFormatCheckPlugin"])] and not diffed
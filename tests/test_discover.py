@@ -1,7 +1,11 @@
+import json
 import pytest
 import sys
 
-from dgis.hooks.plugins.discover import discover_and_load_plugins
+from dgis.hooks.plugins import discover
+from dgis.hooks.plugins.discover import discover_and_load_plugins, discover_plugins, load_plugins
+from dgis.hooks.utility.cache import g_cache_dir_env, reset_cache_dir
+from dgis.hooks.utility.git import FileChange
 
 
 def test_empty_enabled_plugins():
@@ -36,3 +40,43 @@ def test_many_enabled_plugins():
     plugins = discover_and_load_plugins(["BranchCheckPlugin", "JsonCheckPlugin"])
 
     assert expected_plugins == set([plugin.__name__ for plugin in plugins])
+
+
+@pytest.fixture
+def plugin_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(g_cache_dir_env, str(tmp_path))
+    reset_cache_dir()
+    yield tmp_path
+    reset_cache_dir()
+
+
+def test_discover_plugins_uses_index(plugin_cache_dir, monkeypatch):
+    entries = discover_plugins([])
+    assert (plugin_cache_dir / "plugins.json").exists()
+
+    def fail_entry_points(**kwargs):
+        raise AssertionError("entry points are scanned again")
+
+    monkeypatch.setattr(discover, "entry_points", fail_entry_points)
+    assert discover_plugins([]) == entries
+    assert [entry.name for entry in discover_plugins(["JsonCheckPlugin"])] == ["JsonCheckPlugin"]
+
+    # A changed plugin module invalidates the index.
+    index_path = plugin_cache_dir / "plugins.json"
+    index = json.loads(index_path.read_text())
+    index["plugins"][0]["origin_mtime_ns"] += 1
+    index_path.write_text(json.dumps(index))
+    monkeypatch.setattr(discover, "_build_index", lambda fingerprint: [])
+    assert discover_plugins([]) == []
+
+
+def test_load_plugins_of_changed_files(plugin_cache_dir):
+    entries = discover_plugins(["BranchCheckPlugin", "JsonCheckPlugin", "XmlCheckPlugin", "UTF8CheckPlugin"])
+    changes = [
+        FileChange("M", "docs/README.md", None, "100644", "100644", "0" * 40, "1" * 40),
+        FileChange("D", "layout.xml", None, "100644", "000000", "1" * 40, "0" * 40),
+    ]
+
+    # Only UTF-8 check declares Markdown files, a deleted XML file is not checked.
+    plugins = load_plugins(entries, changes)
+    assert {plugin.__name__ for plugin in plugins} == {"BranchCheckPlugin", "UTF8CheckPlugin"}
@@ -0,0 +1,72 @@
+from pathlib import Path, PurePosixPath
+
+import pytest
+
+from dgis.hooks.plugins.packaged.json_check import JsonCheckPlugin
+from dgis.hooks.plugins.packaged.utf8_check import UTF8CheckPlugin
+from dgis.hooks.plugins.packaged.xml_check import XmlCheckPlugin
+from dgis.hooks.plugins.plugin import PluginContext, file_dispatch_index
+from dgis.hooks.utility.dispatch import DispatchIndex, FileSubscription, path_suffix
+from dgis.hooks.utility.git import FileChange, GitRef
+
+from tests.utility import make_test_repo, make_and_commit_test_file
+
+
+def _change(path: str, status: str = "M", new_mode: str = "100644") -> FileChange:
+    return FileChange(status, path, None, "100644", new_mode, "0" * 40, "1" * 40)
+
+
+@pytest.mark.parametrize(
+    "path", ["a.json", "dir/a.tar.gz", "dir.d/file", ".gitignore", "dir/.hidden.xml", "a..b", "README"]
+)
+def test_path_suffix_matches_pure_path(path):
+    assert path_suffix(path) == PurePosixPath(path).suffix
+
+
+def test_dispatch_index_subscribers():
+    index = DispatchIndex(
+        [
+            ("json", FileSubscription(frozenset({".json"}))),
+            ("text", FileSubscription(frozenset({".JSON", ".txt"}), ignore_case=True)),
+            ("config", FileSubscription(frozenset({".json"}), globs=("config/*",))),
+        ]
+    )
+
+    assert index.subscribers("a/b.json") == ["json", "text", "config"]
+    assert index.subscribers("a/b.Json") == ["text"]
+    assert index.subscribers("config/nested/settings.json") == ["json", "text", "config"]
+    assert index.subscribers("config/Makefile") == ["config"]
+    assert index.subscribers("src/main.cpp") == []
+    assert "json" in index and "xml" not in index
+
+
+def test_dispatch_index_skips_deleted_and_non_files():
+    index = DispatchIndex([("json", FileSubscription(frozenset({".json"})))])
+    kept = _change("b.json")
+    changes = [_change("a.json", status="D"), _change("link.json", new_mode="120000"), kept, _change("c.xml")]
+
+    assert index.dispatch(changes) == {"json": [kept]}
+
+
+def test_context_dispatches_files_once(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    for name in ("data.json", "layout.xml", "notes.TXT", "main.py"):
+        (git_repo_path / name).write_text("content")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "files")
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "123")
+
+    plugins = [JsonCheckPlugin, XmlCheckPlugin, UTF8CheckPlugin]
+    context = PluginContext(ref, git_repo_path, git_repo, file_index=file_dispatch_index(plugins))
+    without_index = PluginContext(ref, git_repo_path, git_repo)
+
+    for plugin in plugins:
+        assert context.subscribed_files(plugin) == without_index.subscribed_files(plugin)
+    assert [change.path for change in context.subscribed_files(JsonCheckPlugin)] == ["data.json"]
+    assert [change.path for change in context.subscribed_files(UTF8CheckPlugin)] == [
+        "data.json",
+        "layout.xml",
+        "notes.TXT",
+    ]
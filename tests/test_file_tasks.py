@@ -0,0 +1,97 @@
+import logging
+import pickle
+
+from pathlib import Path
+
+from dgis.hooks.plugins.file_tasks import FileTaskPool
+from dgis.hooks.plugins.packaged.json_check import JsonCheckPlugin
+from dgis.hooks.plugins.plugin import PluginContext, PluginResultStatus, run_plugin
+from dgis.hooks.utility.git import GitRef
+
+from tests.utility import make_test_repo, make_and_commit_test_file
+
+
+class _RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _make_context(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    for i in range(50):
+        content = '{"key": "value"}' if i % 7 else '{"key": "value"'
+        (git_repo_path / f"dir_{i % 3}" / f"file_{i:02}.json").parent.mkdir(exist_ok=True)
+        (git_repo_path / f"dir_{i % 3}" / f"file_{i:02}.json").write_text(content)
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "many files")
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "123")
+
+    log = logging.getLogger("test_file_tasks")
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    handler = _RecordingHandler()
+    log.addHandler(handler)
+    return PluginContext(ref, git_repo_path, git_repo, log), handler
+
+
+def test_file_task_pool_matches_in_process_check(tmp_path):
+    context, handler = _make_context(tmp_path)
+    expected = run_plugin(JsonCheckPlugin, context)
+    expected_messages = list(handler.messages)
+    handler.messages.clear()
+
+    with FileTaskPool(processes=3) as file_tasks:
+        context.file_tasks = file_tasks
+        result = run_plugin(JsonCheckPlugin, context)
+
+    assert result.status == PluginResultStatus.Failed
+    assert [str(payload.file) for payload in result.payloads] == [str(payload.file) for payload in expected.payloads]
+    assert [str(payload.stdout) for payload in result.payloads] == [
+        str(payload.stdout) for payload in expected.payloads
+    ]
+    assert len(result.payloads) == 8
+    # Payloads are sent as plain data, exceptions of checks arrive as their text.
+    assert all(isinstance(payload.stdout, str) for payload in result.payloads)
+    # Log records of worker processes are emitted by the hook process in order of files.
+    assert handler.messages == expected_messages
+
+
+def test_plugin_context_pickles_without_handles(tmp_path):
+    context, _ = _make_context(tmp_path)
+    changes = context.changes.files[:2]
+    task_context = pickle.loads(pickle.dumps(context.for_files(changes)))
+
+    assert task_context.ref == context.ref and task_context.log is context.log
+    assert task_context.change_set is None and task_context.object_reader is None
+    assert task_context.blob_sizes == {change.new_hexsha: context.blob_sizes[change.new_hexsha] for change in changes}
+    assert task_context.objects.read(changes[0].new_hexsha) == context.objects.read(changes[0].new_hexsha)
+
+
+def test_file_check_plugin_checks_files_in_batches(tmp_path, monkeypatch):
+    context, _ = _make_context(tmp_path)
+    expected = run_plugin(JsonCheckPlugin, context)
+
+    batches = []
+    check_files = JsonCheckPlugin.check_files
+
+    def recording_check_files(context, changes):
+        batches.append(len(changes))
+        return check_files(context, changes)
+
+    monkeypatch.setattr(JsonCheckPlugin, "_batch_files", 16)
+    monkeypatch.setattr(JsonCheckPlugin, "check_files", recording_check_files)
+    # Files are streamed, not collected into a list.
+    files = JsonCheckPlugin.files(context)
+    assert iter(files) is files
+    result = run_plugin(JsonCheckPlugin, context)
+
+    assert batches == [16, 16, 16, 2]
+    assert [(payload.file, str(payload.stdout)) for payload in result.payloads] == [
+        (payload.file, str(payload.stdout)) for payload in expected.payloads
+    ]
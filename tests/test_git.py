@@ -1,8 +1,36 @@
 import pytest
+import sys
 
 from git import Repo
+from pathlib import Path
+from subprocess import run
+
+from dgis.hooks.utility.git import (
+    parse_ref,
+    parse_diff_ranges,
+    ChangeSet,
+    CliGitBackend,
+    GitBackend,
+    GitObjectReader,
+    MappedObjectReader,
+    PushCommits,
+    RefStatus,
+    RenamePolicy,
+    GitRef,
+    blob_from_hexsha,
+    g_empty_tree_rev,
+    g_git_backend_env,
+    get_backend,
+    g_zero_rev,
+    iter_diff_tree,
+    object_directories,
+    quarantine_blobs,
+)
+
+from dgis.hooks.utility.diff import HunkHeader, LineIntervals, iter_hunk_headers
+from dgis.hooks.utility.packfile import ObjectStore
 
-from dgis.hooks.utility.git import parse_ref, RefStatus, GitRef
+from tests.utility import make_and_commit_test_file
 
 
 @pytest.mark.parametrize("line", ["", "123", "123 456", "123 456 789 111213"])
@@ -11,6 +39,18 @@ def test_parse_ref_invalid_string(tmp_path, line):
         parse_ref(line)
 
 
+def test_line_intervals_coalesce_hunks():
+    hunks = "@@ -1 +1,2 @@ def f():\n+a\n+b\n@@ -5,0 +3 @@\n+c\n@@ -9 +9,0 @@\n-x\n@@ -20,2 +12,3 @@\n"
+    assert list(iter_hunk_headers(hunks.encode()))[:2] == [HunkHeader(1, 1, 1, 2), HunkHeader(5, 0, 3, 1)]
+    assert list(iter_hunk_headers(hunks)) == list(iter_hunk_headers(hunks.encode()))
+
+    intervals = LineIntervals.from_hunks(hunks)
+    assert list(intervals) == [(1, 3), (12, 14)]
+    assert [line for line in range(16) if line in intervals] == [1, 2, 3, 12, 13, 14]
+    assert parse_diff_ranges(hunks) == [(1, 3), (12, 14)]
+    assert list(LineIntervals([(10, 20), (1, 2), (15, 30), (3, 3)])) == [(1, 3), (10, 30)]
+
+
 @pytest.mark.parametrize("line", ["123 456 789"])
 def test_parse_ref_valid_string(tmp_path, line):
     ref = parse_ref(line)
@@ -105,6 +145,7 @@ def test_diff_is_not_empty(tmp_path):
     ref = GitRef(old_rev, new_rev, "123")
     diff = ref.diff(git_repo)
     assert len(diff) > 0
+    assert [change.b_path for change in diff] == [change.path for change in ref.changed_files(git_repo)]
 
 
 def test_diff_is_empty(tmp_path):
@@ -124,3 +165,457 @@ def test_diff_is_empty(tmp_path):
     ref = GitRef(old_rev, new_rev, "123")
     diff = ref.diff(git_repo)
     assert len(diff) == 0
+    assert ref.changed_files(git_repo) == []
+
+
+def test_change_set_is_memoized(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    tmp_file_path = git_repo_path / f"test.txt"
+    tmp_file_path.touch()
+    git_repo.git.add(tmp_file_path)
+    git_repo.git.commit("-m", f"'commit {str(tmp_file_path)}'")
+
+    old_rev = git_repo.commit("HEAD").hexsha
+
+    tmp_file_path = git_repo_path / f"other_test.txt"
+    tmp_file_path.touch()
+    git_repo.git.add(tmp_file_path)
+    git_repo.git.commit("-m", f"commit {str(tmp_file_path)}")
+
+    new_rev = git_repo.commit("HEAD").hexsha
+
+    changes = ChangeSet(git_repo, GitRef(old_rev, new_rev, "123"))
+    assert changes.status == RefStatus.Updated
+    assert changes.new_commits == [new_rev]
+    assert changes.changed_paths == ["other_test.txt"]
+    assert changes.files is changes.files
+
+
+def test_object_reader_reads_raw_content(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    contents = [b"", b"no line feed", b"two\nlines\n", b"\xff\xfe invalid utf-8"]
+    hexshas = []
+    for i, content in enumerate(contents):
+        tmp_file_path = git_repo_path / f"test_{i}.txt"
+        tmp_file_path.write_bytes(content)
+        git_repo.git.add(tmp_file_path)
+        hexshas.append(git_repo.git.hash_object(tmp_file_path))
+
+    with GitObjectReader(git_repo) as objects:
+        assert [data for _, data in objects.read_many(hexshas)] == contents
+        assert objects.read(hexshas[2]) == contents[2]
+        with pytest.raises(ValueError):
+            objects.read("1" * 40)
+        assert objects.info("HEAD:my dir/missing.txt") is None
+        # The stream stays in sync after a missing object.
+        assert objects.read(hexshas[1]) == contents[1]
+
+        assert b"".join(objects.stream_blob(hexshas[2], chunk_size=4)) == contents[2]
+        with pytest.raises(ValueError):
+            list(objects.stream_blob("1" * 40))
+
+        # The repository is still accepted in place of a reader.
+        assert blob_from_hexsha(git_repo, hexshas[1]) == blob_from_hexsha(objects, hexshas[1]) == b"no line feed\n"
+
+
+def test_ref_status_is_cached(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    tmp_file_path = git_repo_path / f"test.txt"
+    tmp_file_path.touch()
+    git_repo.git.add(tmp_file_path)
+    git_repo.git.commit("-m", f"'commit {str(tmp_file_path)}'")
+
+    old_rev = git_repo.commit("HEAD").hexsha
+
+    git_repo.git.commit("--amend", "-m", "amended")
+
+    new_rev = git_repo.commit("HEAD").hexsha
+
+    ref = GitRef(old_rev, new_rev, "123")
+    assert ref.status(git_repo) == RefStatus.ForceUpdated
+
+    # Cached status does not depend on the repository anymore.
+    git_repo.git.reset("--hard", old_rev)
+    git_repo.git.reflog("expire", "--expire=now", "--all")
+    git_repo.git.gc("--prune=now")
+    assert ref.status(git_repo) == RefStatus.ForceUpdated
+    assert ref == GitRef(old_rev, new_rev, "123")
+
+
+def test_change_set_streams_hunks(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    (git_repo_path / "moved.py").write_text("a = 1\nb = 2\nc = 3\nd = 4\n")
+    (git_repo_path / "link.py").write_text("x = 1\n")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "initial")
+    old_rev = git_repo.commit("HEAD").hexsha
+
+    git_repo.git.mv("moved.py", "renamed.py")
+    (git_repo_path / "renamed.py").write_text("a = 1\nb = 20\nc = 3\nd = 4\n")
+    (git_repo_path / "link.py").unlink()
+    (git_repo_path / "link.py").symlink_to("renamed.py")
+    (git_repo_path / "data.bin").write_bytes(b"\0\1\2")
+    (git_repo_path / "new file.py").write_text("y = 1\nz = 2\n")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "changes")
+    new_rev = git_repo.commit("HEAD").hexsha
+
+    changes = ChangeSet(git_repo, GitRef(old_rev, new_rev, "123"))
+    files = {change.path: change for change in changes.files}
+
+    assert files["renamed.py"].renamed and files["renamed.py"].old_path == "moved.py"
+    assert not files["link.py"].is_file
+    assert files["new file.py"].is_file
+
+    streamed = {change.path: change for change in changes.iter_hunks(lambda path: path != "data.bin")}
+    assert set(streamed) == {"renamed.py", "link.py", "new file.py"}
+    assert streamed["renamed.py"].hunks.endswith(b"\n-b = 2\n+b = 20\n")
+    assert parse_diff_ranges(streamed["renamed.py"].hunks.decode()) == [(2, 2)]
+    assert streamed["renamed.py"].is_changed(2) and not streamed["renamed.py"].is_changed(1)
+    assert streamed["new file.py"].hunks == b"@@ -0,0 +1,2 @@\n+y = 1\n+z = 2\n"
+    assert streamed["link.py"].hunks.startswith(b"@@ -0,0 +1 @@\n+renamed.py")
+    # Hunks are attached to the streamed copies only.
+    assert not files["renamed.py"].hunks
+    (binary,) = changes.iter_hunks(lambda path: path == "data.bin")
+    assert not binary.hunks
+
+
+def test_push_commits_diff_base_follows_first_parent(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    make_and_commit_test_file(git_repo, Path("base.txt"))
+    base_rev = git_repo.commit("HEAD").hexsha
+    main_branch = git_repo.head.ref.name
+
+    # Side branch commits are newer than the first commit of the pushed branch.
+    git_repo.git.checkout("-b", "feature")
+    make_and_commit_test_file(git_repo, Path("feature.txt"))
+    git_repo.git.checkout("-b", "side", base_rev)
+    make_and_commit_test_file(git_repo, Path("side.txt"))
+    git_repo.git.checkout("feature")
+    git_repo.git.merge("--no-ff", "-m", "merge side", "side")
+    new_rev = git_repo.commit("HEAD").hexsha
+
+    # Emulate the push: only the main branch exists on the server.
+    git_repo.git.checkout(main_branch)
+    git_repo.git.branch("-D", "feature", "side")
+
+    ref = GitRef(g_zero_rev, new_rev, "refs/heads/feature")
+    other_ref = GitRef(g_zero_rev, base_rev, "refs/heads/other")
+    push_commits = PushCommits.compute(git_repo, [ref, other_ref])
+    assert len(push_commits) == 3
+
+    changes = ChangeSet(git_repo, ref, push_commits)
+    assert changes.diff_base == base_rev
+    assert len(changes.new_commits) == 3
+    assert sorted(changes.changed_paths) == ["feature.txt", "side.txt"]
+
+    # No new commits for a ref created on existing history.
+    assert ChangeSet(git_repo, other_ref, push_commits).diff_base == g_empty_tree_rev
+
+
+def test_push_commits_new_root_commit(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    new_rev = git_repo.commit("HEAD").hexsha
+    git_repo.git.update_ref("-d", git_repo.head.ref.path)
+
+    changes = ChangeSet(git_repo, GitRef(g_zero_rev, new_rev, "refs/heads/master"))
+    assert changes.new_commits == [new_rev]
+    assert changes.diff_base == g_empty_tree_rev
+    assert changes.changed_paths == ["test.txt"]
+
+
+def test_iter_diff_tree_streams_hunks(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    make_and_commit_test_file(git_repo, Path("base.txt"))
+    old_rev = git_repo.commit("HEAD").hexsha
+
+    long_line = "x" * 300000
+    for i in range(20):
+        (git_repo_path / f"file_{i:02}.txt").write_text(f"{long_line}\n{i}\n")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "many files")
+    new_rev = git_repo.commit("HEAD").hexsha
+
+    changes = list(iter_diff_tree(git_repo, old_rev, new_rev, patch=True))
+    assert [change.path for change in changes] == [f"file_{i:02}.txt" for i in range(20)]
+    assert all(change.hunks == f"@@ -0,0 +1,2 @@\n+{long_line}\n+{i}\n".encode() for i, change in enumerate(changes))
+
+    # Stopping early terminates git without reading the rest of the output.
+    first = next(iter_diff_tree(git_repo, old_rev, new_rev, patch=True))
+    assert first.path == "file_00.txt"
+
+    raw = list(iter_diff_tree(git_repo, old_rev, new_rev, paths=["file_01.txt"]))
+    assert len(raw) == 1 and raw[0].hunks is None
+
+    streamed = list(
+        ChangeSet(git_repo, GitRef(old_rev, new_rev, "123")).iter_hunks(lambda path: path.endswith("7.txt"))
+    )
+    assert [change.path for change in streamed] == ["file_07.txt", "file_17.txt"]
+
+
+def _all_objects(git_repo: Repo):
+    return git_repo.git.cat_file("--batch-all-objects", "--batch-check=%(objectname)").split()
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_mapped_object_reader_matches_git(tmp_path, packed):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    # Many similar versions of a file make git store deltas (including chains) when packing.
+    lines = [f"line {i} " + "x" * 50 for i in range(400)]
+    for i in range(12):
+        lines[i * 30] = f"changed {i}"
+        make_and_commit_test_file(git_repo, Path("data.txt"), "\n".join(lines))
+        make_and_commit_test_file(git_repo, Path(f"dir/file_{i}.txt"), f"file {i}")
+    if packed:
+        git_repo.git.repack("-a", "-d", "-f", "--depth=5")
+
+    hexshas = _all_objects(git_repo)
+    with GitObjectReader(git_repo) as objects, MappedObjectReader(git_repo) as mapped:
+        assert list(mapped.read_many(hexshas)) == list(objects.read_many(hexshas))
+        assert list(mapped.info_many(hexshas)) == list(objects.info_many(hexshas))
+        # Every object is served in-process, not by the git fallback.
+        store = ObjectStore(object_directories(git_repo))
+        assert all(store.read(hexsha) is not None for hexsha in hexshas)
+        store.close()
+        blob = mapped.info("HEAD:data.txt")
+        assert blob is not None and blob.type == "blob"
+        assert b"".join(mapped.stream_blob(blob.hexsha, chunk_size=1000)) == objects.read(blob.hexsha)
+        with pytest.raises(ValueError):
+            mapped.read("1" * 40)
+
+
+def test_mapped_object_reader_alternates(tmp_path, monkeypatch):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"), "test")
+    git_repo.git.repack("-a", "-d")
+
+    clone_path = tmp_path / "clone"
+    clone = Repo.clone_from(git_repo_path, clone_path, shared=True)
+    quarantine_path = tmp_path / "quarantine"
+    quarantine_path.mkdir()
+    # Objects of a push are written to the quarantine, the repository objects are available as alternates.
+    monkeypatch.setenv("GIT_OBJECT_DIRECTORY", str(quarantine_path))
+    monkeypatch.setenv("GIT_ALTERNATE_OBJECT_DIRECTORIES", str(clone_path / ".git" / "objects"))
+    blob_hexsha = (
+        run(
+            ["git", "hash-object", "-w", "--stdin"],
+            input=b"quarantined",
+            cwd=clone_path,
+            capture_output=True,
+            check=True,
+        )
+        .stdout.decode()
+        .strip()
+    )
+    assert (quarantine_path / blob_hexsha[:2] / blob_hexsha[2:]).exists()
+
+    assert object_directories(clone) == [
+        quarantine_path.resolve(),
+        (clone_path / ".git" / "objects").resolve(),
+        (git_repo_path / ".git" / "objects").resolve(),
+    ]
+    with MappedObjectReader(clone) as mapped:
+        assert mapped.read(git_repo.commit("HEAD").tree["test.txt"].hexsha) == b"test"
+        assert mapped.read(blob_hexsha) == b"quarantined"
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        ("off", [("A", "edited.txt"), ("A", "moved.txt"), ("D", "a.txt"), ("D", "b.txt")]),
+        ("exact", [("A", "edited.txt"), ("D", "a.txt"), ("R", "moved.txt")]),
+        ("50%", [("R", "edited.txt"), ("R", "moved.txt")]),
+    ],
+)
+def test_iter_diff_tree_rename_policy(tmp_path, policy, expected):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    content = "".join(f"line {i}\n" for i in range(20))
+    make_and_commit_test_file(git_repo, Path("a.txt"), content)
+    make_and_commit_test_file(git_repo, Path("b.txt"), "b\n" + content)
+    old_rev = git_repo.commit("HEAD").hexsha
+
+    git_repo.git.mv("a.txt", "edited.txt")
+    (git_repo_path / "edited.txt").write_text(content + "one more line\n")
+    git_repo.git.mv("b.txt", "moved.txt")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "renames")
+
+    renames = RenamePolicy.parse(policy, limit=100)
+    changes = iter_diff_tree(git_repo, old_rev, git_repo.commit("HEAD").hexsha, renames=renames)
+    assert sorted((change.status, change.path) for change in changes) == expected
+
+
+def test_rename_policy_parse():
+    assert RenamePolicy.parse("off").args() == ["--no-renames"]
+    assert RenamePolicy.parse("Exact", limit=10).args() == ["-M100%"]
+    assert RenamePolicy.parse("75%", limit=10).args() == ["-M75%", "-l10"]
+    assert str(RenamePolicy.parse("75", limit=10)) == "similarity 75%, limit 10"
+    with pytest.raises(ValueError):
+        RenamePolicy.parse("fast")
+
+
+def test_change_set_sharded_diff_keeps_git_order(tmp_path, monkeypatch):
+    # Only the git CLI backend generates shards concurrently.
+    monkeypatch.delenv(g_git_backend_env, raising=False)
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    # Trees sort as if their names had a trailing slash: "a-b" < "a.txt" < "a/" < "a0".
+    for path in ["a.txt", "a/b.txt", "a/c/d.txt", "a-b", "a0", "b/x.py", "c.json", "z/y/x.txt"]:
+        make_and_commit_test_file(git_repo, Path(path), path)
+    new_rev = git_repo.commit("HEAD").hexsha
+
+    expected = list(iter_diff_tree(git_repo, g_empty_tree_rev, new_rev, patch=True))
+    assert [change.path for change in expected] == sorted(change.path for change in expected)
+
+    change_set = ChangeSet(git_repo, GitRef(g_zero_rev, new_rev, "123"), jobs=3)
+    assert change_set._shards() == [["a-b"], ["a.txt"], ["a"], ["a0"], ["b"], ["c.json"], ["z"]]
+    assert [change.path for change in change_set.files] == [change.path for change in expected]
+    assert list(change_set.iter_hunks(lambda path: True)) == expected
+
+    make_and_commit_test_file(git_repo, Path("a/c/d.txt"), "changed")
+    git_repo.git.rm("a0")
+    git_repo.git.commit("-m", "remove")
+    ref = GitRef(new_rev, git_repo.commit("HEAD").hexsha, "123")
+    change_set = ChangeSet(git_repo, ref, renames=RenamePolicy.parse("off"), jobs=3)
+    assert [(change.status, change.path) for change in change_set.files] == [("M", "a/c/d.txt"), ("D", "a0")]
+
+
+def test_quarantine_blobs_of_push(tmp_path):
+    remote_path = tmp_path / "remote.git"
+    remote = Repo.init(remote_path, bare=True)
+    output_path = tmp_path / "quarantine.txt"
+    hook_path = remote_path / "hooks" / "pre-receive"
+    hook_path.write_text(
+        f"#!/bin/sh\n"
+        f"'{sys.executable}' -c \"from git import Repo; from dgis.hooks.utility.git import quarantine_blobs; "
+        f"print(sorted(quarantine_blobs(Repo('.'))))\" > '{output_path}'\n"
+    )
+    hook_path.chmod(0o755)
+
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("old.txt"), "old")
+    git_repo.git.push(str(remote_path), "HEAD:refs/heads/main")
+    make_and_commit_test_file(git_repo, Path("new.txt"), "new")
+    # A copy of existing content is not a new blob.
+    make_and_commit_test_file(git_repo, Path("copy.txt"), "old")
+    git_repo.git.push(str(remote_path), "HEAD:refs/heads/main")
+
+    assert output_path.read_text().strip() == str([git_repo.commit("HEAD").tree["new.txt"].hexsha])
+    assert quarantine_blobs(git_repo) is None
+
+
+def test_change_set_keeps_new_blobs_only(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    make_and_commit_test_file(git_repo, Path("old.txt"), "old")
+    make_and_commit_test_file(git_repo, Path("removed.txt"), "removed")
+    old_rev = git_repo.commit("HEAD").hexsha
+    make_and_commit_test_file(git_repo, Path("new.txt"), "new")
+    make_and_commit_test_file(git_repo, Path("copy.txt"), "old")
+    git_repo.git.rm("removed.txt")
+    git_repo.git.commit("-m", "remove")
+    ref = GitRef(old_rev, git_repo.commit("HEAD").hexsha, "123")
+
+    new_blobs = {git_repo.commit("HEAD").tree["new.txt"].hexsha}
+    files = ChangeSet(git_repo, ref, new_blobs=new_blobs).files
+    assert [(change.status, change.path) for change in files] == [("A", "new.txt"), ("D", "removed.txt")]
+    assert ChangeSet(git_repo, ref, new_blobs=set()).files == []
+
+
+def _make_backend_test_repo(git_repo_path: Path) -> Repo:
+    git_repo = Repo.init(git_repo_path)
+    content = "".join(f"line {i}\n" for i in range(20))
+    make_and_commit_test_file(git_repo, Path(".gitattributes"), "*.bin binary\n*.txt text eol=lf\n")
+    make_and_commit_test_file(git_repo, Path("a.txt"), content)
+    make_and_commit_test_file(git_repo, Path("dir/b.txt"), "b\n")
+    make_and_commit_test_file(git_repo, Path("no_newline.txt"), "x")
+    git_repo.git.mv("a.txt", "moved.txt")
+    (git_repo_path / "dir" / "b.txt").write_text("B\nc\n")
+    (git_repo_path / "no_newline.txt").write_text("y")
+    (git_repo_path / "data.bin").write_bytes(b"\0\1\2")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "changes")
+    return git_repo
+
+
+def test_pygit2_backend_matches_cli(tmp_path, monkeypatch):
+    pytest.importorskip("pygit2")
+    git_repo = _make_backend_test_repo(tmp_path / "tmp-rep")
+    new_rev = git_repo.commit("HEAD").hexsha
+    old_rev = git_repo.commit("HEAD~1").hexsha
+    root_rev = git_repo.commit("HEAD~4").hexsha
+
+    monkeypatch.setenv(g_git_backend_env, "pygit2")
+    backend = get_backend(git_repo)
+    assert backend.name == "pygit2"
+    assert get_backend(git_repo) is backend
+    cli = CliGitBackend(git_repo)
+    with pytest.raises(TypeError):
+        GitBackend(git_repo)
+
+    for renames in (RenamePolicy.parse("off"), RenamePolicy.parse("exact"), RenamePolicy.parse("50%")):
+        for patch in (False, True):
+            assert list(backend.diff_tree(old_rev, new_rev, patch=patch, renames=renames)) == list(
+                cli.diff_tree(old_rev, new_rev, patch=patch, renames=renames)
+            )
+    assert list(backend.diff_tree(g_empty_tree_rev, new_rev, paths=["dir/b.txt"], patch=True)) == list(
+        cli.diff_tree(g_empty_tree_rev, new_rev, paths=["dir/b.txt"], patch=True)
+    )
+
+    # Chunks of paths are selected from a single diff of the trees, as git selects them with pathspecs.
+    off = RenamePolicy.parse("off")
+    chunks = [["data.bin", "dir/b.txt"], ["moved.txt", "no_newline.txt", "missing.txt"]]
+    changes = list(backend.diff_tree(old_rev, new_rev, paths=chunks[0], patch=True, renames=off))
+    tree_diff = backend._last_diff
+    changes += backend.diff_tree(old_rev, new_rev, paths=chunks[1], patch=True, renames=off)
+    assert backend._last_diff is tree_diff
+    assert changes == [
+        change for chunk in chunks for change in cli.diff_tree(old_rev, new_rev, paths=chunk, patch=True, renames=off)
+    ]
+
+    assert backend.rev_range(root_rev, new_rev) == cli.rev_range(root_rev, new_rev)
+    assert backend.is_ancestor(root_rev, new_rev) and not backend.is_ancestor(new_rev, root_rev)
+    git_repo.git.update_ref("refs/heads/master", old_rev)
+    assert backend.rev_walk([new_rev]) == cli.rev_walk([new_rev]) == {new_rev: [old_rev]}
+
+    names = [new_rev, f"{new_rev}:dir/b.txt", f"{new_rev}^{{tree}}", "1" * 40]
+    with backend.open_object_reader() as objects, GitObjectReader(git_repo) as git_objects:
+        assert list(objects.info_many(names)) == list(git_objects.info_many(names))
+        assert list(objects.read_many(names[:3])) == list(git_objects.read_many(names[:3]))
+        with pytest.raises(ValueError):
+            objects.read(names[-1])
+
+
+def test_pygit2_backend_falls_back_to_cli(tmp_path, monkeypatch):
+    pygit2 = pytest.importorskip("pygit2")
+    git_repo = _make_backend_test_repo(tmp_path / "tmp-rep")
+
+    def fail_to_open(path):
+        raise pygit2.GitError(f"failed to open '{path}'")
+
+    monkeypatch.setattr(pygit2, "Repository", fail_to_open)
+    monkeypatch.setenv(g_git_backend_env, "pygit2")
+    assert get_backend(git_repo).name == CliGitBackend.name
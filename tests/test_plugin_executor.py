@@ -0,0 +1,166 @@
+import logging
+import sys
+import threading
+import time
+
+from contextlib import closing
+from pathlib import Path
+
+from dgis.hooks.plugins.executor import ExecutionPolicy, execute_plugins
+from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultStatus
+from dgis.hooks.utility.git import GitRef
+
+from tests.utility import make_test_repo, make_and_commit_test_file
+
+_g_events = []
+
+
+class _RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class SlowPlugin(Plugin):
+    _delay = 0.3
+
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        context.log.info(f"{cls.__name__} started")
+        time.sleep(cls._delay)
+        assert context.changes.changed_paths == ["test2.txt"]
+        context.log.info(f"{cls.__name__} finished")
+        return PluginResult(PluginResultStatus.Ok, None)
+
+    @classmethod
+    def post_execute(cls, context: PluginContext, result: PluginResult) -> None:
+        _g_events.append((cls.__name__, threading.current_thread() is threading.main_thread()))
+
+
+class FastPlugin(SlowPlugin):
+    _delay = 0.0
+
+
+class FailingPlugin(SlowPlugin):
+    _delay = 0.1
+
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        raise RuntimeError("broken")
+
+
+class SubprocessPlugin(SlowPlugin):
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        context.log.info(f"{cls.__name__} started")
+        context.processes.run([sys.executable, "-c", "import time; time.sleep(30)"])
+        context.log.info(f"{cls.__name__} finished")
+        return PluginResult(PluginResultStatus.Ok, None)
+
+
+def _make_context(tmp_path, name):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    make_and_commit_test_file(git_repo, Path("test2.txt"))
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "123")
+    log = logging.getLogger(name)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    handler = _RecordingHandler()
+    log.addHandler(handler)
+    return PluginContext(ref, git_repo_path, git_repo, log), handler
+
+
+def test_execute_plugins_concurrently_in_order(tmp_path):
+    context, handler = _make_context(tmp_path, "test_execute_plugins_concurrently_in_order")
+    _g_events.clear()
+
+    start = time.monotonic()
+    plugins = [SlowPlugin, FailingPlugin, FastPlugin, SlowPlugin]
+    results = list(execute_plugins(plugins, context, jobs=4))
+    elapsed = time.monotonic() - start
+
+    assert [result.status for result in results] == [
+        PluginResultStatus.Ok,
+        PluginResultStatus.Failed,
+        PluginResultStatus.Ok,
+        PluginResultStatus.Ok,
+    ]
+    # Waiting for the slowest plugin, not for all of them one after another.
+    assert elapsed < 2 * SlowPlugin._delay
+    assert handler.messages == [
+        "SlowPlugin started",
+        "SlowPlugin finished",
+        f"Exception while running '{FailingPlugin}: broken'",
+        "FastPlugin started",
+        "FastPlugin finished",
+        "SlowPlugin started",
+        "SlowPlugin finished",
+    ]
+    assert _g_events == [(plugin.__name__, True) for plugin in plugins]
+
+
+def test_execute_plugins_stops_early(tmp_path):
+    context, handler = _make_context(tmp_path, "test_execute_plugins_stops_early")
+    _g_events.clear()
+
+    with closing(execute_plugins([FailingPlugin, SlowPlugin, FastPlugin], context, jobs=2)) as results:
+        for result in results:
+            assert result.status == PluginResultStatus.Failed
+            break
+    # Only the consumed result gets its callback, logs of plugins after it are not emitted.
+    assert _g_events == [("FailingPlugin", True)]
+    assert len(handler.messages) == 1
+    assert not context.log.filters
+
+
+def test_execute_plugins_sequentially(tmp_path):
+    context, handler = _make_context(tmp_path, "test_execute_plugins_sequentially")
+    _g_events.clear()
+
+    results = list(execute_plugins([FastPlugin, SlowPlugin], context, jobs=1))
+    assert [result.status for result in results] == [PluginResultStatus.Ok, PluginResultStatus.Ok]
+    assert handler.messages == [
+        "FastPlugin started",
+        "FastPlugin finished",
+        "SlowPlugin started",
+        "SlowPlugin finished",
+    ]
+    assert _g_events == [("FastPlugin", True), ("SlowPlugin", True)]
+
+
+def test_execute_plugins_fail_fast_cancels_running(tmp_path):
+    context, handler = _make_context(tmp_path, "test_execute_plugins_fail_fast_cancels_running")
+    _g_events.clear()
+
+    start = time.monotonic()
+    plugins = [SubprocessPlugin, FailingPlugin, FastPlugin]
+    results = list(execute_plugins(plugins, context, jobs=3, policy=ExecutionPolicy.FailFast))
+
+    # The subprocess of the first plugin is killed once the second one fails, later results are not reported.
+    assert time.monotonic() - start < 10
+    assert [result.status for result in results] == [PluginResultStatus.Cancelled, PluginResultStatus.Failed]
+    assert context.processes.cancelled
+    assert handler.messages == ["SubprocessPlugin started", f"Exception while running '{FailingPlugin}: broken'"]
+    assert _g_events == [("SubprocessPlugin", True), ("FailingPlugin", True)]
+
+
+def test_execute_plugins_collect_all(tmp_path):
+    context, _ = _make_context(tmp_path, "test_execute_plugins_collect_all")
+
+    for jobs in (1, 3):
+        results = list(execute_plugins([FailingPlugin, FastPlugin, FailingPlugin], context, jobs=jobs))
+        assert [result.status for result in results] == [
+            PluginResultStatus.Failed,
+            PluginResultStatus.Ok,
+            PluginResultStatus.Failed,
+        ]
+        assert not context.processes.cancelled
+        results = list(
+            execute_plugins([FailingPlugin, FastPlugin], context, jobs=jobs, policy=ExecutionPolicy.FailFast)
+        )
+        assert [result.status for result in results] == [PluginResultStatus.Failed]
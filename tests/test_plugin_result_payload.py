@@ -0,0 +1,62 @@
+import json
+import pickle
+
+from pathlib import Path
+
+import pytest
+
+from dgis.hooks.plugins.plugin import PluginResultPayload
+
+
+def test_payload_decodes_outputs_on_access():
+    output = b"--- a.py\n+++ a.py\n-x=1\n+x = 1\n\xff"
+    payload = PluginResultPayload(stdout=output, stderr=b"", diff=output, file=Path("a.py"))
+    assert payload.stdout == payload.diff == output.decode(errors="replace")
+    assert payload.stderr == ""
+    assert PluginResultPayload(stdout="error").stdout == "error"
+    assert PluginResultPayload().stdout is None and PluginResultPayload().file is None
+
+    # An output passed as several fields is kept, and pickled, once.
+    copy = pickle.loads(pickle.dumps(payload))
+    assert copy == payload
+    assert len(pickle.dumps(payload)) < 2 * len(output) + 200
+
+
+def test_payload_size_cap(monkeypatch):
+    monkeypatch.setenv("DGIS_HOOKS_MAX_OUTPUT_SIZE", "10")
+    payload = PluginResultPayload(stdout="x" * 25, stderr="short")
+    assert payload.stdout == "x" * 10 + "\n[... 15 more bytes truncated]"
+    assert payload.stderr == "short"
+
+    monkeypatch.setenv("DGIS_HOOKS_MAX_OUTPUT_SIZE", "0")
+    assert PluginResultPayload(stdout="x" * 25).stdout == "x" * 25
+
+
+def test_payload_json_round_trip(monkeypatch):
+    output = b"--- a.py\n+++ a.py\n-x=1\n+x = 1\n"
+    payload = PluginResultPayload(stdout=output, stderr=b"", diff=output, file=Path("a.py"))
+    data = payload.to_json()
+    assert data["diff"] is None and data["diff_is_stdout"]
+    assert json.loads(json.dumps(data)) == data
+    copy = PluginResultPayload.from_json(data)
+    assert copy == payload and copy.diff == output.decode() and copy.file == Path("a.py")
+
+    payload = PluginResultPayload(stdout=ValueError("bad"), stderr=None, diff=None)
+    assert PluginResultPayload.from_json(payload.to_json()) == PluginResultPayload(stdout="bad")
+
+
+def test_payload_json_round_trip_keeps_truncated_outputs(monkeypatch):
+    monkeypatch.setenv("DGIS_HOOKS_MAX_OUTPUT_SIZE", "10")
+    capped = PluginResultPayload(stdout="x" * 25, stderr="short", diff="y" * 10)
+    copy = PluginResultPayload.from_json(json.loads(json.dumps(capped.to_json())))
+    assert copy == capped
+    assert copy.stdout == "x" * 10 + "\n[... 15 more bytes truncated]"
+    assert copy.stderr == "short" and copy.diff == "y" * 10
+
+
+@pytest.mark.parametrize(
+    "data", [None, [], {"stdout": 1}, {"file": ["a.py"]}, {"diff_is_stdout": "yes"}, {"stderr": {"__class__": "x"}}]
+)
+def test_payload_from_json_rejects_invalid_data(data):
+    with pytest.raises(ValueError):
+        PluginResultPayload.from_json(data)
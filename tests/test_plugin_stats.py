@@ -0,0 +1,145 @@
+import subprocess
+import sys
+
+from pathlib import Path
+
+import pytest
+
+from dgis.hooks.plugins.discover import PluginEntry
+from dgis.hooks.plugins.executor import PluginEstimate, estimate_plugins, format_plan, order_plugins
+from dgis.hooks.plugins.packaged.branch_check import BranchCheckPlugin
+from dgis.hooks.plugins.packaged.json_check import JsonCheckPlugin
+from dgis.hooks.plugins.packaged.xml_check import XmlCheckPlugin
+from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResultStatus, run_plugin
+from dgis.hooks.pre_receive.entry_point import run_checks
+from dgis.hooks.utility.git import GitRef, PushCommits
+from dgis.hooks.utility.plugin_stats import PluginCost, PluginStats
+
+from tests.utility import make_test_repo, make_and_commit_test_file
+
+
+class CheapPlugin(Plugin):
+    pass
+
+
+class ExpensivePlugin(Plugin):
+    pass
+
+
+class NewPlugin(Plugin):
+    pass
+
+
+def test_plugin_cost_fit():
+    runs = [(0.01 * files + 1e-6 * size, files, size, False) for files, size in ((1, 1000), (10, 500), (5, 100000))]
+    cost = PluginCost.fit(runs + [(1.0, 10, 10000, True)])
+    assert cost.runs == 4 and cost.failures == 1 and cost.failure_rate == pytest.approx(2 / 6)
+    assert cost.estimate(20, 0) > cost.estimate(2, 0) > 0
+
+    cost = PluginCost.fit(runs)
+    assert cost.per_file == pytest.approx(0.01) and cost.per_byte == pytest.approx(1e-6)
+    # A single run can not tell files from bytes, and plugins checking the whole change cost the same every run.
+    assert PluginCost.fit([(2.0, 4, 100, False)]).estimate(8, 0) == pytest.approx(4.0)
+    assert PluginCost.fit([(0.1, 0, 0, False), (0.3, 0, 0, True)]).estimate(10, 10) == pytest.approx(0.2)
+
+
+def test_plugin_stats_keep_recent_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(PluginStats, "_history", 3)
+    with PluginStats(tmp_path / "stats.sqlite3") as stats:
+        for seconds in (10.0, 10.0, 1.0, 1.0, 1.0):
+            stats.record("JsonCheckPlugin", seconds, 1, 100, False)
+        stats.record("BranchCheckPlugin", 0.01, 0, 0, True)
+    with PluginStats(tmp_path / "stats.sqlite3") as stats:
+        costs = stats.costs()
+    assert costs["JsonCheckPlugin"].runs == 3 and costs["JsonCheckPlugin"].estimate(2, 200) == pytest.approx(2.0)
+    assert costs["BranchCheckPlugin"].failures == 1
+
+
+def test_run_plugin_records_workload(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    (git_repo_path / "a.json").write_text('{"key": "value"}')
+    (git_repo_path / "b.json").write_text("{")
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "json files")
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "123")
+
+    with PluginStats(tmp_path / "stats.sqlite3") as stats:
+        context = PluginContext(ref, git_repo_path, git_repo, stats=stats)
+        assert run_plugin(JsonCheckPlugin, context).status == PluginResultStatus.Failed
+        costs = stats.costs()
+        estimates = estimate_plugins([XmlCheckPlugin, JsonCheckPlugin], context, costs)
+        # Without history workloads are not needed to order plugins, only to show a plan.
+        assert estimate_plugins([JsonCheckPlugin], context, {}) == {JsonCheckPlugin: PluginEstimate(0, 0, None)}
+        assert estimate_plugins([JsonCheckPlugin], context, {}, workloads=True)[JsonCheckPlugin].files == 2
+
+    assert costs["JsonCheckPlugin"].runs == 1 and costs["JsonCheckPlugin"].failures == 1
+    assert estimates[JsonCheckPlugin].files == 2 and estimates[JsonCheckPlugin].size == 17
+    assert estimates[XmlCheckPlugin] == PluginEstimate(0, 0, None)
+
+
+def test_order_plugins_by_cost():
+    cheap = PluginCost(runs=10, failures=5, per_run=0.1, per_file=0.0, per_byte=0.0)
+    expensive = PluginCost(runs=10, failures=5, per_run=60.0, per_file=0.0, per_byte=0.0)
+    estimates = {
+        ExpensivePlugin: PluginEstimate(0, 0, expensive),
+        CheapPlugin: PluginEstimate(0, 0, cheap),
+        NewPlugin: PluginEstimate(0, 0, None),
+        BranchCheckPlugin: PluginEstimate(0, 0, expensive),
+    }
+    plugins = [NewPlugin, ExpensivePlugin, CheapPlugin, BranchCheckPlugin]
+
+    # Priorities come first, plugins without runs go last within their priority.
+    ordered = order_plugins(plugins, estimates)
+    assert ordered == [BranchCheckPlugin, CheapPlugin, ExpensivePlugin, NewPlugin]
+    assert order_plugins(plugins) == [BranchCheckPlugin, NewPlugin, ExpensivePlugin, CheapPlugin]
+
+    plan = format_plan(ordered, estimates).splitlines()
+    assert plan[1] == "2. CheapPlugin: priority 0, 0 file(s), 0 bytes, estimated 0.10 s, fails 50% of 10 run(s)"
+    assert plan[3] == "4. NewPlugin: priority 0, 0 file(s), 0 bytes, no recorded runs"
+    assert plan[-1] == "Estimated total: 120.10 s of plugin time"
+
+
+def test_plan_does_not_run_checks(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    make_and_commit_test_file(git_repo, Path("invalid.json"), '{"key": "value"')
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "refs/heads/master")
+    entries = [
+        PluginEntry(
+            "JsonCheckPlugin",
+            "dgis.hooks.plugins.packaged.json_check:JsonCheckPlugin",
+            JsonCheckPlugin.file_subscription(),
+            None,
+            0,
+        )
+    ]
+
+    with PluginStats(tmp_path / "stats.sqlite3") as stats:
+        # The plan is logged without running plugins, so the invalid file does not fail it.
+        failed, deferred = run_checks(
+            str(git_repo_path), git_repo, [ref], PushCommits({}), entries, stats=stats, plan=True
+        )
+        assert not failed and not deferred and stats.costs() == {}
+        failed, _ = run_checks(str(git_repo_path), git_repo, [ref], PushCommits({}), entries, stats=stats)
+        assert failed and stats.costs()["JsonCheckPlugin"].runs == 1
+
+
+def test_plan_rejects_push(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    make_and_commit_test_file(git_repo, Path("valid.json"), '{"key": "value"}')
+    old_rev, new_rev = git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha
+
+    hook = subprocess.run(
+        [sys.executable, "-m", "dgis.hooks.pre_receive.entry_point", "--plan", "--cache-dir", str(tmp_path / "cache")],
+        input=f"{old_rev} {new_rev} refs/heads/master\n",
+        capture_output=True,
+        text=True,
+        cwd=git_repo_path,
+    )
+    assert hook.returncode != 0
+    assert "Plan of 'refs/heads/master'" in hook.stderr + hook.stdout
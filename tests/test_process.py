@@ -0,0 +1,128 @@
+import sys
+import time
+
+from pathlib import Path
+
+import pytest
+
+from dgis.hooks.plugins.plugin import Plugin, PluginContext, PluginResult, PluginResultStatus, run_plugin
+from dgis.hooks.utility.git import GitRef
+from dgis.hooks.utility.process import Cancelled, ProcessGroup, ProcessLimits, TimedOut
+
+from tests.utility import make_test_repo, make_and_commit_test_file
+
+_g_spawn_child = """
+import subprocess, sys, time
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+print(child.pid, flush=True)
+time.sleep(60)
+"""
+
+
+def _is_gone(pid):
+    try:
+        state = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        return True
+    return state in ("Z", "X")
+
+
+class LoopingPlugin(Plugin):
+    _timeout = 0.3
+
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        while True:
+            context.processes.check()
+            time.sleep(0.01)
+
+
+class SleepingPlugin(Plugin):
+    _timeout = 0.3
+
+    @classmethod
+    def execute(cls, context: PluginContext) -> PluginResult:
+        context.processes.run([sys.executable, "-c", "import time; time.sleep(30)"])
+        return PluginResult(PluginResultStatus.Ok, None)
+
+
+@pytest.mark.skipif(not Path("/proc/self/stat").exists(), reason="requires procfs")
+def test_timeout_kills_process_tree(tmp_path):
+    processes = ProcessGroup()
+    output = tmp_path / "pid.txt"
+    start = time.monotonic()
+    with pytest.raises(TimedOut), open(output, "w") as stdout:
+        processes.run([sys.executable, "-c", _g_spawn_child], stdout=stdout, limits=ProcessLimits(timeout=2.0))
+    assert time.monotonic() - start < 10
+
+    child_pid = int(output.read_text())
+    for _ in range(100):
+        if _is_gone(child_pid):
+            break
+        time.sleep(0.05)
+    assert _is_gone(child_pid)
+
+
+_g_print_limits = """
+import resource
+print(resource.getrlimit(resource.RLIMIT_CPU), resource.getrlimit(resource.RLIMIT_AS))
+"""
+
+
+def test_cpu_time_limit():
+    processes = ProcessGroup()
+    with pytest.raises(TimedOut, match="CPU time"):
+        processes.run([sys.executable, "-c", "while True: pass"], limits=ProcessLimits(timeout=30, cpu_time=1))
+
+    completed = processes.run([sys.executable, "-c", "print(1)"], capture_output=True, limits=ProcessLimits(cpu_time=1))
+    assert completed.returncode == 0 and completed.stdout == b"1\n"
+
+    # Limits are set in the child before the command is executed, so it starts within them.
+    completed = processes.run(
+        [sys.executable, "-c", _g_print_limits],
+        capture_output=True,
+        limits=ProcessLimits(cpu_time=5, address_space=1 << 32),
+    )
+    assert completed.stdout.decode().split() == ["(5,", "6)", f"({1 << 32},", f"{1 << 32})"]
+
+    # Like unlimited processes, a missing program fails to start.
+    with pytest.raises(FileNotFoundError):
+        processes.run(["missing-tool-of-test", "--version"], limits=ProcessLimits(cpu_time=5))
+
+    process = processes.popen([sys.executable, "-c", "import time; time.sleep(30)"], ProcessLimits(cpu_time=5))
+    processes.cancel()
+    process.wait()
+    processes.release(process)
+    with pytest.raises(Cancelled):
+        processes.popen([sys.executable, "-c", "print(1)"])
+
+
+def test_memory_limit():
+    processes = ProcessGroup()
+    completed = processes.run(
+        [sys.executable, "-c", "x = bytearray(1 << 30)"],
+        capture_output=True,
+        limits=ProcessLimits(address_space=1 << 29),
+    )
+    assert completed.returncode != 0 and b"MemoryError" in completed.stderr
+
+
+def test_plugin_timeout(tmp_path, monkeypatch):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    make_and_commit_test_file(git_repo, Path("test2.txt"))
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "123")
+    context = PluginContext(ref, git_repo_path, git_repo)
+
+    for plugin in (LoopingPlugin, SleepingPlugin):
+        start = time.monotonic()
+        result = run_plugin(plugin, context)
+        assert result.status == PluginResultStatus.TimedOut and result.status.failed
+        assert time.monotonic() - start < 5
+
+    # Limits are configurable per plugin, non-positive values disable them.
+    monkeypatch.setenv("DGIS_HOOKS_TIMEOUT_SLEEPINGPLUGIN", "0")
+    monkeypatch.setenv("DGIS_HOOKS_SUBPROCESS_CPU_TIME", "5")
+    assert SleepingPlugin.timeout() is None and LoopingPlugin.timeout() == 0.3
+    assert SleepingPlugin.process_limits() == ProcessLimits(cpu_time=5)
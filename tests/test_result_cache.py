@@ -0,0 +1,90 @@
+import pickle
+import time
+
+from pathlib import Path
+
+from dgis.hooks.plugins.packaged.json_check import JsonCheckPlugin
+from dgis.hooks.plugins.plugin import PluginContext, PluginResultPayload, PluginResultStatus, run_plugin
+from dgis.hooks.utility.git import GitRef
+from dgis.hooks.utility.result_cache import ResultCache
+
+from tests.utility import make_test_repo, make_and_commit_test_file
+
+
+def test_result_cache_round_trip(tmp_path):
+    payload = PluginResultPayload(stdout="error", stderr=None, diff=None, file=Path("a.json"))
+    with ResultCache(tmp_path / "results.sqlite3", "1.0") as results:
+        key = results.key("plugin", "a.json", "1" * 40)
+        assert key != results.key("plugin", "a.json", "2" * 40)
+        assert key != ResultCache(tmp_path / "other.sqlite3", "2.0").key("plugin", "a.json", "1" * 40)
+
+        results.put_many({key: payload.to_json(), results.key("passed"): None, results.key("object"): payload})
+        # A copy (e.g. in a file task process) opens its own connection to the same database.
+        copy = pickle.loads(pickle.dumps(results))
+        # Results which are not JSON data are not cached.
+        assert copy.get_many([key, results.key("passed"), results.key("object"), results.key("missing")]) == {
+            key: payload.to_json(),
+            results.key("passed"): None,
+        }
+        copy.close()
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    results = ResultCache(tmp_path / "results.sqlite3", max_size=2500)
+    for name in ("first", "second", "third"):
+        results.put_many({name: "x" * 1000})
+        time.sleep(0.01)
+    # Reading marks the result as used, so the second one is the least recently used.
+    assert results.get_many(["first"]) == {"first": "x" * 1000}
+    results.close()
+
+    results = ResultCache(tmp_path / "results.sqlite3", max_size=2500)
+    assert set(results.get_many(["first", "second", "third"])) == {"first", "third"}
+    results.close()
+
+
+def test_result_cache_never_unpickles(tmp_path):
+    class Exploit:
+        def __reduce__(self):
+            return (Path.touch, (tmp_path / "executed",))
+
+    with ResultCache(tmp_path / "results.sqlite3") as results:
+        results.put_many({"valid": "value"})
+        connection = results._ensure_connection()
+        connection.execute("INSERT INTO results VALUES (?, ?, ?, ?)", ("pickled", pickle.dumps(Exploit()), 1, 0.0))
+        assert results.get_many(["pickled", "valid"]) == {"valid": "value"}
+    assert not (tmp_path / "executed").exists()
+
+
+def test_file_check_reuses_cached_results(tmp_path, monkeypatch):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = make_test_repo(git_repo_path)
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    (git_repo_path / "valid.json").write_text('{"key": "value"}')
+    (git_repo_path / "invalid.json").write_text('{"key": "value"')
+    git_repo.git.add(".")
+    git_repo.git.commit("-m", "json files")
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, "123")
+
+    with ResultCache(tmp_path / "results.sqlite3") as results:
+        expected = run_plugin(JsonCheckPlugin, PluginContext(ref, git_repo_path, git_repo, results=results))
+        assert expected.status == PluginResultStatus.Failed
+
+        def fail_check_file(*args):
+            raise AssertionError("checked again")
+
+        monkeypatch.setattr(JsonCheckPlugin, "check_file", fail_check_file)
+        result = run_plugin(JsonCheckPlugin, PluginContext(ref, git_repo_path, git_repo, results=results))
+
+    assert result.status == PluginResultStatus.Failed
+    assert [(str(payload.file), str(payload.stdout)) for payload in result.payloads] == [
+        (str(payload.file), str(payload.stdout)) for payload in expected.payloads
+    ]
+
+
+def test_file_check_skips_invalid_cached_results(tmp_path):
+    with ResultCache(tmp_path / "results.sqlite3") as results:
+        results.put_many({"invalid": {"stdout": 1}, "list": [], "passed": None, "failed": {"stdout": "error"}})
+        context = PluginContext(GitRef("0" * 40, "1" * 40, "123"), tmp_path, None, results=results)
+        cached = JsonCheckPlugin.cached_results(context, ["invalid", "list", "passed", "failed", None])
+    assert cached == {"passed": None, "failed": PluginResultPayload(stdout="error")}
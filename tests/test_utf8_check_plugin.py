@@ -35,3 +35,59 @@ def test_valid_file(tmp_path, file_content):
 
     with execute_plugin(UTF8CheckPlugin, context) as result:
         assert result.status == PluginResultStatus.Ok
+
+
+def test_invalid_file(tmp_path):
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    tmp_file_path = git_repo_path / "unimportant.txt"
+    tmp_file_path.touch()
+    git_repo.git.add(tmp_file_path)
+    git_repo.git.commit("-m", f"commit {str(tmp_file_path)}")
+
+    tmp_file_path = git_repo_path / "latin1.txt"
+    tmp_file_path.write_bytes("caf\u00e9".encode("latin-1"))
+    git_repo.git.add(tmp_file_path)
+    git_repo.git.commit("-m", f"commit {str(tmp_file_path)}")
+
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, git_repo.head.ref.name)
+    context = PluginContext(ref, git_repo_path, git_repo, None)
+
+    with execute_plugin(UTF8CheckPlugin, context) as result:
+        assert result.status == PluginResultStatus.Failed
+        assert isinstance(result.payloads[0].stdout, UnicodeDecodeError)
+
+
+@pytest.mark.parametrize("file_content", _g_strings)
+def test_valid_streamed_file(tmp_path, monkeypatch, file_content):
+    monkeypatch.setenv("DGIS_HOOKS_MAX_BLOB_SIZE_UTF8CHECKPLUGIN", "8")
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    tmp_file_path = git_repo_path / "unimportant.txt"
+    tmp_file_path.touch()
+    git_repo.git.add(tmp_file_path)
+    git_repo.git.commit("-m", f"commit {str(tmp_file_path)}")
+
+    tmp_file_path = git_repo_path / "utf8.txt"
+    tmp_file_path.write_bytes(file_content.encode("utf-8") + "é".encode("latin-1") * bool(file_content))
+    git_repo.git.add(tmp_file_path)
+    git_repo.git.commit("-m", f"commit {str(tmp_file_path)}")
+
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, git_repo.head.ref.name)
+    context = PluginContext(ref, git_repo_path, git_repo, None)
+
+    with execute_plugin(UTF8CheckPlugin, context) as result:
+        assert result.status == (PluginResultStatus.Failed if file_content else PluginResultStatus.Ok)
+
+
+def test_decode_stream_split_characters():
+    content = "utf emoji list 😀😅🤣🙃😇".encode("utf-8")
+    UTF8CheckPlugin._decode_stream(content[i : i + 3] for i in range(0, len(content), 3))
+
+    with pytest.raises(UnicodeDecodeError, match="at byte 15"):
+        UTF8CheckPlugin._decode_stream([content[:14], content[14:15] + b"\xff", content[16:]])
+    # The error starts in the incomplete character kept by the decoder from the previous chunk.
+    with pytest.raises(UnicodeDecodeError, match="at byte 15"):
+        UTF8CheckPlugin._decode_stream([content[:16], b"\xff"])
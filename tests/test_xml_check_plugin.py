@@ -205,3 +205,20 @@ def test_invalid_xml_force_updated_file(tmp_path, xml_content):
 
     with execute_plugin(XmlCheckPlugin, context) as result:
         assert result.status == PluginResultStatus.Failed
+
+
+@pytest.mark.parametrize("xml_content", _g_valid_xml + _g_invalid_xml)
+def test_streamed_xml_file(tmp_path, monkeypatch, xml_content):
+    monkeypatch.setenv("DGIS_HOOKS_MAX_BLOB_SIZE_XMLCHECKPLUGIN", "1")
+    git_repo_path = tmp_path / "tmp-rep"
+    git_repo = Repo.init(git_repo_path)
+
+    make_and_commit_test_file(git_repo, Path("test.txt"))
+    make_and_commit_test_file(git_repo, Path("test.xml"), xml_content)
+
+    ref = GitRef(git_repo.commit("HEAD~1").hexsha, git_repo.commit("HEAD").hexsha, git_repo.head.ref.name)
+    context = PluginContext(ref, git_repo_path, git_repo, None)
+
+    expected = PluginResultStatus.Ok if xml_content in _g_valid_xml else PluginResultStatus.Failed
+    with execute_plugin(XmlCheckPlugin, context) as result:
+        assert result.status == expected